@@ -1,9 +1,10 @@
 import os
+import click
 from flask import Flask, request, session, redirect, flash, send_from_directory
-from flask_login import LoginManager, current_user
+from flask_login import LoginManager
 from pathlib import Path
-from datetime import datetime, timezone
 from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 
 ROOT_DIR = Path(__file__).resolve().parent
 BASE_DIR = ROOT_DIR.parent
@@ -20,6 +21,8 @@ def create_app():
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-key")
+    # Enables /api/metrics for requests sending "Authorization: Bearer <token>".
+    app.config["METRICS_TOKEN"] = (os.environ.get("METRICS_TOKEN") or "").strip()
 
     upload_folder = os.environ.get("UPLOAD_FOLDER") or str(
         BASE_DIR / "static" / "uploads"
@@ -34,34 +37,139 @@ def create_app():
     except Exception:
         pass
 
+    from backend.image_variants import variant_response, variant_width, vary_on_width
+    from backend.uploads import IMMUTABLE_MAX_AGE_SECONDS, store_digest
+
+    def _send_upload(filename: str):
+        width = variant_width(request.args.get("w"), request.headers.get("Accept"))
+        source = safe_join(app.config["UPLOAD_FOLDER"], filename)
+        digest = store_digest(filename)
+        out = None
+        if width is not None and source and os.path.isfile(source):
+            st = os.stat(source)
+            out = variant_response(
+                Path(source), f"upload:{filename}:{st.st_mtime_ns}:{st.st_size}", width
+            )
+        if out is None:
+            out = send_from_directory(
+                app.config["UPLOAD_FOLDER"],
+                filename,
+                etag=digest or True,
+                max_age=IMMUTABLE_MAX_AGE_SECONDS if digest else None,
+            )
+        if digest:
+            # Store files are named by their content and never change.
+            out.cache_control.public = True
+            out.cache_control.max_age = IMMUTABLE_MAX_AGE_SECONDS
+            out.cache_control.immutable = True
+        return vary_on_width(out)
+
     @app.route(f"{app.config['UPLOAD_URL_PREFIX']}/<path:filename>")
     def uploaded_file(filename: str):
-        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+        return _send_upload(filename)
 
     @app.route("/static/uploads/<path:filename>")
     def uploaded_file_old(filename: str):
-        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+        return _send_upload(filename)
 
     # Initialize database
-    from backend._db_setup import init_db
+    from backend._db_setup import init_db, get_db_pragma_report
 
     init_db()
 
+    for pragma in get_db_pragma_report():
+        if pragma["ok"]:
+            continue
+        app.logger.warning(
+            "SQLite PRAGMA %s is %r (configured %r)",
+            pragma["name"],
+            pragma["actual"],
+            pragma["expected"],
+        )
+
+    from backend.artwork import artwork_queue
+    from backend.autocomplete import autocomplete_index
+    from backend.image_cache import image_cache
+
+    image_cache.configure(Path(upload_folder) / "image-cache")
+
+    autocomplete_index.start()
+
+    @app.cli.command("rebuild-feed-timelines")
+    @click.option("--user-id", type=int, default=None, help="Only this reader.")
+    def rebuild_feed_timelines_command(user_id):
+        """Refill home feed timelines from activity, bulletins and follows."""
+        from backend._db_setup import rebuild_feed_timelines
+
+        rebuild_feed_timelines(user_id)
+        click.echo("Feed timelines rebuilt.")
+
+    @app.cli.command("audit-query-plans")
+    @click.option("--user-id", type=int, default=None, help="Crawl as this user.")
+    def audit_query_plans_command(user_id):
+        """Fail if any query the pages run full-scans a table."""
+        from backend.query_audit import audit_query_plans
+
+        report = audit_query_plans(app, user_id)
+        for finding in report["findings"]:
+            click.echo(f"SCAN {', '.join(finding['tables'])}: {finding['sql']}")
+        click.echo(
+            f"{len(report['urls'])} pages, {report['statements']} query shapes, "
+            f"{len(report['findings'])} full scans."
+        )
+        if report["findings"]:
+            raise SystemExit(1)
+
+    @app.cli.command("retry-artwork-jobs")
+    def retry_artwork_jobs_command():
+        """Send dead-lettered artwork jobs back to the queue."""
+        from backend.database import requeue_dead_artwork_jobs
+
+        click.echo(f"{requeue_dead_artwork_jobs()} artwork jobs requeued.")
+
+    @app.cli.command("gc-uploads")
+    @click.option("--dry-run", is_flag=True, help="Only report what would go.")
+    @click.option(
+        "--grace-hours",
+        type=float,
+        default=24.0,
+        show_default=True,
+        help="Keep files newer than this.",
+    )
+    def gc_uploads_command(dry_run, grace_hours):
+        """Delete uploaded images no profile or rating refers to."""
+        from backend.database import get_referenced_image_urls
+        from backend.uploads import collect_garbage, upload_path_from_url
+
+        prefix = app.config["UPLOAD_URL_PREFIX"]
+        referenced = {
+            upload_path_from_url(url, prefix) for url in get_referenced_image_urls()
+        }
+        report = collect_garbage(
+            app.config["UPLOAD_FOLDER"],
+            referenced,
+            grace_seconds=max(0.0, grace_hours) * 3600,
+            dry_run=dry_run,
+        )
+        click.echo(
+            f"{report['scanned']} uploads, {report['kept']} kept, "
+            f"{report['deleted']} {'would be ' if dry_run else ''}deleted "
+            f"({report['bytes']} bytes)."
+        )
+
     # Register routes with blueprint
     from backend.routes import app as routes_bp
 
     app.register_blueprint(routes_bp)
 
+    # Picks up jobs left pending by a restart. Started only now that importing
+    # routes has registered the resolver.
+    artwork_queue.start()
+
     # User model import
-    from backend.database import (
-        get_user_by_id,
-        get_alerts_for_user,
-        get_unread_alert_count,
-        get_bulletin_feed_for_user,
-        count_bulletin_feed_for_user,
-        get_activity_feed_for_user,
-        count_activity_feed_for_user,
-    )
+    from backend.database import get_user_by_id
+    from backend.events import SSE_MAX_STREAMS
+    from backend.sidebar import SIDEBAR_POLL_SECONDS, get_sidebar_state
 
     # Flask-Login setup
     login_manager = LoginManager()
@@ -87,234 +195,11 @@ def create_app():
         }
 
     @app.context_processor
-    def inject_alerts_sidebar_state():
-        if not current_user.is_authenticated:
-            return {"alerts": [], "unread_alert_count": 0}
-
-        alerts = get_alerts_for_user(current_user.id, limit=5, include_read=True)
-
-        def _format_time_ago(iso_timestamp: str) -> str:
-            if not iso_timestamp:
-                return "just now"
-            try:
-                parsed = datetime.fromisoformat(iso_timestamp)
-            except ValueError:
-                return "just now"
-            if parsed.tzinfo is None:
-                parsed = parsed.replace(tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
-            delta = now - parsed
-            seconds = max(0, int(delta.total_seconds()))
-            if seconds < 60:
-                return "just now"
-            minutes = seconds // 60
-            if minutes < 60:
-                return f"{minutes} min"
-            hours = minutes // 60
-            if hours < 24:
-                unit = "hr" if hours == 1 else "hrs"
-                return f"{hours} {unit}"
-            days = hours // 24
-            if days < 7:
-                unit = "day" if days == 1 else "days"
-                return f"{days} {unit}"
-            weeks = days // 7
-            if weeks < 5:
-                unit = "wk" if weeks == 1 else "wks"
-                return f"{weeks} {unit}"
-            months = days // 30
-            if months < 12:
-                unit = "mo" if months == 1 else "mos"
-                return f"{months} {unit}"
-            years = days // 365
-            unit = "yr" if years == 1 else "yrs"
-            return f"{years} {unit}"
-
-        for a in alerts:
-            a["time_ago"] = _format_time_ago(a.get("created_at") or "")
-        unread_alert_count = get_unread_alert_count(current_user.id)
-        return {"alerts": alerts, "unread_alert_count": unread_alert_count}
-
-    @app.context_processor
-    def inject_bulletin_sidebar_state():
-        if not current_user.is_authenticated:
-            return {"bulletins": [], "bulletin_count": 0}
-
-        items = get_bulletin_feed_for_user(current_user.id, limit=5)
-        bulletin_count = count_bulletin_feed_for_user(current_user.id)
-
-        def _format_time_ago(iso_timestamp: str) -> str:
-            if not iso_timestamp:
-                return "just now"
-            try:
-                parsed = datetime.fromisoformat(iso_timestamp)
-            except ValueError:
-                return "just now"
-            if parsed.tzinfo is None:
-                parsed = parsed.replace(tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
-            delta = now - parsed
-            seconds = max(0, int(delta.total_seconds()))
-            if seconds < 60:
-                return "just now"
-            minutes = seconds // 60
-            if minutes < 60:
-                return f"{minutes} min"
-            hours = minutes // 60
-            if hours < 24:
-                unit = "hr" if hours == 1 else "hrs"
-                return f"{hours} {unit}"
-            days = hours // 24
-            if days < 7:
-                unit = "day" if days == 1 else "days"
-                return f"{days} {unit}"
-            weeks = days // 7
-            if weeks < 5:
-                unit = "wk" if weeks == 1 else "wks"
-                return f"{weeks} {unit}"
-            months = days // 30
-            if months < 12:
-                unit = "mo" if months == 1 else "mos"
-                return f"{months} {unit}"
-            years = days // 365
-            unit = "yr" if years == 1 else "yrs"
-            return f"{years} {unit}"
-
-        for p in items:
-            p["time_ago"] = _format_time_ago(p.get("created_at") or "")
-
-        return {"bulletins": items, "bulletin_count": bulletin_count}
-
-    @app.context_processor
-    def inject_activity_sidebar_state():
-        if not current_user.is_authenticated:
-            return {"activities": [], "activity_count": 0}
-
-        raw_items = get_activity_feed_for_user(current_user.id, limit=5)
-        activity_count = count_activity_feed_for_user(current_user.id)
-
-        def _format(item: dict) -> dict:
-            actor = item.get("actor_username") or ""
-            action = item.get("action") or ""
-            entity_label = item.get("entity_label") or ""
-            url = item.get("url") or ""
-            metadata = item.get("metadata") or {}
-
-            if action == "follow":
-                text = f"@{actor} followed {entity_label or 'a user'}"
-            elif action == "unfollow":
-                text = f"@{actor} unfollowed {entity_label or 'a user'}"
-            elif action == "rating_create":
-                text = (
-                    f"@{actor} created a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} created a rating"
-                )
-            elif action == "rating_edit":
-                text = (
-                    f"@{actor} edited a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} edited a rating"
-                )
-            elif action == "rating_delete":
-                text = (
-                    f"@{actor} deleted a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} deleted a rating"
-                )
-            elif action == "rating_view":
-                text = (
-                    f"@{actor} viewed a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} viewed a rating"
-                )
-            elif action == "rating_like":
-                text = (
-                    f"@{actor} liked a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} liked a rating"
-                )
-            elif action == "rating_unlike":
-                text = (
-                    f"@{actor} unliked a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} unliked a rating"
-                )
-            elif action == "rating_reaction":
-                text = (
-                    f"@{actor} reacted to a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} reacted to a rating"
-                )
-            elif action == "rating_category_upvote":
-                detail = (metadata.get("detail") or "").strip() or "a category"
-                text = (
-                    f"@{actor} upvoted {detail} on a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} upvoted {detail} on a rating"
-                )
-            elif action == "rating_category_downvote":
-                detail = (metadata.get("detail") or "").strip() or "a category"
-                text = (
-                    f"@{actor} downvoted {detail} on a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} downvoted {detail} on a rating"
-                )
-            elif action == "rating_category_unvote":
-                detail = (metadata.get("detail") or "").strip() or "a category"
-                text = (
-                    f"@{actor} removed their vote on {detail} for a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} removed their vote on {detail} for a rating"
-                )
-            elif action == "rating_comment_add":
-                text = (
-                    f"@{actor} commented on a rating: {entity_label}"
-                    if entity_label
-                    else f"@{actor} commented on a rating"
-                )
-            elif action == "rating_comment_edit":
-                text = (
-                    f"@{actor} edited a rating comment: {entity_label}"
-                    if entity_label
-                    else f"@{actor} edited a rating comment"
-                )
-            elif action == "rating_comment_delete":
-                text = (
-                    f"@{actor} deleted a rating comment: {entity_label}"
-                    if entity_label
-                    else f"@{actor} deleted a rating comment"
-                )
-            elif action == "playlist_favorite":
-                text = (
-                    f"@{actor} favorited a playlist: {entity_label}"
-                    if entity_label
-                    else f"@{actor} favorited a playlist"
-                )
-            elif action == "playlist_unfavorite":
-                text = (
-                    f"@{actor} unfavorited a playlist: {entity_label}"
-                    if entity_label
-                    else f"@{actor} unfavorited a playlist"
-                )
-            elif action == "bulletin_post":
-                text = f"@{actor} posted to the bulletin"
-            elif action == "profile_comment_add":
-                text = f"@{actor} commented on {entity_label or 'a profile'}"
-            elif action == "profile_comment_edit":
-                text = f"@{actor} edited a comment on {entity_label or 'a profile'}"
-            elif action == "profile_comment_delete":
-                text = f"@{actor} deleted a comment on {entity_label or 'a profile'}"
-            elif action == "profile_update":
-                text = f"@{actor} updated their profile"
-            else:
-                text = f"@{actor}: {action} {entity_label}".strip()
-
-            return {"text": text, "url": url, "action": action}
-
+    def inject_sidebar_state():
         return {
-            "activities": [_format(i) for i in raw_items],
-            "activity_count": activity_count,
+            **get_sidebar_state(),
+            "sidebar_poll_seconds": SIDEBAR_POLL_SECONDS,
+            "sidebar_stream": SSE_MAX_STREAMS > 0,
         }
 
     @login_manager.user_loader
@@ -1,6 +1,12 @@
+import hashlib
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from backend.settings import env_choice, env_int
 
 # Configuration
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -16,23 +22,998 @@ except Exception:
     pass
 
 
+# Connection pool
+#
+# Every query function opens a connection, runs a statement or two and closes
+# it again. Instead of paying sqlite3.connect() + PRAGMA setup each time, each
+# thread keeps a small stack of warm connections. get_db_connection() borrows
+# one and close() hands it back (rolling back anything left uncommitted).
+# Connections never cross threads, so sqlite3's same-thread check still holds.
+
+_POOL_LOCAL = threading.local()
+
+
+# Idle connections kept per thread. One is enough for flat call paths; the
+# spare covers helpers that open a second connection while the first is open.
+_POOL_MAX_IDLE = env_int("DB_POOL_MAX_IDLE", 2, 0, 16)
+
+
+# PRAGMA profile
+#
+# journal_mode is persistent in the database file and is set once by init_db.
+# The rest are per-connection and applied whenever the pool opens one.
+# WAL lets readers keep going while add_activity & co. write, and
+# synchronous=NORMAL is the usual durability trade-off that goes with it.
+DB_PRAGMAS: dict[str, Any] = {
+    "journal_mode": env_choice(
+        "SQLITE_JOURNAL_MODE",
+        "WAL",
+        {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"},
+    ),
+    "synchronous": env_choice(
+        "SQLITE_SYNCHRONOUS", "NORMAL", {"OFF", "NORMAL", "FULL", "EXTRA"}
+    ),
+    "busy_timeout": env_int("SQLITE_BUSY_TIMEOUT_MS", 5000, 0, 120000),
+    # Negative values are KiB, so the default is a 16 MB page cache.
+    "cache_size": env_int("SQLITE_CACHE_SIZE", -16000, -1048576, 1048576),
+    "mmap_size": env_int("SQLITE_MMAP_SIZE", 64 * 1024 * 1024, 0, 2**31),
+    "temp_store": env_choice(
+        "SQLITE_TEMP_STORE", "MEMORY", {"DEFAULT", "FILE", "MEMORY"}
+    ),
+}
+
+_CONNECTION_PRAGMAS = (
+    "busy_timeout",
+    "synchronous",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+)
+
+# How PRAGMA reads report the enum-valued settings.
+_PRAGMA_READBACK = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+}
+
+
+def _configure_connection(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    for name in _CONNECTION_PRAGMAS:
+        cur.execute(f"PRAGMA {name} = {DB_PRAGMAS[name]}")
+    cur.close()
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=DB_PRAGMAS["busy_timeout"] / 1000.0)
+    _configure_connection(conn)
+    return conn
+
+
+def _idle_connections() -> list:
+    pid = os.getpid()
+    idle = getattr(_POOL_LOCAL, "idle", None)
+    # A forked worker must not reuse connections inherited from its parent.
+    if idle is None or getattr(_POOL_LOCAL, "pid", None) != pid:
+        idle = []
+        _POOL_LOCAL.idle = idle
+        _POOL_LOCAL.pid = pid
+    return idle
+
+
+class PooledConnection:
+    """A borrowed sqlite3 connection.
+
+    Behaves like sqlite3.Connection, except close() returns the connection to
+    the calling thread's pool. Also usable as a context manager, which commits
+    on success, rolls back on error and releases the connection either way.
+    """
+
+    __slots__ = ("_conn", "_cursors")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._cursors: list = []
+
+    def __getattr__(self, name):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn
+        if conn is not None and exc_type is None:
+            conn.commit()
+        self.close()
+        return False
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        return self._conn
+
+    def cursor(self, *args):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        cur = conn.cursor(*args)
+        self._cursors.append(cur)
+        return cur
+
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self) -> None:
+        conn = self._conn
+        if conn is None:
+            return
+        self._conn = None
+        # Finalize statements the caller did not read to the end; an active
+        # SELECT would otherwise keep holding its read lock while idle.
+        for cur in self._cursors:
+            try:
+                cur.close()
+            except sqlite3.Error:
+                pass
+        self._cursors.clear()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        idle = _idle_connections()
+        if len(idle) < _POOL_MAX_IDLE:
+            idle.append(conn)
+        else:
+            conn.close()
+
+
+# Set by trace_statements() while the query plan audit runs.
+_statement_trace = None
+
+
 # Connect to database
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+def get_db_connection() -> PooledConnection:
+    idle = _idle_connections()
+    conn = idle.pop() if idle else _open_connection()
+    if _statement_trace is not None:
+        conn.set_trace_callback(_statement_trace)
+    return PooledConnection(conn)
 
 
-# Database setup
-def init_db():
+def db_connection() -> PooledConnection:
+    """Context-manager spelling of get_db_connection():
+
+    with db_connection() as conn:
+        conn.execute(...)
+    """
+    return get_db_connection()
+
+
+def close_idle_connections() -> None:
+    idle = _idle_connections()
+    while idle:
+        try:
+            idle.pop().close()
+        except sqlite3.Error:
+            pass
+
+
+def get_db_pragma_report() -> list[dict[str, Any]]:
+    """Compare the PRAGMA profile with what a pooled connection actually uses.
+
+    SQLite silently ignores or clamps some settings (mmap_size above the
+    compile-time limit, WAL on filesystems without shared memory, ...), so
+    create_app logs this at startup.
+    """
+    report: list[dict[str, Any]] = []
     conn = get_db_connection()
     cur = conn.cursor()
+    try:
+        for name, expected in DB_PRAGMAS.items():
+            try:
+                cur.execute(f"PRAGMA {name}")
+                row = cur.fetchone()
+            except sqlite3.Error:
+                row = None
+            actual = row[0] if row else None
+            if isinstance(actual, int) and name in _PRAGMA_READBACK:
+                actual = _PRAGMA_READBACK[name].get(actual, actual)
+            if isinstance(actual, str):
+                actual = actual.upper()
+            report.append(
+                {
+                    "name": name,
+                    "expected": expected,
+                    "actual": actual,
+                    "ok": actual == expected,
+                }
+            )
+    finally:
+        conn.close()
+    return report
 
-    def _ensure_column(table_name: str, column_name: str, column_def: str) -> None:
-        cur.execute(f"PRAGMA table_info({table_name})")
-        existing = {row[1] for row in cur.fetchall()}
-        if column_name in existing:
-            return
-        cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_def}")
 
+###############################################
+# Subjects
+###############################################
+#
+# A subject is the thing being rated (a song, album or artist), shared by every
+# rating of it. ratings.subject_id is resolved on write, so "all ratings of
+# this subject" is an indexed equality lookup instead of the old
+# mbid-or-fuzzy-name predicate.
+#
+# Resolution mirrors that predicate: a matching MBID wins, then the exact
+# normalized (type, name, artist). A rating without an artist joins an existing
+# subject with the same type and name, and a rating with an artist adopts a
+# subject that was created without one.
+
+
+def subject_key(value: str | None) -> str:
+    return " ".join((value or "").strip().lower().split())
+
+
+def find_subject_id(
+    cur: sqlite3.Cursor,
+    *,
+    rating_type: str | None,
+    rating_name: str | None,
+    content_artist: str | None,
+    mbid: str | None,
+) -> int | None:
+    return _match_subject(cur, rating_type, rating_name, content_artist, mbid)[0]
+
+
+def resolve_subject_id(
+    cur: sqlite3.Cursor,
+    *,
+    rating_type: str | None,
+    rating_name: str | None,
+    content_artist: str | None,
+    mbid: str | None,
+) -> int | None:
+    """Find the subject for these details, creating or enriching it if needed.
+
+    Runs on the caller's cursor so it joins the caller's write transaction.
+    """
+    type_key = subject_key(rating_type)
+    name_key = subject_key(rating_name)
+    artist_key = subject_key(content_artist)
+    mbid = (mbid or "").strip() or None
+
+    subject_id, matched_on = _match_subject(
+        cur, rating_type, rating_name, content_artist, mbid
+    )
+    if subject_id is None:
+        if not type_key or not name_key:
+            return None
+        cur.execute(
+            """
+            INSERT OR IGNORE INTO subjects (type_key, name_key, artist_key, mbid)
+            VALUES (?,?,?,?)
+            """,
+            (type_key, name_key, artist_key, mbid),
+        )
+        subject_id, matched_on = _match_subject(
+            cur, rating_type, rating_name, content_artist, mbid
+        )
+        if subject_id is None:
+            return None
+
+    if matched_on == "artistless" and artist_key:
+        cur.execute(
+            "UPDATE subjects SET artist_key = ? WHERE subject_id = ?",
+            (artist_key, int(subject_id)),
+        )
+    if mbid:
+        cur.execute(
+            "UPDATE subjects SET mbid = ? WHERE subject_id = ? AND mbid IS NULL",
+            (mbid, int(subject_id)),
+        )
+    return int(subject_id)
+
+
+def _match_subject(
+    cur: sqlite3.Cursor,
+    rating_type: str | None,
+    rating_name: str | None,
+    content_artist: str | None,
+    mbid: str | None,
+) -> tuple[int | None, str | None]:
+    type_key = subject_key(rating_type)
+    name_key = subject_key(rating_name)
+    artist_key = subject_key(content_artist)
+    mbid = (mbid or "").strip()
+
+    if mbid:
+        cur.execute(
+            "SELECT subject_id FROM subjects WHERE mbid = ? ORDER BY subject_id LIMIT 1",
+            (mbid,),
+        )
+        row = cur.fetchone()
+        if row:
+            return int(row[0]), "mbid"
+
+    if not type_key or not name_key:
+        return None, None
+
+    cur.execute(
+        """
+        SELECT subject_id
+        FROM subjects
+        WHERE type_key = ? AND name_key = ? AND artist_key = ?
+        LIMIT 1
+        """,
+        (type_key, name_key, artist_key),
+    )
+    row = cur.fetchone()
+    if row:
+        return int(row[0]), "exact"
+
+    if artist_key:
+        cur.execute(
+            """
+            SELECT subject_id
+            FROM subjects
+            WHERE type_key = ? AND name_key = ? AND artist_key = ''
+            LIMIT 1
+            """,
+            (type_key, name_key),
+        )
+        row = cur.fetchone()
+        return (int(row[0]), "artistless") if row else (None, None)
+
+    cur.execute(
+        """
+        SELECT subject_id
+        FROM subjects
+        WHERE type_key = ? AND name_key = ?
+        ORDER BY subject_id
+        LIMIT 1
+        """,
+        (type_key, name_key),
+    )
+    row = cur.fetchone()
+    return (int(row[0]), "any_artist") if row else (None, None)
+
+
+def _backfill_rating_subjects(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        SELECT rating_key, rating_type, rating_name, content_info_artist, mbid
+        FROM ratings
+        WHERE subject_id IS NULL
+        ORDER BY rating_key ASC
+        """
+    )
+    rows = cur.fetchall()
+    for rating_key, rating_type, rating_name, content_artist, mbid in rows:
+        subject_id = resolve_subject_id(
+            cur,
+            rating_type=rating_type,
+            rating_name=rating_name,
+            content_artist=content_artist,
+            mbid=mbid,
+        )
+        if subject_id is None:
+            continue
+        cur.execute(
+            "UPDATE ratings SET subject_id = ? WHERE rating_key = ?",
+            (subject_id, int(rating_key)),
+        )
+
+
+###############################################
+# Subject stats
+###############################################
+#
+# subject_stats holds one precomputed aggregate row per rated subject so charts
+# and subject summaries read rows instead of re-aggregating ratings. Rating
+# writes call refresh_subject_stats() for each subject they touch.
+#
+# overall_avg is the mean of the categories a subject has averages for and is
+# what pages show. Charts rank by overall_score instead: the five category
+# averages summed and divided by five, so a missing category counts as 0.
+
+SUBJECT_STAT_CATEGORIES = ("lyrics", "beat", "flow", "melody", "cohesive")
+
+
+def refresh_subject_stats(
+    cur: sqlite3.Cursor, subject_id: int | None, *, rated_at: str | None = None
+) -> None:
+    """Recompute the subject_stats row for one subject from its ratings.
+
+    Runs on the caller's cursor so it joins the caller's write transaction.
+    rated_at, when given, becomes the subject's last_rated_at.
+    """
+    if subject_id is None:
+        return
+    subject_id = int(subject_id)
+
+    sum_cols = ", ".join(
+        f"SUM(CAST(r.{c}_rating AS REAL)), COUNT(r.{c}_rating)"
+        for c in SUBJECT_STAT_CATEGORIES
+    )
+    cur.execute(
+        f"""
+        SELECT
+            COUNT(1),
+            COUNT(DISTINCT r.user_id),
+            {sum_cols},
+            MAX(r.mbid),
+            MAX(r.image_url)
+        FROM ratings r
+        WHERE r.subject_id = ?
+        """,
+        (subject_id,),
+    )
+    row = cur.fetchone()
+    rating_count = int(row[0] or 0) if row else 0
+    if not rating_count:
+        cur.execute("DELETE FROM subject_stats WHERE subject_id = ?", (subject_id,))
+        return
+
+    user_count = int(row[1] or 0)
+    # SUM() of a category nobody filled in is NULL; the columns are NOT NULL.
+    sums_counts = [v or 0 for v in row[2:-2]]
+    mbid, image_url = row[-2:]
+
+    averages = []
+    score = 0.0
+    for total, count in zip(sums_counts[::2], sums_counts[1::2]):
+        if count:
+            averages.append(round(float(total or 0) / int(count), 2))
+            score += float(total or 0) / int(count)
+    overall_avg = round(sum(averages) / len(averages), 2) if averages else None
+    overall_score = score / len(SUBJECT_STAT_CATEGORIES)
+
+    cur.execute(
+        """
+        SELECT s.type_key, r.rating_name, COALESCE(r.content_info_artist, '')
+        FROM subjects s
+        JOIN ratings r ON r.subject_id = s.subject_id
+        WHERE s.subject_id = ?
+        ORDER BY r.rating_key ASC
+        LIMIT 1
+        """,
+        (subject_id,),
+    )
+    type_key, name, artist = cur.fetchone()
+    if type_key == "artist":
+        artist = ""
+
+    stat_cols = ", ".join(f"{c}_sum, {c}_count" for c in SUBJECT_STAT_CATEGORIES)
+    stat_updates = ", ".join(
+        f"{c}_sum = excluded.{c}_sum, {c}_count = excluded.{c}_count"
+        for c in SUBJECT_STAT_CATEGORIES
+    )
+    placeholders = ",".join(["?"] * (11 + len(sums_counts)))
+    cur.execute(
+        f"""
+        INSERT INTO subject_stats (
+            subject_id, type_key, name, artist, mbid, image_url,
+            rating_count, user_count, {stat_cols},
+            overall_avg, overall_score, last_rated_at
+        )
+        VALUES ({placeholders})
+        ON CONFLICT(subject_id) DO UPDATE SET
+            type_key = excluded.type_key,
+            name = excluded.name,
+            artist = excluded.artist,
+            mbid = excluded.mbid,
+            image_url = excluded.image_url,
+            rating_count = excluded.rating_count,
+            user_count = excluded.user_count,
+            {stat_updates},
+            overall_avg = excluded.overall_avg,
+            overall_score = excluded.overall_score,
+            last_rated_at = COALESCE(excluded.last_rated_at, subject_stats.last_rated_at)
+        """,
+        (
+            subject_id,
+            type_key,
+            name or "",
+            artist or "",
+            (mbid or "").strip() or None,
+            (image_url or "").strip() or None,
+            rating_count,
+            user_count,
+            *sums_counts,
+            overall_avg,
+            overall_score,
+            rated_at,
+        ),
+    )
+
+
+def _backfill_subject_stats(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        SELECT DISTINCT r.subject_id
+        FROM ratings r
+        LEFT JOIN subject_stats ss ON ss.subject_id = r.subject_id
+        WHERE r.subject_id IS NOT NULL
+          AND ss.subject_id IS NULL
+        """
+    )
+    subject_ids = [int(r[0]) for r in cur.fetchall()]
+    for subject_id in subject_ids:
+        cur.execute(
+            """
+            SELECT MAX(a.created_at)
+            FROM activity a
+            JOIN ratings r ON r.rating_key = a.entity_id
+            WHERE a.entity_type = 'rating'
+              AND a.action IN ('rating_create', 'rating_edit')
+              AND r.subject_id = ?
+            """,
+            (subject_id,),
+        )
+        row = cur.fetchone()
+        refresh_subject_stats(cur, subject_id, rated_at=row[0] if row else None)
+
+
+###############################################
+# Feed timeline
+###############################################
+#
+# feed_timeline is a per-user home timeline: one row per (reader, item) for
+# every activity event and bulletin post the reader should see, i.e. their own
+# plus those of the people they follow. Rows are written when the item is
+# created (fan-out on write) and when a follow starts, so a feed page is a
+# range read on the reader's primary-key prefix.
+#
+# Each reader keeps at most FEED_TIMELINE_CAP rows per kind. Trimming runs
+# every FEED_TIMELINE_TRIM_EVERY item ids rather than on every write, and
+# only touches the timelines of the readers that item was written to.
+
+FEED_TIMELINE_CAP = env_int("FEED_TIMELINE_CAP", 1000, 50, 1_000_000)
+FEED_TIMELINE_TRIM_EVERY = env_int("FEED_TIMELINE_TRIM_EVERY", 250, 1, 1_000_000)
+
+_FEED_AUDIENCE_CTE = """
+    WITH audience (user_id, actor_user_id) AS (
+        SELECT user_info_key, user_info_key
+        FROM user_info
+        UNION
+        SELECT followed_by_user_key, user_followed_key
+        FROM follow_info
+        WHERE (unfollowed IS NULL OR unfollowed = 0)
+    )
+"""
+
+
+def fill_feed_timeline(
+    cur: sqlite3.Cursor,
+    *,
+    user_id: int | None = None,
+    actor_user_id: int | None = None,
+) -> None:
+    """Insert the newest FEED_TIMELINE_CAP items per reader from the source tables.
+
+    Limited to one reader and/or one actor when given. Dismissed activity and
+    activity cleared from the "all" view is skipped; category clears are
+    applied when reading, since they only hide rows in that category's view.
+    """
+    where = ""
+    params: list[Any] = []
+    if user_id is not None:
+        where += " AND au.user_id = ? "
+        params.append(int(user_id))
+    if actor_user_id is not None:
+        where += " AND au.actor_user_id = ? "
+        params.append(int(actor_user_id))
+
+    cur.execute(
+        f"""
+        {_FEED_AUDIENCE_CTE}
+        INSERT OR IGNORE INTO feed_timeline (
+            user_id, kind, item_id, actor_user_id, category, created_at
+        )
+        SELECT user_id, 'activity', activity_id, actor_user_id, category, created_at
+        FROM (
+            SELECT
+                au.user_id,
+                a.activity_id,
+                a.actor_user_id,
+                a.category,
+                a.created_at,
+                ROW_NUMBER() OVER (
+                    PARTITION BY au.user_id ORDER BY a.activity_id DESC
+                ) AS rn
+            FROM audience au
+            JOIN activity a ON a.actor_user_id = au.actor_user_id
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM activity_dismissed d
+                WHERE d.user_id = au.user_id AND d.activity_id = a.activity_id
+            )
+              AND NOT EXISTS (
+                SELECT 1
+                FROM activity_clear c
+                WHERE c.user_id = au.user_id
+                  AND c.category = 'all'
+                  AND (a.created_at IS NULL OR a.created_at <= c.cleared_at)
+            )
+            {where}
+        )
+        WHERE rn <= ?
+        """,
+        (*params, FEED_TIMELINE_CAP),
+    )
+
+    cur.execute(
+        f"""
+        {_FEED_AUDIENCE_CTE}
+        INSERT OR IGNORE INTO feed_timeline (
+            user_id, kind, item_id, actor_user_id, category, created_at
+        )
+        SELECT user_id, 'bulletin', bulletin_key, created_by_user_id, NULL, created_at
+        FROM (
+            SELECT
+                au.user_id,
+                b.bulletin_key,
+                b.created_by_user_id,
+                b.created_at,
+                ROW_NUMBER() OVER (
+                    PARTITION BY au.user_id ORDER BY b.bulletin_key DESC
+                ) AS rn
+            FROM audience au
+            JOIN bulletin b ON b.created_by_user_id = au.actor_user_id
+            WHERE 1 = 1
+            {where}
+        )
+        WHERE rn <= ?
+        """,
+        (*params, FEED_TIMELINE_CAP),
+    )
+
+
+def trim_feed_timeline(
+    cur: sqlite3.Cursor,
+    kind: str,
+    *,
+    item_id: int | None = None,
+    user_id: int | None = None,
+) -> None:
+    """Cut the kind's timeline back to FEED_TIMELINE_CAP rows for user_id, or
+    for every reader that item_id was fanned out to."""
+    if user_id is not None:
+        readers_sql, readers_params = "?", [int(user_id)]
+    else:
+        readers_sql = "SELECT user_id FROM feed_timeline WHERE kind = ? AND item_id = ?"
+        readers_params = [kind, int(item_id or 0)]
+    cur.execute(
+        f"""
+        DELETE FROM feed_timeline
+        WHERE kind = ?
+          AND user_id IN ({readers_sql})
+          AND item_id <= (
+            SELECT ft.item_id
+            FROM feed_timeline ft
+            WHERE ft.user_id = feed_timeline.user_id AND ft.kind = feed_timeline.kind
+            ORDER BY ft.item_id DESC
+            LIMIT 1 OFFSET ?
+          )
+        """,
+        (kind, *readers_params, FEED_TIMELINE_CAP),
+    )
+
+
+def rebuild_feed_timelines(user_id: int | None = None) -> None:
+    """Drop and refill the timeline for one reader, or for everyone."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    if user_id is None:
+        cur.execute("DELETE FROM feed_timeline")
+    else:
+        cur.execute("DELETE FROM feed_timeline WHERE user_id = ?", (int(user_id),))
+    fill_feed_timeline(cur, user_id=user_id)
+    conn.commit()
+    conn.close()
+
+
+###############################################
+# Index catalog
+###############################################
+#
+# Every secondary index lives here rather than in the schema migrations.
+# init_db applies the catalog after any pending schema steps, and again
+# whenever the catalog itself changes (schema_version keeps its digest). An
+# index whose definition changed is dropped and rebuilt; idx_* indexes no
+# longer listed are dropped.
+# `flask audit-query-plans` checks the app's queries against this catalog.
+
+INDEX_CATALOG: tuple[tuple[str, str, str, bool], ...] = (
+    # (name, table, columns, unique)
+    ("idx_subjects_natural", "subjects", "type_key, name_key, artist_key", True),
+    ("idx_subjects_mbid", "subjects", "mbid", False),
+    ("idx_ratings_subject", "ratings", "subject_id, rating_key", False),
+    ("idx_ratings_user_id", "ratings", "user_id", False),
+    ("idx_ratings_mbid", "ratings", "mbid", False),
+    ("idx_ratings_type", "ratings", "rating_type", False),
+    (
+        "idx_ratings_type_name",
+        "ratings",
+        "LOWER(TRIM(rating_type)), LOWER(TRIM(rating_name))",
+        False,
+    ),
+    (
+        "idx_subject_stats_chart",
+        "subject_stats",
+        "type_key, overall_score DESC, rating_count DESC, name COLLATE NOCASE",
+        False,
+    ),
+    ("idx_rating_comments_rating", "rating_comments", "rating_key", False),
+    ("idx_rating_category_votes_rating", "rating_category_votes", "rating_key", False),
+    (
+        "idx_rating_reactions_rating_category",
+        "rating_reactions",
+        "rating_key, category",
+        False,
+    ),
+    ("idx_rating_likes_user", "rating_likes", "user_id", False),
+    ("idx_playlist_songs_unique", "playlist_songs", "playlist_key, song_key", True),
+    ("idx_playlist_info_creator", "playlist_info", "created_by", False),
+    ("idx_user_info_username", "user_info", "username", False),
+    ("idx_user_info_email", "user_info", "email", False),
+    ("idx_profile_comments_profile", "profile_comments", "profile_user_id", False),
+    ("idx_alerts_user", "alerts", "user_id, alert_id, is_read", False),
+    (
+        "idx_activity_actor",
+        "activity",
+        "actor_user_id, action, entity_type, entity_id",
+        False,
+    ),
+    ("idx_activity_entity", "activity", "action, entity_type, entity_id", False),
+    ("idx_bulletin_author", "bulletin", "created_by_user_id", False),
+    (
+        "idx_follow_info_followed",
+        "follow_info",
+        "user_followed_key, followed_by_user_key, unfollowed",
+        False,
+    ),
+    (
+        "idx_follow_info_follower",
+        "follow_info",
+        "followed_by_user_key, user_followed_key, unfollowed",
+        False,
+    ),
+    (
+        "idx_feed_timeline_category",
+        "feed_timeline",
+        "user_id, kind, category, item_id",
+        False,
+    ),
+    ("idx_feed_timeline_item", "feed_timeline", "kind, item_id", False),
+    ("idx_event_log_created", "event_log", "created_at", False),
+    ("idx_mb_response_cache_expires", "mb_response_cache", "expires_at", False),
+    ("idx_artwork_jobs_ready", "artwork_jobs", "status, run_after", False),
+    ("idx_artwork_jobs_rating", "artwork_jobs", "rating_key, job_id", False),
+)
+
+
+def _index_sql(name: str, table: str, columns: str, unique: bool) -> str:
+    return f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"
+
+
+def apply_index_catalog(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    )
+    existing = {name: " ".join(sql.split()) for name, sql in cur.fetchall()}
+    wanted = set()
+    for name, table, columns, unique in INDEX_CATALOG:
+        wanted.add(name)
+        sql = _index_sql(name, table, columns, unique)
+        if existing.get(name) == sql:
+            continue
+        if name in existing:
+            cur.execute(f"DROP INDEX {name}")
+        cur.execute(sql)
+    for name in existing:
+        if name.startswith("idx_") and name not in wanted:
+            cur.execute(f"DROP INDEX {name}")
+
+
+@contextmanager
+def trace_statements() -> Iterator[list[str]]:
+    """Collect every statement run on connections borrowed inside the block.
+
+    Statements arrive with their parameters expanded, from any thread. Only
+    meant for the query plan audit: connections keep the callback until they
+    are closed.
+    """
+    global _statement_trace
+    statements: list[str] = []
+    close_idle_connections()
+    _statement_trace = statements.append
+    try:
+        yield statements
+    finally:
+        _statement_trace = None
+        close_idle_connections()
+
+
+def explain_full_scans(cur: sqlite3.Cursor, sql: str) -> list[str]:
+    """Tables (or aliases) that `sql` reads with a full scan and no index."""
+    cur.execute(f"EXPLAIN QUERY PLAN {sql}")
+    plan = [row[3] for row in cur.fetchall()]
+    # Subqueries and CTEs show up as SCAN <alias> once materialized.
+    derived = {
+        d.split()[-1] for d in plan if d.startswith(("MATERIALIZE", "CO-ROUTINE"))
+    }
+    scans = []
+    for detail in plan:
+        parts = detail.split()
+        if len(parts) == 2 and parts[0] == "SCAN" and parts[1] not in derived:
+            scans.append(parts[1])
+    return scans
+
+
+def _ensure_column(
+    cur: sqlite3.Cursor, table_name: str, column_name: str, column_def: str
+) -> None:
+    cur.execute(f"PRAGMA table_info({table_name})")
+    existing = {row[1] for row in cur.fetchall()}
+    if column_name in existing:
+        return
+    cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_def}")
+
+
+###############################################
+# Full-text search
+###############################################
+#
+# Each searchable table has an FTS5 shadow keyed by the source row's primary
+# key and kept current by triggers. The trigram tokenizer indexes every
+# three-character window, so a MATCH on a quoted token is a case-insensitive
+# substring search answered from the index rather than a '%tok%' LIKE scan.
+#
+# The shadows are built alongside the index catalog: whenever the catalog
+# digest changes (which includes whether FTS5 is usable here) the triggers are
+# recreated and the shadows refilled from their source tables. Without FTS5
+# the triggers are dropped and the search functions fall back to LIKE.
+
+
+def _probe_fts5() -> bool:
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+FTS5_AVAILABLE = _probe_fts5()
+
+# Tokens shorter than a trigram cannot be matched through the index.
+FTS_MIN_TOKEN_LENGTH = 3
+
+# (fts table, source table, key column, source columns that feed the index,
+#  indexed columns, SELECT of key + indexed columns, its key expression)
+SEARCH_TABLES: tuple[tuple[str, str, str, str, str, str, str], ...] = (
+    (
+        "ratings_fts",
+        "ratings",
+        "rating_key",
+        "rating_name, rating_type, user, user_id",
+        "rating_name, rating_type, username",
+        """
+        SELECT r.rating_key, r.rating_name, r.rating_type,
+               COALESCE(ui.username, r.user)
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        """,
+        "r.rating_key",
+    ),
+    (
+        "users_fts",
+        "user_info",
+        "user_info_key",
+        "username",
+        "username",
+        "SELECT user_info_key, username FROM user_info",
+        "user_info_key",
+    ),
+    (
+        "playlists_fts",
+        "playlist_info",
+        "playlist_key",
+        "created_by, playlist_title, playlist_description",
+        "playlist_title, playlist_description, created_by",
+        """
+        SELECT playlist_key, playlist_title, playlist_description, created_by
+        FROM playlist_info
+        """,
+        "playlist_key",
+    ),
+    (
+        "songs_fts",
+        "song",
+        "song_key",
+        "song_title, artist_name",
+        "song_title, artist_name",
+        "SELECT song_key, song_title, artist_name FROM song",
+        "song_key",
+    ),
+)
+
+
+def _search_trigger_sql() -> list[tuple[str, str]]:
+    triggers = []
+    for fts, table, key, watched, columns, select, key_expr in SEARCH_TABLES:
+        insert = f"INSERT INTO {fts} (rowid, {columns}) {select} WHERE {key_expr}"
+        triggers += [
+            (
+                f"{fts}_ai",
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"{insert} = new.{key}; END",
+            ),
+            (
+                f"{fts}_au",
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {watched} ON {table} BEGIN "
+                f"DELETE FROM {fts} WHERE rowid = old.{key}; "
+                f"{insert} = new.{key}; END",
+            ),
+            (
+                f"{fts}_ad",
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"DELETE FROM {fts} WHERE rowid = old.{key}; END",
+            ),
+        ]
+    # ratings_fts indexes the author's current username, not ratings.user.
+    _, _, _, _, columns, select, _ = SEARCH_TABLES[0]
+    triggers.append(
+        (
+            "ratings_fts_username",
+            "CREATE TRIGGER ratings_fts_username AFTER UPDATE OF username "
+            "ON user_info BEGIN "
+            "DELETE FROM ratings_fts WHERE rowid IN "
+            "(SELECT rating_key FROM ratings WHERE user_id = new.user_info_key); "
+            f"INSERT INTO ratings_fts (rowid, {columns}) {select} "
+            "WHERE r.user_id = new.user_info_key; END",
+        )
+    )
+    return [(name, " ".join(sql.split())) for name, sql in triggers]
+
+
+def apply_search_index(cur: sqlite3.Cursor) -> None:
+    for name, _ in _search_trigger_sql():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    if not FTS5_AVAILABLE:
+        return
+    for fts, _, _, _, columns, select, _ in SEARCH_TABLES:
+        cur.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+            f"USING fts5({columns}, tokenize='trigram')"
+        )
+        cur.execute(f"DELETE FROM {fts}")
+        cur.execute(f"INSERT INTO {fts} (rowid, {columns}) {select}")
+    for _, sql in _search_trigger_sql():
+        cur.execute(sql)
+
+
+###############################################
+# Migrations
+###############################################
+#
+# schema_version records the last migration applied and a digest of the index
+# catalog it was applied with. _schema_v1 is the schema as it stood when
+# versioning was introduced; it only uses IF NOT EXISTS / _ensure_column, so
+# it is also safe on databases created before there was a version to read.
+
+
+def _schema_v1(cur: sqlite3.Cursor) -> None:
     cur.execute(
         """
        CREATE TABLE IF NOT EXISTS "ratings" (
@@ -61,12 +1042,12 @@ def init_db():
         """
     )
 
-    _ensure_column("ratings", "image_url", "image_url TEXT")
-    _ensure_column("ratings", "mbid", "mbid TEXT")
-    _ensure_column("ratings", "mb_url", "mb_url TEXT")
-    _ensure_column("ratings", "rating_emoji", "rating_emoji TEXT")
-    _ensure_column("ratings", "extra_link", "extra_link TEXT")
-    _ensure_column("ratings", "extra_info", "extra_info TEXT")
+    _ensure_column(cur, "ratings", "image_url", "image_url TEXT")
+    _ensure_column(cur, "ratings", "mbid", "mbid TEXT")
+    _ensure_column(cur, "ratings", "mb_url", "mb_url TEXT")
+    _ensure_column(cur, "ratings", "rating_emoji", "rating_emoji TEXT")
+    _ensure_column(cur, "ratings", "extra_link", "extra_link TEXT")
+    _ensure_column(cur, "ratings", "extra_info", "extra_info TEXT")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS "album" (
@@ -133,10 +1114,10 @@ def init_db():
         """
     )
 
-    _ensure_column("bulletin", "created_by_user_id", "created_by_user_id INTEGER")
-    _ensure_column("bulletin", "title", "title TEXT")
-    _ensure_column("bulletin", "message", "message TEXT")
-    _ensure_column("bulletin", "created_at", "created_at TEXT")
+    _ensure_column(cur, "bulletin", "created_by_user_id", "created_by_user_id INTEGER")
+    _ensure_column(cur, "bulletin", "title", "title TEXT")
+    _ensure_column(cur, "bulletin", "message", "message TEXT")
+    _ensure_column(cur, "bulletin", "created_at", "created_at TEXT")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS challenges (
@@ -236,22 +1217,42 @@ def init_db():
 
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_rating_comments_rating
-        ON rating_comments (rating_key)
+        CREATE TABLE IF NOT EXISTS subjects (
+            subject_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type_key TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            artist_key TEXT NOT NULL DEFAULT '',
+            mbid TEXT
+        )
         """
     )
 
-    cur.execute(
-        """
-        CREATE INDEX IF NOT EXISTS idx_rating_category_votes_rating
-        ON rating_category_votes (rating_key)
-        """
-    )
+    _ensure_column(cur, "ratings", "subject_id", "subject_id INTEGER")
 
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_rating_reactions_rating_category
-        ON rating_reactions (rating_key, category)
+        CREATE TABLE IF NOT EXISTS subject_stats (
+            subject_id INTEGER PRIMARY KEY,
+            type_key TEXT NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            artist TEXT NOT NULL DEFAULT '',
+            mbid TEXT,
+            image_url TEXT,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            user_count INTEGER NOT NULL DEFAULT 0,
+            lyrics_sum REAL NOT NULL DEFAULT 0,
+            lyrics_count INTEGER NOT NULL DEFAULT 0,
+            beat_sum REAL NOT NULL DEFAULT 0,
+            beat_count INTEGER NOT NULL DEFAULT 0,
+            flow_sum REAL NOT NULL DEFAULT 0,
+            flow_count INTEGER NOT NULL DEFAULT 0,
+            melody_sum REAL NOT NULL DEFAULT 0,
+            melody_count INTEGER NOT NULL DEFAULT 0,
+            cohesive_sum REAL NOT NULL DEFAULT 0,
+            cohesive_count INTEGER NOT NULL DEFAULT 0,
+            overall_avg REAL,
+            last_rated_at TEXT
+        )
         """
     )
 
@@ -289,13 +1290,7 @@ def init_db():
         """
     )
 
-    _ensure_column("playlist_songs", "playlist_key", "playlist_key INTEGER")
-    cur.execute(
-        """
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_playlist_songs_unique
-        ON playlist_songs (playlist_key, song_key)
-        """
-    )
+    _ensure_column(cur, "playlist_songs", "playlist_key", "playlist_key INTEGER")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS song (
@@ -325,8 +1320,8 @@ def init_db():
         """
     )
 
-    _ensure_column("song", "artist_link", "artist_link TEXT")
-    _ensure_column("song", "song_link", "song_link TEXT")
+    _ensure_column(cur, "song", "artist_link", "artist_link TEXT")
+    _ensure_column(cur, "song", "song_link", "song_link TEXT")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS user_info (
@@ -349,7 +1344,7 @@ def init_db():
         """
     )
 
-    _ensure_column("user_info", "about", "about TEXT")
+    _ensure_column(cur, "user_info", "about", "about TEXT")
 
     cur.execute(
         """
@@ -416,5 +1411,211 @@ def init_db():
         """
     )
 
-    conn.commit()
-    conn.close()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feed_timeline (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            actor_user_id INTEGER NOT NULL,
+            category TEXT,
+            created_at TEXT,
+            PRIMARY KEY (user_id, kind, item_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_log (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            user_id INTEGER,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _backfill_v1(cur: sqlite3.Cursor) -> None:
+    _backfill_rating_subjects(cur)
+    _backfill_subject_stats(cur)
+    cur.execute("SELECT 1 FROM feed_timeline LIMIT 1")
+    if cur.fetchone() is None:
+        fill_feed_timeline(cur)
+
+
+def _schema_v2(cur: sqlite3.Cursor) -> None:
+    _ensure_column(cur, "ratings", "user_id", "user_id INTEGER")
+
+
+def _backfill_v2(cur: sqlite3.Cursor) -> None:
+    # ratings.user keeps the username as it was when the rating was written;
+    # reads show the current one through user_id.
+    cur.execute(
+        """
+        UPDATE ratings
+        SET user_id = (
+            SELECT MIN(ui.user_info_key)
+            FROM user_info ui
+            WHERE LOWER(TRIM(ui.username)) = LOWER(TRIM(ratings.user))
+        )
+        WHERE user_id IS NULL
+        """
+    )
+    # subject_stats.user_count now counts distinct user_id.
+    cur.execute("SELECT subject_id FROM subject_stats")
+    for (subject_id,) in cur.fetchall():
+        refresh_subject_stats(cur, subject_id)
+
+
+def _schema_v3(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS mb_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            status INTEGER NOT NULL,
+            body TEXT,
+            fetched_at TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _schema_v4(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _schema_v5(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS artwork_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rating_key INTEGER NOT NULL,
+            rating_type TEXT NOT NULL,
+            mbid TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _schema_v6(cur: sqlite3.Cursor) -> None:
+    _ensure_column(cur, "subject_stats", "overall_score", "overall_score REAL")
+
+
+def _backfill_v6(cur: sqlite3.Cursor) -> None:
+    cur.execute("SELECT subject_id FROM subject_stats")
+    for (subject_id,) in cur.fetchall():
+        refresh_subject_stats(cur, subject_id)
+
+
+# (version, schema step, backfill step or None), in order. Append new steps;
+# never edit one that has shipped. Schema steps of all pending versions run
+# first, then the index catalog and search index, then the pending
+# backfills, so a backfill can rely on every column and index existing.
+MIGRATIONS: tuple[tuple[int, Callable, Callable | None], ...] = (
+    (1, _schema_v1, _backfill_v1),
+    (2, _schema_v2, _backfill_v2),
+    (3, _schema_v3, None),
+    (4, _schema_v4, None),
+    (5, _schema_v5, None),
+    (6, _schema_v6, _backfill_v6),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _index_catalog_digest() -> str:
+    sql = ";".join(_index_sql(*entry) for entry in INDEX_CATALOG)
+    if FTS5_AVAILABLE:
+        sql += ";" + ";".join(trigger for _, trigger in _search_trigger_sql())
+    return hashlib.sha1(sql.encode("utf-8")).hexdigest()
+
+
+def _read_schema_version(cur: sqlite3.Cursor) -> tuple[int, str | None]:
+    try:
+        cur.execute("SELECT version, index_catalog FROM schema_version LIMIT 1")
+    except sqlite3.OperationalError:
+        return 0, None
+    row = cur.fetchone()
+    return (int(row[0] or 0), row[1]) if row else (0, None)
+
+
+# Database setup
+def init_db():
+    """Bring the schema up to SCHEMA_VERSION.
+
+    An up-to-date database costs one read of schema_version. Otherwise the
+    pending migrations and the index catalog are applied in one BEGIN
+    IMMEDIATE transaction; a worker that loses the race for the write lock
+    finds the work done when it re-reads the version.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(f"PRAGMA journal_mode = {DB_PRAGMAS['journal_mode']}")
+        cur.fetchall()
+    except sqlite3.OperationalError:
+        # Another process holds the database; it already switched modes or
+        # the startup report will say it did not.
+        pass
+
+    digest = _index_catalog_digest()
+    if _read_schema_version(cur) == (SCHEMA_VERSION, digest):
+        conn.close()
+        return
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        version, applied_digest = _read_schema_version(cur)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than this code "
+                f"({SCHEMA_VERSION})."
+            )
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        for _, schema_step, _ in pending:
+            schema_step(cur)
+        if pending or applied_digest != digest:
+            apply_index_catalog(cur)
+            apply_search_index(cur)
+        for _, _, backfill_step in pending:
+            if backfill_step is not None:
+                backfill_step(cur)
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER NOT NULL,
+                index_catalog TEXT
+            )
+            """
+        )
+        cur.execute("DELETE FROM schema_version")
+        cur.execute(
+            "INSERT INTO schema_version (version, index_catalog) VALUES (?, ?)",
+            (SCHEMA_VERSION, digest),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
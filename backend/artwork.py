@@ -0,0 +1,174 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+from backend.database import (
+    cancel_artwork_jobs,
+    claim_artwork_job,
+    enqueue_artwork_job,
+    fail_artwork_job,
+    finish_artwork_job,
+    get_artwork_queue_counts,
+    release_artwork_job,
+)
+from backend.settings import env_number
+
+logger = logging.getLogger(__name__)
+
+# Artwork lookups for new and edited ratings, off the request path.
+#
+# A rating saved without an image but with an MBID gets a row in artwork_jobs
+# (see database.enqueue_artwork_job); until the job settles the rating shows
+# its placeholder and /rating/<key>/artwork reports "pending". Each
+# process runs ARTWORK_WORKERS daemon threads that lease due jobs from the
+# table, so jobs survive restarts and are shared by every gunicorn worker; a
+# job whose worker died is picked up again once its lease runs out.
+#
+# The resolver (registered by routes with set_resolver) returns the image URL
+# or None when the subject has no artwork, and raises on failures worth
+# retrying. Failed jobs are retried with exponential backoff and dead-lettered
+# after ARTWORK_MAX_ATTEMPTS. Enqueuing wakes this process's workers; others
+# poll every ARTWORK_POLL_SECONDS.
+
+
+ARTWORK_WORKERS = int(env_number("ARTWORK_WORKERS", 1, 0, 16))
+ARTWORK_MAX_ATTEMPTS = int(env_number("ARTWORK_MAX_ATTEMPTS", 5, 1, 50))
+ARTWORK_RETRY_BASE_SECONDS = env_number("ARTWORK_RETRY_BASE_SECONDS", 30.0, 1.0, 3600.0)
+ARTWORK_RETRY_MAX_SECONDS = env_number(
+    "ARTWORK_RETRY_MAX_SECONDS", 3600.0, 1.0, 86400.0
+)
+ARTWORK_LEASE_SECONDS = env_number("ARTWORK_LEASE_SECONDS", 300.0, 10.0, 3600.0)
+ARTWORK_POLL_SECONDS = env_number("ARTWORK_POLL_SECONDS", 5.0, 0.1, 600.0)
+
+ARTWORK_RATING_TYPES = frozenset({"album", "song", "artist"})
+
+
+class ArtworkQueue:
+    def __init__(self, workers: int):
+        self.workers = max(0, int(workers))
+        self._resolver: Callable[[str, str], str | None] | None = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._stats = {
+            "enqueued": 0,
+            "resolved": 0,
+            "not_found": 0,
+            "retried": 0,
+            "dead": 0,
+        }
+
+    def set_resolver(self, fn: Callable[[str, str], str | None]) -> None:
+        """fn(rating_type, mbid) -> image URL or None; may raise to retry."""
+        self._resolver = fn
+
+    def enqueue(self, rating_key: int, rating_type: str, mbid: str) -> bool:
+        """Queue an artwork lookup; False if the rating has nothing to look up."""
+        rating_type = (rating_type or "").strip().lower()
+        mbid = (mbid or "").strip()
+        if rating_type not in ARTWORK_RATING_TYPES or not mbid:
+            return False
+        enqueue_artwork_job(rating_key, rating_type, mbid)
+        self._count("enqueued")
+        self.start()
+        self._wake.set()
+        return True
+
+    def cancel(self, rating_key: int) -> None:
+        """Drop the rating's queued or running lookup, if any."""
+        cancel_artwork_jobs(rating_key)
+
+    def start(self) -> None:
+        """Start this process's workers (again, after a fork)."""
+        pid = os.getpid()
+        if self._pid == pid or not self.workers:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            for i in range(self.workers):
+                threading.Thread(
+                    target=self._loop, name=f"artwork-{i}", daemon=True
+                ).start()
+            self._pid = pid
+
+    def run_pending(self, limit: int | None = None) -> int:
+        """Work through due jobs on the calling thread; returns how many ran."""
+        done = 0
+        while limit is None or done < limit:
+            if self._resolver is None:
+                break
+            job = claim_artwork_job(ARTWORK_LEASE_SECONDS)
+            if job is None:
+                break
+            self._run(job)
+            done += 1
+        return done
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["workers"] = self.workers if self._pid == os.getpid() else 0
+        try:
+            stats["jobs"] = get_artwork_queue_counts()
+        except sqlite3.Error:
+            stats["jobs"] = None
+        return stats
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                ran = self.run_pending()
+            except Exception:
+                logger.exception("artwork queue poll failed")
+                ran = 0
+            if not ran:
+                self._wake.wait(ARTWORK_POLL_SECONDS)
+                self._wake.clear()
+
+    def _run(self, job: dict[str, Any]) -> None:
+        if self._resolver is None:
+            # Not the job's fault; leave it for a process that can resolve it.
+            logger.warning(
+                "no artwork resolver registered; releasing job %s", job["job_id"]
+            )
+            release_artwork_job(job["job_id"])
+            return
+        try:
+            image_url = self._resolver(job["rating_type"], job["mbid"])
+        except Exception as exc:
+            self._fail(job, f"{type(exc).__name__}: {exc}")
+            return
+        finish_artwork_job(job["job_id"], job["rating_key"], image_url)
+        self._count("resolved" if image_url else "not_found")
+
+    def _fail(self, job: dict[str, Any], error: str) -> None:
+        if job["attempts"] >= ARTWORK_MAX_ATTEMPTS:
+            logger.warning(
+                "artwork job %s for rating %s dead after %s attempts: %s",
+                job["job_id"],
+                job["rating_key"],
+                job["attempts"],
+                error,
+            )
+            fail_artwork_job(job["job_id"], error, None)
+            self._count("dead")
+            return
+        delay = min(
+            ARTWORK_RETRY_MAX_SECONDS,
+            ARTWORK_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1)),
+        )
+        delay += random.uniform(0, delay / 4)
+        fail_artwork_job(job["job_id"], error, time.time() + delay)
+        self._count("retried")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+artwork_queue = ArtworkQueue(ARTWORK_WORKERS)
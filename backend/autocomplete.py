@@ -0,0 +1,279 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Any
+
+from backend.background import background
+from backend.database import (
+    add_change_listener,
+    get_autocomplete_signature,
+    get_autocomplete_subjects,
+    get_autocomplete_users,
+)
+from backend.settings import env_number
+
+# Type-ahead over rated subject names and usernames.
+#
+# Each process keeps one sorted list of (term, entry key) per kind, where the
+# terms of a name are its word-aligned suffixes ("tyler the creator", "the
+# creator", "creator"), case-folded. A lookup is a bisect to the first term
+# with the typed prefix plus a walk over the matching range; ranked results
+# (by rating count) are memoized per (kind, prefix) until the index changes.
+#
+# The index is built on the background worker at startup. Rating and user
+# writes in this process update it through database.add_change_listener;
+# writes in other processes are picked up by a periodic signature check that
+# rebuilds it when counts change, and by a full rebuild every
+# AUTOCOMPLETE_MAX_AGE_SECONDS. Until the first build finishes, lookup()
+# returns None and callers use the SQL search.
+#
+# AUTOCOMPLETE_MAX_ENTRIES caps memory: past it, the least-rated entries are
+# dropped.
+
+
+AUTOCOMPLETE_MAX_ENTRIES = int(
+    env_number("AUTOCOMPLETE_MAX_ENTRIES", 100_000, 100, 10_000_000)
+)
+AUTOCOMPLETE_CHECK_SECONDS = env_number("AUTOCOMPLETE_CHECK_SECONDS", 30.0, 1.0, 3600.0)
+AUTOCOMPLETE_MAX_AGE_SECONDS = env_number(
+    "AUTOCOMPLETE_MAX_AGE_SECONDS", 900.0, 10.0, 86400.0
+)
+
+KINDS = ("song", "album", "artist", "user")
+
+# Only this many word suffixes of a long name are indexed.
+_MAX_TERMS_PER_NAME = 8
+_RESULT_CACHE_MAX = 4096
+_RESULT_CACHE_DEPTH = 50
+
+
+def fold(value: str | None) -> str:
+    return " ".join(t for t in re.split(r"[\s\W_]+", (value or "").casefold()) if t)
+
+
+def _terms(name: str) -> list[str]:
+    words = fold(name).split(" ")
+    return [" ".join(words[i:]) for i in range(min(len(words), _MAX_TERMS_PER_NAME))]
+
+
+class PrefixIndex:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._terms: dict[str, list[tuple[str, str]]] = {k: [] for k in KINDS}
+        self._results: dict[tuple[str, str], list[str]] = {}
+        self._ready = False
+        self._signature: tuple[int, ...] | None = None
+        self._built_at = 0.0
+        self._checked_at = float("-inf")
+        self._check_pending = False
+        self._stats = {"lookups": 0, "cached": 0, "builds": 0, "updates": 0}
+
+    def lookup(
+        self, kind: str, q: str, *, artist: str = "", limit: int = 10
+    ) -> list[dict[str, Any]] | None:
+        """Up to `limit` entries of `kind` with a word starting with `q`.
+
+        Most-rated first. An empty q lists the most-rated entries. artist, for
+        songs and albums, keeps entries whose artist contains it. Returns
+        None while the index is not built yet.
+        """
+        self._maybe_check()
+        prefix = fold(q)
+        artist = fold(artist)
+        with self._lock:
+            if not self._ready or kind not in self._terms:
+                return None
+            self._stats["lookups"] += 1
+            if artist:
+                keys = [
+                    k
+                    for k in self._ranked(kind, prefix, None)
+                    if artist in fold(self._entries[k]["artist"])
+                ]
+            elif limit <= _RESULT_CACHE_DEPTH:
+                keys = self._results.get((kind, prefix))
+                if keys is None:
+                    keys = self._ranked(kind, prefix, _RESULT_CACHE_DEPTH)
+                    if len(self._results) >= _RESULT_CACHE_MAX:
+                        self._results.clear()
+                    self._results[(kind, prefix)] = keys
+                else:
+                    self._stats["cached"] += 1
+            else:
+                keys = self._ranked(kind, prefix, None)
+            return [self._public(self._entries[k]) for k in keys[:limit]]
+
+    def rebuild(self) -> None:
+        signature = get_autocomplete_signature()
+        entries = {}
+        for row in get_autocomplete_subjects():
+            entry = self._subject_entry(row)
+            if entry:
+                entries[entry["key"]] = entry
+        for row in get_autocomplete_users():
+            entry = self._user_entry(row)
+            if entry:
+                entries[entry["key"]] = entry
+        entries = self._capped(entries)
+        terms: dict[str, list[tuple[str, str]]] = {k: [] for k in KINDS}
+        for key, entry in entries.items():
+            terms[entry["kind"]].extend((t, key) for t in _terms(entry["label"]))
+        for kind_terms in terms.values():
+            kind_terms.sort()
+        with self._lock:
+            self._entries = entries
+            self._terms = terms
+            self._results.clear()
+            self._signature = signature
+            self._built_at = self._checked_at = time.monotonic()
+            self._ready = True
+            self._stats["builds"] += 1
+
+    def apply_changes(self, subject_ids=(), user_ids=()) -> None:
+        """Reload the given subjects and users; listener for database writes."""
+        changed: dict[str, dict[str, Any] | None] = {}
+        subject_ids = list(subject_ids)
+        user_ids = list(user_ids)
+        changed.update({f"s{i}": None for i in subject_ids})
+        changed.update({f"u{i}": None for i in user_ids})
+        if subject_ids:
+            for row in get_autocomplete_subjects(subject_ids):
+                entry = self._subject_entry(row)
+                if entry:
+                    changed[entry["key"]] = entry
+        if user_ids:
+            for row in get_autocomplete_users(user_ids):
+                entry = self._user_entry(row)
+                if entry:
+                    changed[entry["key"]] = entry
+        with self._lock:
+            if not self._ready:
+                return
+            for key, entry in changed.items():
+                self._remove(key)
+                if entry is not None:
+                    self._entries[key] = entry
+                    for term in _terms(entry["label"]):
+                        insort(self._terms[entry["kind"]], (term, key))
+            self._results.clear()
+            self._stats["updates"] += 1
+            over = len(self._entries) > self.max_entries
+        if over:
+            self.rebuild()
+
+    def start(self) -> None:
+        """Queue the first build on the background worker."""
+        self._maybe_check()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["ready"] = self._ready
+            stats["entries"] = len(self._entries)
+            stats["terms"] = sum(len(t) for t in self._terms.values())
+            stats["max_entries"] = self.max_entries
+            stats["age_seconds"] = (
+                round(time.monotonic() - self._built_at, 1) if self._ready else None
+            )
+        return stats
+
+    def _ranked(self, kind: str, prefix: str, depth: int | None) -> list[str]:
+        # Caller holds self._lock.
+        terms = self._terms[kind]
+        seen = set()
+        i = bisect_left(terms, (prefix, ""))
+        while i < len(terms) and terms[i][0].startswith(prefix):
+            seen.add(terms[i][1])
+            i += 1
+        keys = sorted(seen, key=lambda k: self._entries[k]["sort"])
+        return keys if depth is None else keys[:depth]
+
+    def _remove(self, key: str) -> None:
+        # Caller holds self._lock.
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        terms = self._terms[entry["kind"]]
+        for term in _terms(entry["label"]):
+            i = bisect_left(terms, (term, key))
+            if i < len(terms) and terms[i] == (term, key):
+                del terms[i]
+
+    def _capped(self, entries: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        if len(entries) <= self.max_entries:
+            return entries
+        keep = sorted(entries, key=lambda k: entries[k]["sort"])[: self.max_entries]
+        return {k: entries[k] for k in keep}
+
+    def _maybe_check(self) -> None:
+        now = time.monotonic()
+        if self._check_pending or now - self._checked_at < AUTOCOMPLETE_CHECK_SECONDS:
+            return
+        with self._lock:
+            if self._check_pending:
+                return
+            self._check_pending = True
+        background.submit(self._check)
+
+    def _check(self) -> None:
+        try:
+            stale = (
+                not self._ready
+                or time.monotonic() - self._built_at >= AUTOCOMPLETE_MAX_AGE_SECONDS
+                or get_autocomplete_signature() != self._signature
+            )
+            if stale:
+                self.rebuild()
+        finally:
+            self._checked_at = time.monotonic()
+            self._check_pending = False
+
+    @staticmethod
+    def _subject_entry(row: tuple) -> dict[str, Any] | None:
+        subject_id, kind, name, artist, mbid, image_url, rating_count = row
+        if kind not in KINDS or not fold(name):
+            return None
+        return {
+            "key": f"s{int(subject_id)}",
+            "kind": kind,
+            "label": name,
+            "artist": artist or "",
+            "sort": (-int(rating_count or 0), fold(name)),
+            "item": {
+                "name": name or "",
+                "artist": artist or "",
+                "rating_count": int(rating_count or 0),
+                "mbid": (mbid or "").strip() or None,
+                "image_url": (image_url or "").strip() or None,
+            },
+        }
+
+    @staticmethod
+    def _user_entry(row: tuple) -> dict[str, Any] | None:
+        user_id, username, profile_pic, rating_count = row
+        if not fold(username):
+            return None
+        return {
+            "key": f"u{int(user_id)}",
+            "kind": "user",
+            "label": username,
+            "artist": "",
+            "sort": (-int(rating_count or 0), fold(username)),
+            "item": {
+                "user_id": int(user_id),
+                "username": username,
+                "profile_pic": profile_pic,
+                "rating_count": int(rating_count or 0),
+            },
+        }
+
+    @staticmethod
+    def _public(entry: dict[str, Any]) -> dict[str, Any]:
+        return {"kind": entry["kind"], **entry["item"]}
+
+
+autocomplete_index = PrefixIndex(AUTOCOMPLETE_MAX_ENTRIES)
+add_change_listener(autocomplete_index.apply_changes)
@@ -0,0 +1,268 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Sequence
+
+from backend.settings import env_number
+
+logger = logging.getLogger(__name__)
+
+# Work that must happen after a request but not inside it (fan-out writes and
+# the like). Jobs run on a small pool of daemon threads in the same process;
+# at interpreter exit the queue is drained for up to BACKGROUND_DRAIN_SECONDS.
+#
+# BatchWriter is the write-behind variant for high-volume rows (activity):
+# producers enqueue plain tuples and one flush thread hands them to a writer
+# function in batches, so many rows share a single transaction. At exit the
+# flush thread is stopped first, so the batch it is holding gets written,
+# and whatever is still queued is then flushed from the exiting thread.
+
+
+BACKGROUND_WORKERS = int(env_number("BACKGROUND_WORKERS", 1, 1, 32))
+BACKGROUND_QUEUE_MAX = int(env_number("BACKGROUND_QUEUE_MAX", 1000, 1, 1_000_000))
+BACKGROUND_DRAIN_SECONDS = env_number("BACKGROUND_DRAIN_SECONDS", 10.0, 0.0, 600.0)
+
+ACTIVITY_FLUSH_INTERVAL_SECONDS = env_number(
+    "ACTIVITY_FLUSH_INTERVAL_SECONDS", 0.5, 0.01, 60.0
+)
+ACTIVITY_BATCH_SIZE = int(env_number("ACTIVITY_BATCH_SIZE", 200, 1, 10_000))
+ACTIVITY_QUEUE_MAX = int(env_number("ACTIVITY_QUEUE_MAX", 10_000, 1, 1_000_000))
+
+
+class BackgroundWorker:
+    """A bounded job queue served by daemon threads.
+
+    submit() never blocks the caller on a full queue: the job runs inline
+    instead, so work is delayed rather than lost.
+    """
+
+    def __init__(self, name: str, workers: int = 1, maxsize: int = 1000):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._pid = None
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "inline": 0}
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+        """Queue fn(*args, **kwargs). Returns False if it had to run inline."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._stats["inline"] += 1
+            self._run(fn, args, kwargs)
+            return False
+        with self._lock:
+            self._stats["submitted"] += 1
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def drain(self, timeout: float) -> None:
+        deadline = time.monotonic() + max(0.0, timeout)
+        while time.monotonic() < deadline:
+            try:
+                fn, args, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._run(fn, args, kwargs)
+            self._queue.task_done()
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive a fork (gunicorn --preload), so restart them
+        # in whichever process ends up submitting.
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._threads = [
+                threading.Thread(
+                    target=self._loop, name=f"{self.name}-{i}", daemon=True
+                )
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = pid
+
+    def _loop(self) -> None:
+        while True:
+            fn, args, kwargs = self._queue.get()
+            self._run(fn, args, kwargs)
+            self._queue.task_done()
+
+    def _run(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.exception("%s job %r failed", self.name, fn)
+            return
+        with self._lock:
+            self._stats["completed"] += 1
+
+
+class BatchWriter:
+    """Bounded write-behind buffer flushed in batches by one daemon thread.
+
+    put() never blocks: when the buffer is full the item is dropped and
+    counted. A batch is written once batch_size items are waiting or
+    interval seconds after its first item arrived, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[Sequence[Any]], Any],
+        *,
+        interval: float = 0.5,
+        batch_size: int = 200,
+        maxsize: int = 10_000,
+    ):
+        self.name = name
+        self.interval = max(0.0, float(interval))
+        self.batch_size = max(1, int(batch_size))
+        self._write_batch = write_batch
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid = None
+        self._stats = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+        _batch_writers.append(self)
+
+    def put(self, item: Any) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._lock:
+            self._stats["queued"] += 1
+        return True
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Write everything buffered so far from the calling thread."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            batch = self._take(wait=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout: float) -> None:
+        """Stop the flush thread, then write whatever is left within timeout."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.flush(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._thread = threading.Thread(
+                target=self._loop, name=f"{self.name}-writer", daemon=True
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def _take(self, wait: bool) -> list[Any]:
+        try:
+            if wait:
+                # Wake up now and then so a stop request is noticed.
+                batch = [self._queue.get(timeout=max(self.interval, 0.1))]
+            else:
+                batch = [self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + (self.interval if wait else 0.0)
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take(wait=True)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[Any]) -> None:
+        try:
+            with self._write_lock:
+                self._write_batch(batch)
+        except Exception:
+            # Usually a lock held past busy_timeout; one more go before the
+            # rows are given up.
+            logger.warning(
+                "%s: retrying a batch of %d rows", self.name, len(batch), exc_info=True
+            )
+            with self._lock:
+                self._stats["retried"] += len(batch)
+            try:
+                with self._write_lock:
+                    self._write_batch(batch)
+            except Exception:
+                with self._lock:
+                    self._stats["failed"] += len(batch)
+                logger.exception("%s: failed to write %d rows", self.name, len(batch))
+                return
+        with self._lock:
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+
+
+_batch_writers: list[BatchWriter] = []
+
+background = BackgroundWorker(
+    "background", workers=BACKGROUND_WORKERS, maxsize=BACKGROUND_QUEUE_MAX
+)
+
+
+@atexit.register
+def _drain_background() -> None:
+    deadline = time.monotonic() + BACKGROUND_DRAIN_SECONDS
+    background.drain(BACKGROUND_DRAIN_SECONDS)
+    for writer in _batch_writers:
+        writer.close(max(0.0, deadline - time.monotonic()))
@@ -1,16 +1,29 @@
 import sqlite3
 import re
 import json
-from backend._db_setup import DB_PATH
+import time
+from backend._db_setup import (
+    FEED_TIMELINE_TRIM_EVERY,
+    FTS5_AVAILABLE,
+    FTS_MIN_TOKEN_LENGTH,
+    fill_feed_timeline,
+    find_subject_id,
+    get_db_connection,
+    refresh_subject_stats,
+    resolve_subject_id,
+    trim_feed_timeline,
+)
+from backend.background import (
+    ACTIVITY_BATCH_SIZE,
+    ACTIVITY_FLUSH_INTERVAL_SECONDS,
+    ACTIVITY_QUEUE_MAX,
+    BatchWriter,
+    background,
+)
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from datetime import datetime, timezone
-from typing import Optional, Any
-
-
-# Connect to database
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any, Callable
 
 
 def strip_artist_features(artist_name: str) -> str:
@@ -127,6 +140,511 @@ def set_cached_subject_image(cache_key: str, image_url: str) -> None:
         conn.close()
 
 
+# MusicBrainz responses cached by backend.mb_cache. body is the decoded JSON
+# (None for a negative entry); expired rows are never returned and are
+# deleted in bulk by purge_expired_mb_responses().
+def get_cached_mb_response(cache_key: str) -> tuple[int, Any] | None:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT status, body FROM mb_response_cache WHERE cache_key = ? AND expires_at > ?",
+            (cache_key, time.time()),
+        )
+        row = cur.fetchone()
+    except sqlite3.Error:
+        row = None
+    finally:
+        conn.close()
+    if not row:
+        return None
+    status, body = row
+    try:
+        return int(status), (json.loads(body) if body is not None else None)
+    except ValueError:
+        return None
+
+
+def set_cached_mb_response(
+    cache_key: str, status: int, data: Any, ttl_seconds: float
+) -> None:
+    body = json.dumps(data, separators=(",", ":")) if data is not None else None
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            INSERT OR REPLACE INTO mb_response_cache (cache_key, status, body, fetched_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                cache_key,
+                int(status),
+                body,
+                datetime.now(timezone.utc).isoformat(),
+                time.time() + float(ttl_seconds),
+            ),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def purge_expired_mb_responses() -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM mb_response_cache WHERE expires_at <= ?", (time.time(),))
+    deleted = cur.rowcount
+    conn.commit()
+    conn.close()
+    return int(deleted or 0)
+
+
+# Shared token buckets for backend.ratelimit. A bucket's tokens may go
+# negative: each caller reserves the next free slot and sleeps until it is
+# due, outside the transaction.
+def reserve_rate_limit_token(
+    bucket: str, rate: float, burst: float, max_wait: float
+) -> float | None:
+    """Take one token from `bucket`.
+
+    Returns the seconds to wait before using it, or None (and takes nothing)
+    when that would be longer than max_wait.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        cur.execute(
+            "SELECT tokens, updated_at FROM rate_limit_buckets WHERE bucket = ?",
+            (bucket,),
+        )
+        row = cur.fetchone()
+        tokens = burst
+        if row:
+            tokens = min(burst, float(row[0]) + max(0.0, now - float(row[1])) * rate)
+        wait = max(0.0, (1.0 - tokens) / rate)
+        if wait > max_wait:
+            conn.rollback()
+            return None
+        cur.execute(
+            """
+            INSERT INTO rate_limit_buckets (bucket, tokens, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(bucket) DO UPDATE SET
+                tokens = excluded.tokens,
+                updated_at = excluded.updated_at
+            """,
+            (bucket, tokens - 1.0, now),
+        )
+        conn.commit()
+        return wait
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# Artwork jobs for backend.artwork. A rating saved without an image and with
+# an MBID gets a pending job; workers claim it with a lease (an expired lease
+# makes a crashed worker's job claimable again), then either finish it or
+# reschedule it, and after the last attempt leave it 'dead' for inspection.
+# Finished jobs are deleted, so a rating with no job row is settled. A new
+# job replaces the rating's old one even while that is running; a worker
+# whose job row is gone by the time it finishes discards its result.
+def enqueue_artwork_job(rating_key: int, rating_type: str, mbid: str) -> int:
+    now = datetime.now(timezone.utc).isoformat()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM artwork_jobs WHERE rating_key = ?", (int(rating_key),))
+    cur.execute(
+        """
+        INSERT INTO artwork_jobs (rating_key, rating_type, mbid, status, attempts, run_after, created_at, updated_at)
+        VALUES (?, ?, ?, 'pending', 0, ?, ?, ?)
+        """,
+        (
+            int(rating_key),
+            (rating_type or "").strip().lower(),
+            (mbid or "").strip(),
+            time.time(),
+            now,
+            now,
+        ),
+    )
+    job_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return int(job_id)
+
+
+def cancel_artwork_jobs(rating_key: int) -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM artwork_jobs WHERE rating_key = ?", (int(rating_key),))
+    cancelled = cur.rowcount
+    conn.commit()
+    conn.close()
+    return int(cancelled or 0)
+
+
+def claim_artwork_job(lease_seconds: float) -> dict[str, Any] | None:
+    """Lease the next due job (pending, or running with an expired lease)."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        cur.execute(
+            """
+            SELECT job_id, rating_key, rating_type, mbid, attempts
+            FROM artwork_jobs
+            WHERE (status = 'pending' AND run_after <= ?)
+               OR (status = 'running' AND locked_until <= ?)
+            ORDER BY run_after ASC
+            LIMIT 1
+            """,
+            (now, now),
+        )
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return None
+        job_id, rating_key, rating_type, mbid, attempts = row
+        cur.execute(
+            """
+            UPDATE artwork_jobs
+            SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ?
+            WHERE job_id = ?
+            """,
+            (now + lease_seconds, datetime.now(timezone.utc).isoformat(), job_id),
+        )
+        conn.commit()
+        return {
+            "job_id": int(job_id),
+            "rating_key": int(rating_key),
+            "rating_type": rating_type,
+            "mbid": mbid,
+            "attempts": int(attempts) + 1,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def finish_artwork_job(job_id: int, rating_key: int, image_url: str | None) -> bool:
+    """Delete the job and fill in the rating's image if it still has none.
+
+    Returns True when the rating was updated. A job that was superseded or
+    cancelled meanwhile leaves the rating alone.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    updated = False
+    subject_id = None
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("DELETE FROM artwork_jobs WHERE job_id = ?", (int(job_id),))
+        if image_url and cur.rowcount > 0:
+            cur.execute(
+                """
+                UPDATE ratings
+                SET image_url = ?
+                WHERE rating_key = ?
+                  AND (image_url IS NULL OR TRIM(image_url) = '')
+                """,
+                (image_url, int(rating_key)),
+            )
+            updated = cur.rowcount > 0
+        if updated:
+            subject_id = _subject_id_for(
+                cur,
+                rating_key=rating_key,
+                mbid=None,
+                rating_type=None,
+                rating_name=None,
+                content_artist=None,
+            )
+            refresh_subject_stats(cur, subject_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if updated:
+        _notify_change(subject_ids=[subject_id])
+    return updated
+
+
+def fail_artwork_job(job_id: int, error: str, retry_at: float | None) -> None:
+    """Reschedule the job for retry_at, or dead-letter it when that is None."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE artwork_jobs
+        SET status = ?, run_after = ?, locked_until = NULL, last_error = ?, updated_at = ?
+        WHERE job_id = ?
+        """,
+        (
+            "pending" if retry_at is not None else "dead",
+            retry_at if retry_at is not None else time.time(),
+            (error or "")[:500],
+            datetime.now(timezone.utc).isoformat(),
+            int(job_id),
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def release_artwork_job(job_id: int) -> None:
+    """Hand a claimed job back as due now, without using up an attempt."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE artwork_jobs
+        SET status = 'pending', attempts = MAX(attempts - 1, 0), run_after = ?,
+            locked_until = NULL, updated_at = ?
+        WHERE job_id = ? AND status = 'running'
+        """,
+        (time.time(), datetime.now(timezone.utc).isoformat(), int(job_id)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def requeue_dead_artwork_jobs() -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE artwork_jobs
+        SET status = 'pending', attempts = 0, run_after = ?, updated_at = ?
+        WHERE status = 'dead'
+        """,
+        (time.time(), datetime.now(timezone.utc).isoformat()),
+    )
+    requeued = cur.rowcount
+    conn.commit()
+    conn.close()
+    return int(requeued or 0)
+
+
+def get_artwork_status(rating_key: int) -> dict[str, Any] | None:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT image_url FROM ratings WHERE rating_key = ?", (int(rating_key),)
+    )
+    rating = cur.fetchone()
+    if not rating:
+        conn.close()
+        return None
+    cur.execute(
+        """
+        SELECT status, attempts, last_error, run_after
+        FROM artwork_jobs
+        WHERE rating_key = ?
+        ORDER BY job_id DESC
+        LIMIT 1
+        """,
+        (int(rating_key),),
+    )
+    job = cur.fetchone()
+    conn.close()
+    image_url = (rating[0] or "").strip() or None
+    if not job:
+        return {"status": "ready" if image_url else "none", "image_url": image_url}
+    status, attempts, last_error, run_after = job
+    return {
+        "status": status,
+        "image_url": image_url,
+        "attempts": int(attempts or 0),
+        "last_error": last_error,
+        "next_attempt_at": float(run_after) if status == "pending" else None,
+    }
+
+
+def get_artwork_queue_counts() -> dict[str, int]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT status, COUNT(1) FROM artwork_jobs GROUP BY status")
+    counts = {status: int(n) for status, n in cur.fetchall()}
+    conn.close()
+    return counts
+
+
+###############################################
+# Keyset pagination
+###############################################
+#
+# List functions that page by primary key accept start_after / end_before: the
+# key of the last (or first) row the caller already showed, in listing order.
+# Paging backwards reads the nearest rows first, so those come back reversed
+# from SQL and are flipped into listing order here.
+
+
+def _keyset_page(
+    column: str,
+    *,
+    descending: bool = True,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+) -> tuple[str, list[Any], str, bool]:
+    """(condition, params, ORDER BY direction, reversed) for one page."""
+    if end_before is not None:
+        op, order = (">", "ASC") if descending else ("<", "DESC")
+        return f"{column} {op} ?", [int(end_before)], order, True
+    order = "DESC" if descending else "ASC"
+    if start_after is not None:
+        op = "<" if descending else ">"
+        return f"{column} {op} ?", [int(start_after)], order, False
+    return "", [], order, False
+
+
+###############################################
+# Change listeners
+###############################################
+#
+# In-process consumers (the autocomplete index) register here to hear about
+# committed writes to rated subjects and users. Callbacks run on the
+# background worker as fn(subject_ids=[...], user_ids=[...]), never inside
+# the writer's transaction.
+
+_change_listeners: list[Callable[..., Any]] = []
+
+
+def add_change_listener(fn: Callable[..., Any]) -> None:
+    if fn not in _change_listeners:
+        _change_listeners.append(fn)
+
+
+def _notify_change(subject_ids=(), user_ids=()) -> None:
+    subject_ids = sorted({int(i) for i in subject_ids if i is not None})
+    user_ids = sorted({int(i) for i in user_ids if i is not None})
+    if not subject_ids and not user_ids:
+        return
+    for fn in _change_listeners:
+        background.submit(fn, subject_ids=subject_ids, user_ids=user_ids)
+
+
+###############################################
+# Event log
+###############################################
+#
+# event_log is the cross-process relay for live sidebar updates: writers add
+# a row in the same transaction as the alert or feed item, and each web
+# process tails it (see backend.events). Alert events carry their recipient;
+# feed events are resolved to readers through feed_timeline.
+
+EVENT_LOG_RETENTION_SECONDS = 600
+_EVENT_LOG_TRIM_EVERY = 500
+
+
+def _log_event(cur, kind: str, item_id: int, user_id: Optional[int] = None) -> None:
+    now = datetime.now(timezone.utc)
+    cur.execute(
+        "INSERT INTO event_log (kind, item_id, user_id, created_at) VALUES (?,?,?,?)",
+        (kind, int(item_id), int(user_id) if user_id else None, now.isoformat()),
+    )
+    event_id = cur.lastrowid
+    if event_id and event_id % _EVENT_LOG_TRIM_EVERY == 0:
+        cutoff = now - timedelta(seconds=EVENT_LOG_RETENTION_SECONDS)
+        cur.execute("DELETE FROM event_log WHERE created_at < ?", (cutoff.isoformat(),))
+
+
+def get_latest_event_id() -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM event_log")
+    row = cur.fetchone()
+    conn.close()
+    return int(row[0] or 0) if row else 0
+
+
+def get_events_for_users(
+    after_event_id: int, upto_event_id: int, user_ids: list[int]
+) -> list[tuple[int, int, str, int]]:
+    """(event_id, user_id, kind, item_id) for events in (after, upto] that
+    concern any of user_ids, oldest first."""
+    ids = sorted({int(u) for u in user_ids or []})
+    if not ids:
+        return []
+    placeholders = ",".join(["?"] * len(ids))
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT e.event_id, e.user_id, e.kind, e.item_id
+        FROM event_log e
+        WHERE e.event_id > ? AND e.event_id <= ?
+          AND e.user_id IN ({placeholders})
+        UNION ALL
+        SELECT e.event_id, ft.user_id, e.kind, e.item_id
+        FROM event_log e
+        JOIN feed_timeline ft
+            ON ft.kind = e.kind AND ft.item_id = e.item_id
+        WHERE e.event_id > ? AND e.event_id <= ?
+          AND e.user_id IS NULL
+          AND ft.user_id IN ({placeholders})
+        ORDER BY 1 ASC
+        """,
+        (
+            int(after_event_id),
+            int(upto_event_id),
+            *ids,
+            int(after_event_id),
+            int(upto_event_id),
+            *ids,
+        ),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [(int(r[0]), int(r[1]), str(r[2]), int(r[3])) for r in rows]
+
+
+###############################################
+# Feed timeline
+###############################################
+
+
+def _fan_out_feed_item(
+    cur,
+    *,
+    kind: str,
+    item_id: int,
+    actor_user_id: int,
+    category: Optional[str],
+    created_at: Optional[str],
+) -> None:
+    row = (kind, int(item_id), int(actor_user_id), category, created_at)
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO feed_timeline (
+            user_id, kind, item_id, actor_user_id, category, created_at
+        )
+        SELECT ?, ?, ?, ?, ?, ?
+        UNION
+        SELECT followed_by_user_key, ?, ?, ?, ?, ?
+        FROM follow_info
+        WHERE user_followed_key = ?
+          AND (unfollowed IS NULL OR unfollowed = 0)
+        """,
+        (int(actor_user_id), *row, *row, int(actor_user_id)),
+    )
+    _log_event(cur, kind, item_id)
+    if int(item_id) % FEED_TIMELINE_TRIM_EVERY == 0:
+        trim_feed_timeline(cur, kind, item_id=int(item_id))
+
+
 ###############################################
 # Bulletin
 ###############################################
@@ -164,40 +682,81 @@ def add_bulletin_post(
         ),
     )
     bulletin_key = cur.lastrowid
+    if bulletin_key is not None:
+        _fan_out_feed_item(
+            cur,
+            kind="bulletin",
+            item_id=bulletin_key,
+            actor_user_id=created_by_user_id,
+            category=None,
+            created_at=created_at,
+        )
     conn.commit()
     conn.close()
     return int(bulletin_key) if bulletin_key is not None else None
 
 
-def get_bulletin_feed_for_user(user_id: int, limit: int = 15, offset: int = 0):
+def get_bulletin_feed_for_user(
+    user_id: int,
+    limit: int = 15,
+    offset: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+):
     conn = get_db_connection()
     cur = conn.cursor()
+    items = _select_bulletin_feed(
+        cur,
+        user_id,
+        limit=limit,
+        offset=offset,
+        start_after=start_after,
+        end_before=end_before,
+    )
+    conn.close()
+    return items
+
+
+def _select_bulletin_feed(
+    cur,
+    user_id: int,
+    *,
+    limit: int,
+    offset: int = 0,
+    after_id: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    keyset_sql, keyset_params, order, reverse = _keyset_page(
+        "ft.item_id", start_after=start_after, end_before=end_before
+    )
+    if keyset_sql:
+        keyset_sql = f" AND {keyset_sql} "
     cur.execute(
-        """
+        f"""
         SELECT
-            bulletin_key,
-            created_by,
-            title,
-            message,
-            created_at,
-            created_by_user_id,
-            type
-        FROM bulletin
-        WHERE created_by_user_id = ?
-           OR created_by_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-           )
-        ORDER BY bulletin_key DESC
+            b.bulletin_key,
+            b.created_by,
+            b.title,
+            b.message,
+            b.created_at,
+            b.created_by_user_id,
+            b.type
+        FROM feed_timeline ft
+        JOIN bulletin b ON b.bulletin_key = ft.item_id
+        WHERE ft.user_id = ?
+          AND ft.kind = 'bulletin'
+          AND ft.item_id > ?
+          {keyset_sql}
+        ORDER BY ft.item_id {order}
         LIMIT ?
         OFFSET ?
         """,
-        (int(user_id), int(user_id), int(limit), int(offset)),
+        (int(user_id), int(after_id), *keyset_params, int(limit), int(offset)),
     )
     rows = cur.fetchall()
-    conn.close()
+    if reverse:
+        rows.reverse()
 
     items = []
     for row in rows:
@@ -230,16 +789,11 @@ def count_bulletin_feed_for_user(user_id: int) -> int:
     cur.execute(
         """
         SELECT COUNT(1)
-        FROM bulletin
-        WHERE created_by_user_id = ?
-           OR created_by_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-           )
+        FROM feed_timeline
+        WHERE user_id = ?
+          AND kind = 'bulletin'
         """,
-        (int(user_id), int(user_id)),
+        (int(user_id),),
     )
     row = cur.fetchone()
     conn.close()
@@ -256,17 +810,12 @@ def get_bulletin_feed_sig_for_user(user_id: int) -> tuple[int, int]:
         """
         SELECT
             COUNT(1) AS c,
-            COALESCE(MAX(bulletin_key), 0) AS max_id
-        FROM bulletin
-        WHERE created_by_user_id = ?
-           OR created_by_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-           )
+            COALESCE(MAX(item_id), 0) AS max_id
+        FROM feed_timeline
+        WHERE user_id = ?
+          AND kind = 'bulletin'
         """,
-        (int(user_id), int(user_id)),
+        (int(user_id),),
     )
     row = cur.fetchone()
     conn.close()
@@ -345,6 +894,11 @@ def delete_bulletin_post(bulletin_key: int, user_id: int) -> bool:
         (int(bulletin_key), int(user_id)),
     )
     deleted = cur.rowcount or 0
+    if deleted:
+        cur.execute(
+            "DELETE FROM feed_timeline WHERE kind = 'bulletin' AND item_id = ?",
+            (int(bulletin_key),),
+        )
     conn.commit()
     conn.close()
     return deleted > 0
@@ -502,6 +1056,118 @@ def search_rated_subjects(
     return out
 
 
+def get_autocomplete_subjects(subject_ids=None) -> list[tuple]:
+    """(subject_id, type_key, name, artist, mbid, image_url, rating_count) rows.
+
+    All rated subjects, or just the given ones (missing ids have no ratings).
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    sql = """
+        SELECT subject_id, type_key, name, artist, mbid, image_url, rating_count
+        FROM subject_stats
+    """
+    if subject_ids is None:
+        cur.execute(sql)
+    else:
+        ids = [int(i) for i in subject_ids]
+        cur.execute(
+            f"{sql} WHERE subject_id IN ({','.join('?' * len(ids))})", tuple(ids)
+        )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def get_autocomplete_users(user_ids=None) -> list[tuple]:
+    """(user_id, username, profile_pic, rating_count) rows."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    sql = """
+        SELECT
+            ui.user_info_key,
+            ui.username,
+            ui.profile_pic,
+            (SELECT COUNT(1) FROM ratings r WHERE r.user_id = ui.user_info_key)
+        FROM user_info ui
+    """
+    if user_ids is None:
+        cur.execute(sql)
+    else:
+        ids = [int(i) for i in user_ids]
+        cur.execute(
+            f"{sql} WHERE ui.user_info_key IN ({','.join('?' * len(ids))})",
+            tuple(ids),
+        )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def get_autocomplete_signature() -> tuple[int, ...]:
+    """Changes whenever a rating or user is added or removed."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT
+            (SELECT COUNT(1) FROM ratings),
+            (SELECT COALESCE(MAX(rating_key), 0) FROM ratings),
+            (SELECT COUNT(1) FROM user_info),
+            (SELECT COALESCE(MAX(user_info_key), 0) FROM user_info)
+        """
+    )
+    row = cur.fetchone()
+    conn.close()
+    return tuple(int(v or 0) for v in row)
+
+
+_SUBJECT_STATS_COLUMNS = """
+    name,
+    artist,
+    mbid,
+    image_url,
+    rating_count,
+    user_count,
+    lyrics_sum, lyrics_count,
+    beat_sum, beat_count,
+    flow_sum, flow_count,
+    melody_sum, melody_count,
+    cohesive_sum, cohesive_count,
+    overall_avg
+"""
+
+
+def _subject_stats_row_to_dict(row: tuple) -> dict[str, Any]:
+    name, artist, mbid, image_url, rating_count, user_count = row[:6]
+    sums_counts = row[6:16]
+    overall_avg = row[16]
+
+    averages: list[float | None] = []
+    for total, count in zip(sums_counts[::2], sums_counts[1::2]):
+        averages.append(round(float(total or 0) / int(count), 2) if count else None)
+    r_lyrics, r_beat, r_flow, r_melody, r_cohesive = averages
+
+    overall_avg = round(float(overall_avg), 2) if overall_avg is not None else None
+    overall_pct = round(overall_avg * 10) if overall_avg is not None else None
+
+    return {
+        "name": name or "",
+        "artist": artist or "",
+        "rating_count": int(rating_count or 0),
+        "user_count": int(user_count or 0),
+        "overall_avg": overall_avg,
+        "overall_pct": int(overall_pct) if overall_pct is not None else None,
+        "avg_lyrics": r_lyrics,
+        "avg_beat": r_beat,
+        "avg_flow": r_flow,
+        "avg_melody": r_melody,
+        "avg_cohesive": r_cohesive,
+        "mbid": (mbid or "").strip() or None,
+        "image_url": (image_url or "").strip() or None,
+    }
+
+
 def get_top_rated_subjects(
     *,
     kind: str,
@@ -535,156 +1201,61 @@ def get_top_rated_subjects(
 
     conn = get_db_connection()
     cur = conn.cursor()
-
-    if kind == "artist":
-        cur.execute(
-            """
-            SELECT
-                rating_name,
-                '' AS artist,
-                COUNT(1) AS rating_count,
-                COUNT(DISTINCT LOWER(TRIM(user))) AS user_count,
-                AVG(CAST(lyrics_rating AS REAL)) AS avg_lyrics,
-                AVG(CAST(beat_rating AS REAL)) AS avg_beat,
-                AVG(CAST(flow_rating AS REAL)) AS avg_flow,
-                AVG(CAST(melody_rating AS REAL)) AS avg_melody,
-                AVG(CAST(cohesive_rating AS REAL)) AS avg_cohesive,
-                MAX(mbid) AS mbid,
-                MAX(image_url) AS image_url
-            FROM ratings
-            WHERE LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-            GROUP BY LOWER(TRIM(rating_name))
-            HAVING COUNT(1) >= ?
-            ORDER BY (
-                (COALESCE(AVG(CAST(lyrics_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(beat_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(flow_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(melody_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(cohesive_rating AS REAL)), 0))
-                / 5.0
-            ) DESC,
-            rating_count DESC,
-            rating_name COLLATE NOCASE ASC
-            LIMIT ?
-            OFFSET ?
-            """,
-            (rating_type, int(min_ratings), int(limit), int(offset)),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT
-                rating_name,
-                COALESCE(content_info_artist, '') AS artist,
-                COUNT(1) AS rating_count,
-                COUNT(DISTINCT LOWER(TRIM(user))) AS user_count,
-                AVG(CAST(lyrics_rating AS REAL)) AS avg_lyrics,
-                AVG(CAST(beat_rating AS REAL)) AS avg_beat,
-                AVG(CAST(flow_rating AS REAL)) AS avg_flow,
-                AVG(CAST(melody_rating AS REAL)) AS avg_melody,
-                AVG(CAST(cohesive_rating AS REAL)) AS avg_cohesive,
-                MAX(mbid) AS mbid,
-                MAX(image_url) AS image_url
-            FROM ratings
-            WHERE LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-            GROUP BY LOWER(TRIM(rating_name)), LOWER(TRIM(COALESCE(content_info_artist, '')))
-            HAVING COUNT(1) >= ?
-            ORDER BY (
-                (COALESCE(AVG(CAST(lyrics_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(beat_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(flow_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(melody_rating AS REAL)), 0)
-                 + COALESCE(AVG(CAST(cohesive_rating AS REAL)), 0))
-                / 5.0
-            ) DESC,
-            rating_count DESC,
-            rating_name COLLATE NOCASE ASC
-            LIMIT ?
-            OFFSET ?
-            """,
-            (rating_type, int(min_ratings), int(limit), int(offset)),
-        )
-
+    cur.execute(
+        f"""
+        SELECT {_SUBJECT_STATS_COLUMNS}
+        FROM subject_stats
+        WHERE type_key = ?
+          AND rating_count >= ?
+        ORDER BY overall_score DESC, rating_count DESC, name COLLATE NOCASE ASC
+        LIMIT ?
+        OFFSET ?
+        """,
+        (kind, int(min_ratings), int(limit), int(offset)),
+    )
     rows = cur.fetchall()
     conn.close()
 
-    def _round(v: Any) -> float | None:
-        try:
-            return round(float(v), 2) if v is not None else None
-        except (TypeError, ValueError):
-            return None
-
-    out: list[dict[str, Any]] = []
-    for (
-        name,
-        artist,
-        rating_count,
-        user_count,
-        avg_lyrics,
-        avg_beat,
-        avg_flow,
-        avg_melody,
-        avg_cohesive,
-        mbid,
-        image_url,
-    ) in (
-        rows or []
-    ):
-        r_lyrics = _round(avg_lyrics)
-        r_beat = _round(avg_beat)
-        r_flow = _round(avg_flow)
-        r_melody = _round(avg_melody)
-        r_cohesive = _round(avg_cohesive)
-
-        components = [
-            v for v in (r_lyrics, r_beat, r_flow, r_melody, r_cohesive) if v is not None
-        ]
-        overall_avg = (
-            round(sum(components) / len(components), 2) if components else None
-        )
-        overall_pct = round(overall_avg * 10) if overall_avg is not None else None
-
-        out.append(
-            {
-                "name": name or "",
-                "artist": artist or "",
-                "rating_count": int(rating_count or 0),
-                "user_count": int(user_count or 0),
-                "overall_avg": overall_avg,
-                "overall_pct": int(overall_pct) if overall_pct is not None else None,
-                "avg_lyrics": r_lyrics,
-                "avg_beat": r_beat,
-                "avg_flow": r_flow,
-                "avg_melody": r_melody,
-                "avg_cohesive": r_cohesive,
-                "mbid": (mbid or "").strip() or None,
-                "image_url": (image_url or "").strip() or None,
-            }
-        )
-    return out
+    return [_subject_stats_row_to_dict(row) for row in rows or []]
 
 
 # Get all ratings
-def get_ratings(limit: int = 500, offset: int = 0, order: str = "recent"):
+def get_ratings(
+    limit: int = 500,
+    offset: int = 0,
+    order: str = "recent",
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+):
     order = (order or "").strip().lower()
     if order not in {"recent", "oldest"}:
         order = "recent"
-    order_clause = "DESC" if order == "recent" else "ASC"
+    keyset_sql, keyset_params, order_clause, reverse = _keyset_page(
+        "r.rating_key",
+        descending=order == "recent",
+        start_after=start_after,
+        end_before=end_before,
+    )
+    where_sql = f"WHERE {keyset_sql}" if keyset_sql else ""
 
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
         f"""
-        SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        ORDER BY rating_key {order_clause}
+        SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        {where_sql}
+        ORDER BY r.rating_key {order_clause}
         LIMIT ?
         OFFSET ?
         """,
-        (int(limit), int(offset)),
+        (*keyset_params, int(limit), int(offset)),
     )
     rows = cur.fetchall()
     conn.close()
+    if reverse:
+        rows.reverse()
     return rows
 
 
@@ -693,6 +1264,8 @@ def get_ratings_by_type(
     limit: int = 500,
     offset: int = 0,
     order: str = "recent",
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
 ):
     rating_type = (rating_type or "").strip()
     if not rating_type:
@@ -701,23 +1274,34 @@ def get_ratings_by_type(
     order = (order or "").strip().lower()
     if order not in {"recent", "oldest"}:
         order = "recent"
-    order_clause = "DESC" if order == "recent" else "ASC"
+    keyset_sql, keyset_params, order_clause, reverse = _keyset_page(
+        "r.rating_key",
+        descending=order == "recent",
+        start_after=start_after,
+        end_before=end_before,
+    )
+    if keyset_sql:
+        keyset_sql = f"AND {keyset_sql}"
 
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
         f"""
-        SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        WHERE rating_type = ?
-        ORDER BY rating_key {order_clause}
+        SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        WHERE r.rating_type = ?
+          {keyset_sql}
+        ORDER BY r.rating_key {order_clause}
         LIMIT ?
         OFFSET ?
         """,
-        (rating_type, int(limit), int(offset)),
+        (rating_type, *keyset_params, int(limit), int(offset)),
     )
     rows = cur.fetchall()
     conn.close()
+    if reverse:
+        rows.reverse()
     return rows
 
 
@@ -770,8 +1354,29 @@ def get_rating_emojis_for_rating_keys(
     return out
 
 
-def _norm_key(s: str) -> str:
-    return " ".join((s or "").strip().lower().split())
+def _subject_id_for(
+    cur,
+    *,
+    rating_key: int | None,
+    mbid: str | None,
+    rating_type: str | None,
+    rating_name: str | None,
+    content_artist: str | None,
+) -> int | None:
+    if rating_key is not None:
+        cur.execute(
+            "SELECT subject_id FROM ratings WHERE rating_key = ?", (int(rating_key),)
+        )
+        row = cur.fetchone()
+        if row and row[0] is not None:
+            return int(row[0])
+    return find_subject_id(
+        cur,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+        mbid=mbid,
+    )
 
 
 def get_users_who_rated_same_subject(
@@ -793,42 +1398,20 @@ def get_users_who_rated_same_subject(
     rating_name = (rating_name or "").strip()
     content_artist = (content_artist or "").strip()
 
-    params: list[Any] = [int(exclude_rating_key)]
-    where = ""
-    if mbid:
-        where = """
-        WHERE r.rating_key != ?
-          AND (
-            r.mbid = ?
-            OR (
-              LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-              AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-              AND (
-                LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                OR TRIM(?) = ''
-                OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-              )
-            )
-          )
-        """
-        params.extend([mbid, rating_type, rating_name, content_artist, content_artist])
-    else:
-        where = """
-        WHERE r.rating_key != ?
-          AND LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-          AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-          AND (
-            LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-            OR TRIM(?) = ''
-            OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-          )
-        """
-        params.extend([rating_type, rating_name, content_artist, content_artist])
-
-    params.extend([int(limit), int(offset)])
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=exclude_rating_key,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return []
 
     cur.execute(
-        f"""
+        """
         SELECT
             ui.user_info_key,
             ui.username,
@@ -836,14 +1419,15 @@ def get_users_who_rated_same_subject(
             r.rating_key
         FROM ratings r
         JOIN user_info ui
-            ON LOWER(TRIM(ui.username)) = LOWER(TRIM(r.user))
-        {where}
+            ON ui.user_info_key = r.user_id
+        WHERE r.subject_id = ?
+          AND r.rating_key != ?
         GROUP BY ui.user_info_key, ui.username, ui.profile_pic, r.rating_key
         ORDER BY ui.username COLLATE NOCASE ASC
         LIMIT ?
         OFFSET ?
         """,
-        tuple(params),
+        (subject_id, int(exclude_rating_key), int(limit), int(offset)),
     )
     rows = cur.fetchall()
     conn.close()
@@ -886,62 +1470,42 @@ def get_ratings_for_subject(
         order = "recent"
     order_clause = "DESC" if order == "recent" else "ASC"
 
-    params: list[Any] = [int(exclude_rating_key)]
-    where = ""
-    if mbid:
-        where = """
-                WHERE rating_key != ?
-                    AND (
-                        mbid = ?
-                        OR (
-                            LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-                            AND LOWER(TRIM(rating_name)) = LOWER(TRIM(?))
-                            AND (
-                                LOWER(TRIM(COALESCE(content_info_artist, ''))) = LOWER(TRIM(?))
-                                OR TRIM(?) = ''
-                                OR TRIM(COALESCE(content_info_artist, '')) = ''
-                            )
-                        )
-                    )
-                """
-        params.extend([mbid, rating_type, rating_name, content_artist, content_artist])
-    else:
-        where = """
-                WHERE rating_key != ?
-                    AND LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-                    AND LOWER(TRIM(rating_name)) = LOWER(TRIM(?))
-                    AND (
-                        LOWER(TRIM(COALESCE(content_info_artist, ''))) = LOWER(TRIM(?))
-                        OR TRIM(?) = ''
-                        OR TRIM(COALESCE(content_info_artist, '')) = ''
-                    )
-                """
-        params.extend([rating_type, rating_name, content_artist, content_artist])
-
-    params.extend([int(limit), int(offset)])
-
     conn = get_db_connection()
     cur = conn.cursor()
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=exclude_rating_key,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return []
+
     cur.execute(
         f"""
                 SELECT
-                        rating_key,
-                        rating_type,
-                        rating_name,
-                        lyrics_rating,
-                        beat_rating,
-                        flow_rating,
-                        melody_rating,
-                        cohesive_rating,
-                        user,
-                        image_url
-                FROM ratings
-                {where}
-                ORDER BY rating_key {order_clause}
+                        r.rating_key,
+                        r.rating_type,
+                        r.rating_name,
+                        r.lyrics_rating,
+                        r.beat_rating,
+                        r.flow_rating,
+                        r.melody_rating,
+                        r.cohesive_rating,
+                        COALESCE(ui.username, r.user),
+                        r.image_url
+                FROM ratings r
+                LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+                WHERE r.subject_id = ?
+                    AND r.rating_key != ?
+                ORDER BY r.rating_key {order_clause}
                 LIMIT ?
                 OFFSET ?
                 """,
-        tuple(params),
+        (subject_id, int(exclude_rating_key), int(limit), int(offset)),
     )
     rows = cur.fetchall()
     conn.close()
@@ -1043,9 +1607,10 @@ def get_ratings_for_artist_including_works(
             flow_rating,
             melody_rating,
             cohesive_rating,
-            user,
+            COALESCE(ui.username, r.user),
             image_url
-        FROM ratings
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
         WHERE {where_sql}
         ORDER BY rating_key {order_clause}
         LIMIT ?
@@ -1074,57 +1639,27 @@ def count_users_who_rated_same_subject(
     rating_name = (rating_name or "").strip()
     content_artist = (content_artist or "").strip()
 
-    params: list[Any] = [int(exclude_rating_key)]
-    if mbid:
-        cur.execute(
-            """
-            SELECT COUNT(DISTINCT LOWER(TRIM(r.user)))
-            FROM ratings r
-            WHERE r.rating_key != ?
-              AND (
-                r.mbid = ?
-                OR (
-                  LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-                  AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-                  AND (
-                    LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                    OR TRIM(?) = ''
-                    OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-                  )
-                )
-              )
-            """,
-            (
-                int(exclude_rating_key),
-                mbid,
-                rating_type,
-                rating_name,
-                content_artist,
-                content_artist,
-            ),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT COUNT(DISTINCT LOWER(TRIM(r.user)))
-            FROM ratings r
-            WHERE r.rating_key != ?
-              AND LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-              AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-              AND (
-                LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                OR TRIM(?) = ''
-                OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-              )
-            """,
-            (
-                int(exclude_rating_key),
-                rating_type,
-                rating_name,
-                content_artist,
-                content_artist,
-            ),
-        )
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=exclude_rating_key,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return 0
+
+    cur.execute(
+        """
+        SELECT COUNT(DISTINCT r.user_id)
+        FROM ratings r
+        WHERE r.subject_id = ?
+          AND r.rating_key != ?
+        """,
+        (subject_id, int(exclude_rating_key)),
+    )
 
     row = cur.fetchone()
     conn.close()
@@ -1166,34 +1701,19 @@ def get_subject_activity_timeseries(
     conn = get_db_connection()
     cur = conn.cursor()
 
-    params: list[Any] = []
-    subj_where = ""
-    if mbid:
-        subj_where = """
-            (r.mbid = ?)
-            OR (
-                LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-                AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-                AND (
-                    LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                    OR TRIM(?) = ''
-                    OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-                )
-            )
-        """
-        params.extend([mbid, rating_type, rating_name, content_artist, content_artist])
-    else:
-        subj_where = """
-            LOWER(TRIM(r.rating_type)) = LOWER(TRIM(?))
-            AND LOWER(TRIM(r.rating_name)) = LOWER(TRIM(?))
-            AND (
-                LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                OR TRIM(?) = ''
-                OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-            )
-        """
-        params.extend([rating_type, rating_name, content_artist, content_artist])
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=None,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return []
 
+    params: list[Any] = [subject_id]
     cutoff_sql = ""
     if cutoff_iso:
         cutoff_sql = " AND a.created_at >= ? "
@@ -1211,7 +1731,7 @@ def get_subject_activity_timeseries(
         WHERE a.action = ?
           AND a.entity_type = 'rating'
           AND a.created_at IS NOT NULL
-          AND ({subj_where})
+          AND r.subject_id = ?
           {cutoff_sql}
         GROUP BY day
         ORDER BY day ASC
@@ -1248,100 +1768,50 @@ def get_subject_overall_summary(
     if not rating_type or not rating_name:
         return None
 
-    params: list[Any] = []
-    where = ""
-    if mbid:
-        where = """
-        (
-          mbid = ?
-          OR (
-            LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-            AND LOWER(TRIM(rating_name)) = LOWER(TRIM(?))
-            AND (
-              LOWER(TRIM(COALESCE(content_info_artist, ''))) = LOWER(TRIM(?))
-              OR TRIM(?) = ''
-              OR TRIM(COALESCE(content_info_artist, '')) = ''
-            )
-          )
-        )
-        """
-        params.extend([mbid, rating_type, rating_name, content_artist, content_artist])
-    else:
-        where = """
-        LOWER(TRIM(rating_type)) = LOWER(TRIM(?))
-        AND LOWER(TRIM(rating_name)) = LOWER(TRIM(?))
-        AND (
-          LOWER(TRIM(COALESCE(content_info_artist, ''))) = LOWER(TRIM(?))
-          OR TRIM(?) = ''
-          OR TRIM(COALESCE(content_info_artist, '')) = ''
-        )
-        """
-        params.extend([rating_type, rating_name, content_artist, content_artist])
-
     conn = get_db_connection()
     cur = conn.cursor()
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=None,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return None
+
     cur.execute(
         f"""
-        SELECT
-          COUNT(1) AS rating_count,
-          COUNT(DISTINCT LOWER(TRIM(user))) AS user_count,
-          AVG(CAST(lyrics_rating AS REAL)) AS avg_lyrics,
-          AVG(CAST(beat_rating AS REAL)) AS avg_beat,
-          AVG(CAST(flow_rating AS REAL)) AS avg_flow,
-          AVG(CAST(melody_rating AS REAL)) AS avg_melody,
-          AVG(CAST(cohesive_rating AS REAL)) AS avg_cohesive,
-          MAX(image_url) AS image_url
-        FROM ratings
-        WHERE {where}
+        SELECT {_SUBJECT_STATS_COLUMNS}
+        FROM subject_stats
+        WHERE subject_id = ?
         """,
-        tuple(params),
+        (subject_id,),
     )
     row = cur.fetchone()
     conn.close()
     if not row:
         return None
 
-    (
-        rating_count,
-        user_count,
-        avg_lyrics,
-        avg_beat,
-        avg_flow,
-        avg_melody,
-        avg_cohesive,
-        image_url,
-    ) = row
-
-    if not rating_count:
+    stats = _subject_stats_row_to_dict(row)
+    if not stats["rating_count"]:
         return None
 
-    def _round(v):
-        try:
-            return round(float(v), 2) if v is not None else None
-        except (TypeError, ValueError):
-            return None
-
-    r_lyrics = _round(avg_lyrics)
-    r_beat = _round(avg_beat)
-    r_flow = _round(avg_flow)
-    r_melody = _round(avg_melody)
-    r_cohesive = _round(avg_cohesive)
-
-    components = [
-        v for v in (r_lyrics, r_beat, r_flow, r_melody, r_cohesive) if v is not None
-    ]
-    overall_avg = round(sum(components) / len(components), 2) if components else None
-
     return {
-        "rating_count": int(rating_count or 0),
-        "user_count": int(user_count or 0),
-        "overall_avg": overall_avg,
-        "avg_lyrics": r_lyrics,
-        "avg_beat": r_beat,
-        "avg_flow": r_flow,
-        "avg_melody": r_melody,
-        "avg_cohesive": r_cohesive,
-        "image_url": (image_url or "").strip() or None,
+        key: stats[key]
+        for key in (
+            "rating_count",
+            "user_count",
+            "overall_avg",
+            "avg_lyrics",
+            "avg_beat",
+            "avg_flow",
+            "avg_melody",
+            "avg_cohesive",
+            "image_url",
+        )
     }
 
 
@@ -1349,12 +1819,29 @@ def get_subject_overall_summary(
 def get_rating_owner(rating_key):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT user FROM ratings WHERE rating_key = ?", (rating_key,))
+    cur.execute(
+        """
+        SELECT COALESCE(ui.username, r.user)
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        WHERE r.rating_key = ?
+        """,
+        (rating_key,),
+    )
     row = cur.fetchone()
     conn.close()
     return row[0] if row else None
 
 
+def get_rating_owner_id(rating_key) -> int | None:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT user_id FROM ratings WHERE rating_key = ?", (rating_key,))
+    row = cur.fetchone()
+    conn.close()
+    return int(row[0]) if row and row[0] is not None else None
+
+
 def get_rating_comments(rating_key: int) -> list[dict[str, Any]]:
     conn = get_db_connection()
     cur = conn.cursor()
@@ -1499,6 +1986,7 @@ def add_rating(
     content_artist: str | None = None,
     extra_link: str | None = None,
     extra_info: str | None = None,
+    user_id: int | None = None,
 ):
     rating_emoji = (rating_emoji or "").strip()
     if rating_emoji:
@@ -1508,8 +1996,19 @@ def add_rating(
 
     conn = get_db_connection()
     cur = conn.cursor()
+    if user_id is None:
+        cur.execute("SELECT user_info_key FROM user_info WHERE username = ?", (user,))
+        row = cur.fetchone()
+        user_id = int(row[0]) if row else None
+    subject_id = resolve_subject_id(
+        cur,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=(content_artist or "").strip()[:50],
+        mbid=mbid,
+    )
     cur.execute(
-        "INSERT INTO ratings (rating_type, rating_name, rating_emoji, lyrics_rating,lyrics_reason, beat_rating, beat_reason, flow_rating, flow_reason, melody_rating, melody_reason, cohesive_rating, cohesive_reason, user, image_url, mbid, mb_url, content_info_artist, extra_link, extra_info) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        "INSERT INTO ratings (rating_type, rating_name, rating_emoji, lyrics_rating,lyrics_reason, beat_rating, beat_reason, flow_rating, flow_reason, melody_rating, melody_reason, cohesive_rating, cohesive_reason, user, image_url, mbid, mb_url, content_info_artist, extra_link, extra_info, subject_id, user_id) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
         (
             rating_type,
             rating_name,
@@ -1531,11 +2030,17 @@ def add_rating(
             ((content_artist or "").strip()[:50]) or None,
             (extra_link or "").strip()[:1000] or None,
             (extra_info or "").strip()[:4000] or None,
+            subject_id,
+            user_id,
         ),
     )
     rating_key = cur.lastrowid
+    refresh_subject_stats(
+        cur, subject_id, rated_at=datetime.now(timezone.utc).isoformat()
+    )
     conn.commit()
     conn.close()
+    _notify_change(subject_ids=[subject_id], user_ids=[user_id])
     return int(rating_key) if rating_key is not None else None
 
 
@@ -1556,71 +2061,108 @@ def add_activity(
     created_at: Optional[str] = None,
     metadata: Optional[dict[str, Any]] = None,
 ):
+    """Queue an activity row; _activity_writer inserts it shortly after."""
     actor_username = (actor_username or "").strip()
     action = (action or "").strip()
     if not actor_user_id or not actor_username or not action:
         return
 
-    created_at = created_at or datetime.now(timezone.utc).isoformat()
-    category = (category or "").strip().lower() or None
-    entity_type = (entity_type or "").strip().lower() or None
-    entity_label = (entity_label or "").strip() or None
-    url = (url or "").strip() or None
-    metadata_json = json.dumps(metadata) if metadata else None
-
-    if action.endswith("_view") and entity_type and entity_id is not None:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT 1
-            FROM activity
-            WHERE actor_user_id = ?
-              AND action = ?
-              AND entity_type = ?
-              AND entity_id = ?
-            LIMIT 1
-            """,
-            (int(actor_user_id), action, entity_type, int(entity_id)),
-        )
-        exists = cur.fetchone() is not None
-        conn.close()
-        if exists:
-            return
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO activity (
-            actor_user_id,
-            actor_username,
-            action,
-            category,
-            entity_type,
-            entity_id,
-            entity_label,
-            url,
-            created_at,
-            metadata
-        )
-        VALUES (?,?,?,?,?,?,?,?,?,?)
-        """,
+    _activity_writer.put(
         (
             int(actor_user_id),
             actor_username,
             action,
-            category,
-            entity_type,
+            (category or "").strip().lower() or None,
+            (entity_type or "").strip().lower() or None,
             int(entity_id) if entity_id is not None else None,
-            entity_label,
-            url,
-            created_at,
-            metadata_json,
-        ),
+            (entity_label or "").strip() or None,
+            (url or "").strip() or None,
+            created_at or datetime.now(timezone.utc).isoformat(),
+            json.dumps(metadata) if metadata else None,
+        )
     )
-    conn.commit()
-    conn.close()
+
+
+def _write_activity_batch(rows) -> None:
+    # One transaction per batch. *_view actions are recorded once per
+    # actor/entity, so they are checked against the table and the batch.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        seen_views = set()
+        for row in rows:
+            actor_user_id, _, action, category, entity_type, entity_id = row[:6]
+            created_at = row[8]
+            if action.endswith("_view") and entity_type and entity_id is not None:
+                view_key = (actor_user_id, action, entity_type, entity_id)
+                if view_key in seen_views:
+                    continue
+                seen_views.add(view_key)
+                cur.execute(
+                    """
+                    SELECT 1
+                    FROM activity
+                    WHERE actor_user_id = ?
+                      AND action = ?
+                      AND entity_type = ?
+                      AND entity_id = ?
+                    LIMIT 1
+                    """,
+                    view_key,
+                )
+                if cur.fetchone() is not None:
+                    continue
+            cur.execute(
+                """
+                INSERT INTO activity (
+                    actor_user_id,
+                    actor_username,
+                    action,
+                    category,
+                    entity_type,
+                    entity_id,
+                    entity_label,
+                    url,
+                    created_at,
+                    metadata
+                )
+                VALUES (?,?,?,?,?,?,?,?,?,?)
+                """,
+                row,
+            )
+            _fan_out_feed_item(
+                cur,
+                kind="activity",
+                item_id=cur.lastrowid,
+                actor_user_id=actor_user_id,
+                category=category,
+                created_at=created_at,
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+_activity_writer = BatchWriter(
+    "activity",
+    _write_activity_batch,
+    interval=ACTIVITY_FLUSH_INTERVAL_SECONDS,
+    batch_size=ACTIVITY_BATCH_SIZE,
+    maxsize=ACTIVITY_QUEUE_MAX,
+)
+
+
+def flush_activity() -> None:
+    """Write any buffered activity rows now (CLI commands, shutdown)."""
+    _activity_writer.flush()
+
+
+def get_activity_writer_stats() -> dict[str, Any]:
+    return _activity_writer.stats()
 
 
 def activity_exists(
@@ -1659,63 +2201,85 @@ def get_activity_feed_for_user(
     limit: int = 30,
     category: Optional[str] = None,
     offset: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
 ):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    items = _select_activity_feed(
+        cur,
+        user_id,
+        limit=limit,
+        category=category,
+        offset=offset,
+        start_after=start_after,
+        end_before=end_before,
+    )
+    conn.close()
+    return items
+
+
+def _select_activity_feed(
+    cur,
+    user_id: int,
+    *,
+    limit: int,
+    category: Optional[str] = None,
+    offset: int = 0,
+    after_id: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+) -> list[dict[str, Any]]:
     category = (category or "").strip().lower() or None
-    params: list[Any] = [int(user_id), int(user_id)]
+    params: list[Any] = [int(user_id), int(after_id)]
     where_category = ""
     if category and category != "all":
-        where_category = " AND (category = ?) "
+        where_category = " AND ft.category = ? "
         params.append(category)
-
-    cleared_at = _get_activity_cleared_at(int(user_id), category)
-    where_cleared = ""
-    if cleared_at:
-        where_cleared = " AND (created_at IS NOT NULL AND created_at > ?) "
-        params.append(cleared_at)
-
-    where_dismissed = " AND activity_id NOT IN (SELECT activity_id FROM activity_dismissed WHERE user_id = ?) "
-    params.append(int(user_id))
+    cleared_sql, cleared_params = _activity_category_cleared_sql(
+        cur, user_id, category, "ft.created_at"
+    )
+    where_category += cleared_sql
+    params.extend(cleared_params)
+    keyset_sql, keyset_params, order, reverse = _keyset_page(
+        "ft.item_id", start_after=start_after, end_before=end_before
+    )
+    if keyset_sql:
+        where_category += f" AND {keyset_sql} "
+        params.extend(keyset_params)
 
     params.append(int(limit))
     params.append(int(offset))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     cur.execute(
         f"""
         SELECT
-            activity_id,
-            actor_user_id,
-            actor_username,
-            action,
-            category,
-            entity_type,
-            entity_id,
-            entity_label,
-            url,
-            created_at,
-            metadata
-        FROM activity
-        WHERE (
-            actor_user_id = ?
-            OR actor_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-            )
-        )
+            a.activity_id,
+            a.actor_user_id,
+            a.actor_username,
+            a.action,
+            a.category,
+            a.entity_type,
+            a.entity_id,
+            a.entity_label,
+            a.url,
+            a.created_at,
+            a.metadata
+        FROM feed_timeline ft
+        JOIN activity a ON a.activity_id = ft.item_id
+        WHERE ft.user_id = ?
+          AND ft.kind = 'activity'
+          AND ft.item_id > ?
         {where_category}
-        {where_cleared}
-        {where_dismissed}
-        ORDER BY activity_id DESC
+        ORDER BY ft.item_id {order}
         LIMIT ?
         OFFSET ?
         """,
         tuple(params),
     )
     rows = cur.fetchall()
-    conn.close()
+    if reverse:
+        rows.reverse()
 
     items = []
     for row in rows:
@@ -1758,39 +2322,26 @@ def get_activity_feed_for_user(
 
 def count_activity_feed_for_user(user_id: int, category: Optional[str] = None) -> int:
     category = (category or "").strip().lower() or None
-    params: list[Any] = [int(user_id), int(user_id)]
+    params: list[Any] = [int(user_id)]
     where_category = ""
     if category and category != "all":
-        where_category = " AND (category = ?) "
+        where_category = " AND category = ? "
         params.append(category)
 
-    cleared_at = _get_activity_cleared_at(int(user_id), category)
-    where_cleared = ""
-    if cleared_at:
-        where_cleared = " AND (created_at IS NOT NULL AND created_at > ?) "
-        params.append(cleared_at)
-
-    where_dismissed = " AND activity_id NOT IN (SELECT activity_id FROM activity_dismissed WHERE user_id = ?) "
-    params.append(int(user_id))
-
     conn = get_db_connection()
     cur = conn.cursor()
+    cleared_sql, cleared_params = _activity_category_cleared_sql(
+        cur, user_id, category, "created_at"
+    )
+    where_category += cleared_sql
+    params.extend(cleared_params)
     cur.execute(
         f"""
         SELECT COUNT(1)
-        FROM activity
-        WHERE (
-            actor_user_id = ?
-            OR actor_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-            )
-        )
+        FROM feed_timeline
+        WHERE user_id = ?
+          AND kind = 'activity'
         {where_category}
-        {where_cleared}
-        {where_dismissed}
         """,
         tuple(params),
     )
@@ -1807,41 +2358,30 @@ def get_activity_feed_sig_for_user(
 ) -> tuple[int, int, Optional[str]]:
 
     category = (category or "").strip().lower() or None
-    params: list[Any] = [int(user_id), int(user_id)]
+    params: list[Any] = [int(user_id)]
     where_category = ""
     if category and category != "all":
-        where_category = " AND (category = ?) "
+        where_category = " AND category = ? "
         params.append(category)
 
     cleared_at = _get_activity_cleared_at(int(user_id), category)
-    where_cleared = ""
-    if cleared_at:
-        where_cleared = " AND (created_at IS NOT NULL AND created_at > ?) "
-        params.append(cleared_at)
-
-    where_dismissed = " AND activity_id NOT IN (SELECT activity_id FROM activity_dismissed WHERE user_id = ?) "
-    params.append(int(user_id))
 
     conn = get_db_connection()
     cur = conn.cursor()
+    cleared_sql, cleared_params = _activity_category_cleared_sql(
+        cur, user_id, category, "created_at"
+    )
+    where_category += cleared_sql
+    params.extend(cleared_params)
     cur.execute(
         f"""
         SELECT
             COUNT(1) AS c,
-            COALESCE(MAX(activity_id), 0) AS max_id
-        FROM activity
-        WHERE (
-            actor_user_id = ?
-            OR actor_user_id IN (
-                SELECT user_followed_key
-                FROM follow_info
-                WHERE followed_by_user_key = ?
-                  AND (unfollowed IS NULL OR unfollowed = 0)
-            )
-        )
+            COALESCE(MAX(item_id), 0) AS max_id
+        FROM feed_timeline
+        WHERE user_id = ?
+          AND kind = 'activity'
         {where_category}
-        {where_cleared}
-        {where_dismissed}
         """,
         tuple(params),
     )
@@ -1870,6 +2410,13 @@ def dismiss_activity_for_user(user_id: int, activity_id: int) -> None:
         """,
         (int(user_id), int(activity_id), datetime.now(timezone.utc).isoformat()),
     )
+    cur.execute(
+        """
+        DELETE FROM feed_timeline
+        WHERE user_id = ? AND kind = 'activity' AND item_id = ?
+        """,
+        (int(user_id), int(activity_id)),
+    )
     conn.commit()
     conn.close()
 
@@ -1878,6 +2425,7 @@ def clear_activity_for_user(user_id: int, category: Optional[str] = None) -> Non
     if not user_id:
         return
     category_key = (category or "").strip().lower() or "all"
+    cleared_at = datetime.now(timezone.utc).isoformat()
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
@@ -1885,12 +2433,41 @@ def clear_activity_for_user(user_id: int, category: Optional[str] = None) -> Non
         INSERT OR REPLACE INTO activity_clear (user_id, category, cleared_at)
         VALUES (?,?,?)
         """,
-        (int(user_id), category_key, datetime.now(timezone.utc).isoformat()),
+        (int(user_id), category_key, cleared_at),
     )
+    if category_key == "all":
+        # Clearing everything hides the rows in every view, so they can go.
+        # A category clear only hides them in that category's view and is
+        # applied when reading (_activity_category_cleared_sql).
+        cur.execute(
+            """
+            DELETE FROM feed_timeline
+            WHERE user_id = ?
+              AND kind = 'activity'
+              AND (created_at IS NULL OR created_at <= ?)
+            """,
+            (int(user_id), cleared_at),
+        )
     conn.commit()
     conn.close()
 
 
+def _activity_category_cleared_sql(
+    cur, user_id: int, category: Optional[str], column: str
+) -> tuple[str, list[Any]]:
+    """Filter hiding what the user cleared in this category's view, if any."""
+    if not category or category == "all":
+        return "", []
+    cur.execute(
+        "SELECT cleared_at FROM activity_clear WHERE user_id = ? AND category = ?",
+        (int(user_id), category),
+    )
+    row = cur.fetchone()
+    if not row or not row[0]:
+        return "", []
+    return f" AND ({column} IS NOT NULL AND {column} > ?) ", [row[0]]
+
+
 def _get_activity_cleared_at(
     user_id: int, category: Optional[str] = None
 ) -> Optional[str]:
@@ -1947,7 +2524,19 @@ def update_rating(
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
-        "UPDATE ratings SET rating_type = ?, rating_name = ?, lyrics_rating = ?, lyrics_reason = ?, beat_rating = ?, beat_reason = ?, flow_rating = ?, flow_reason = ?, melody_rating = ?, melody_reason = ?, cohesive_rating = ?, cohesive_reason = ?, image_url = ?, mbid = ?, mb_url = ?, content_info_artist = ?, extra_link = ?, extra_info = ? WHERE rating_key = ?",
+        "SELECT subject_id FROM ratings WHERE rating_key = ?", (int(rating_key),)
+    )
+    row = cur.fetchone()
+    old_subject_id = row[0] if row else None
+    subject_id = resolve_subject_id(
+        cur,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=(content_artist or "").strip()[:50],
+        mbid=mbid,
+    )
+    cur.execute(
+        "UPDATE ratings SET rating_type = ?, rating_name = ?, lyrics_rating = ?, lyrics_reason = ?, beat_rating = ?, beat_reason = ?, flow_rating = ?, flow_reason = ?, melody_rating = ?, melody_reason = ?, cohesive_rating = ?, cohesive_reason = ?, image_url = ?, mbid = ?, mb_url = ?, content_info_artist = ?, extra_link = ?, extra_info = ?, subject_id = ? WHERE rating_key = ?",
         (
             rating_type,
             rating_name,
@@ -1967,11 +2556,18 @@ def update_rating(
             ((content_artist or "").strip()[:50]) or None,
             (extra_link or "").strip()[:1000] or None,
             (extra_info or "").strip()[:4000] or None,
+            subject_id,
             int(rating_key),
         ),
     )
+    refresh_subject_stats(
+        cur, subject_id, rated_at=datetime.now(timezone.utc).isoformat()
+    )
+    if old_subject_id is not None and old_subject_id != subject_id:
+        refresh_subject_stats(cur, old_subject_id)
     conn.commit()
     conn.close()
+    _notify_change(subject_ids=[subject_id, old_subject_id])
 
 
 def get_rating_extras_by_key(rating_key: int) -> tuple[str | None, str | None]:
@@ -1999,12 +2595,19 @@ def get_rating_extras_by_key(rating_key: int) -> tuple[str | None, str | None]:
 def delete_rating(rating_key):
     conn = get_db_connection()
     cur = conn.cursor()
+    cur.execute(
+        "SELECT subject_id, user_id FROM ratings WHERE rating_key = ?", (rating_key,)
+    )
+    row = cur.fetchone()
+    subject_id, user_id = row if row else (None, None)
     cur.execute("DELETE FROM rating_comments WHERE rating_key = ?", (rating_key,))
     cur.execute("DELETE FROM rating_likes WHERE rating_key = ?", (rating_key,))
     cur.execute("DELETE FROM rating_category_votes WHERE rating_key = ?", (rating_key,))
     cur.execute("DELETE FROM ratings WHERE rating_key = ?", (rating_key,))
+    refresh_subject_stats(cur, subject_id)
     conn.commit()
     conn.close()
+    _notify_change(subject_ids=[subject_id], user_ids=[user_id])
 
 
 ###############################################
@@ -2095,11 +2698,13 @@ def get_liked_ratings_for_user(user_id: int, limit: int = 200, offset: int = 0):
             r.flow_rating,
             r.melody_rating,
             r.cohesive_rating,
-            r.user,
+            COALESCE(ui.username, r.user),
             r.image_url
         FROM rating_likes rl
         JOIN ratings r
             ON r.rating_key = rl.rating_key
+        LEFT JOIN user_info ui
+            ON ui.user_info_key = r.user_id
         WHERE rl.user_id = ?
         ORDER BY rl.rating_like_id DESC
         LIMIT ?
@@ -2126,7 +2731,7 @@ def get_upvoted_ratings_for_user(user_id: int, limit: int = 200, offset: int = 0
             r.flow_rating,
             r.melody_rating,
             r.cohesive_rating,
-            r.user,
+            COALESCE(ui.username, r.user),
             r.lyrics_reason,
             r.beat_reason,
             r.flow_reason,
@@ -2135,6 +2740,8 @@ def get_upvoted_ratings_for_user(user_id: int, limit: int = 200, offset: int = 0
         FROM rating_category_votes rcv
         JOIN ratings r
             ON r.rating_key = rcv.rating_key
+        LEFT JOIN user_info ui
+            ON ui.user_info_key = r.user_id
         WHERE rcv.user_id = ?
           AND rcv.vote = 1
         GROUP BY r.rating_key
@@ -2513,8 +3120,7 @@ def get_subject_rating_emoji_counts_for_rating_keys(
     rating_keys: list[int],
 ) -> dict[int, list[tuple[str, int]]]:
     """For each rating_key in the list, return emoji counts across ALL ratings
-    that refer to the same subject (same MBID when present, otherwise fallback
-    to type+name+artist matching similar to subject pages).
+    that refer to the same subject (same ratings.subject_id).
 
     Returns: {rating_key: [(emoji, count), ...]}
     """
@@ -2530,37 +3136,17 @@ def get_subject_rating_emoji_counts_for_rating_keys(
     cur = conn.cursor()
     cur.execute(
         f"""
-        WITH subjects AS (
-            SELECT
-                rating_key AS list_rk,
-                COALESCE(TRIM(mbid), '') AS mbid,
-                COALESCE(TRIM(rating_type), '') AS rating_type,
-                COALESCE(TRIM(rating_name), '') AS rating_name,
-                COALESCE(TRIM(content_info_artist), '') AS artist
-            FROM ratings
-            WHERE rating_key IN ({placeholders})
-        )
         SELECT
-            s.list_rk,
+            s.rating_key,
             rr.rating_emoji,
             COUNT(1) AS c
-        FROM subjects s
+        FROM ratings s
         JOIN ratings rr
-            ON (
-                (s.mbid != '' AND COALESCE(TRIM(rr.mbid), '') = s.mbid)
-                OR (
-                    LOWER(TRIM(COALESCE(rr.rating_type, ''))) = LOWER(TRIM(s.rating_type))
-                    AND LOWER(TRIM(COALESCE(rr.rating_name, ''))) = LOWER(TRIM(s.rating_name))
-                    AND (
-                        LOWER(TRIM(COALESCE(rr.content_info_artist, ''))) = LOWER(TRIM(s.artist))
-                        OR TRIM(s.artist) = ''
-                        OR TRIM(COALESCE(rr.content_info_artist, '')) = ''
-                    )
-                )
-            )
-        WHERE rr.rating_emoji IS NOT NULL
+            ON rr.subject_id = s.subject_id
+        WHERE s.rating_key IN ({placeholders})
+          AND rr.rating_emoji IS NOT NULL
           AND TRIM(rr.rating_emoji) != ''
-        GROUP BY s.list_rk, rr.rating_emoji
+        GROUP BY s.rating_key, rr.rating_emoji
         """,
         tuple(keys),
     )
@@ -2603,48 +3189,39 @@ def get_top_subject_rating_emojis(
         return []
 
     try:
-        n = int(limit)
-    except (TypeError, ValueError):
-        n = 3
-    n = max(1, min(10, n))
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    if mbid:
-        cur.execute(
-            """
-            SELECT rating_emoji, COUNT(1) AS c
-            FROM ratings
-            WHERE TRIM(COALESCE(mbid, '')) = ?
-              AND rating_emoji IS NOT NULL
-              AND TRIM(rating_emoji) != ''
-            GROUP BY rating_emoji
-            ORDER BY c DESC, rating_emoji ASC
-            LIMIT ?
-            """,
-            (mbid, n),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT r.rating_emoji, COUNT(1) AS c
-            FROM ratings r
-            WHERE LOWER(TRIM(COALESCE(r.rating_type, ''))) = LOWER(TRIM(?))
-              AND LOWER(TRIM(COALESCE(r.rating_name, ''))) = LOWER(TRIM(?))
-              AND (
-                LOWER(TRIM(COALESCE(r.content_info_artist, ''))) = LOWER(TRIM(?))
-                OR TRIM(?) = ''
-                OR TRIM(COALESCE(r.content_info_artist, '')) = ''
-              )
-              AND r.rating_emoji IS NOT NULL
-              AND TRIM(r.rating_emoji) != ''
-            GROUP BY r.rating_emoji
-            ORDER BY c DESC, r.rating_emoji ASC
-            LIMIT ?
-            """,
-            (rating_type, rating_name, content_artist, content_artist, n),
-        )
+        n = int(limit)
+    except (TypeError, ValueError):
+        n = 3
+    n = max(1, min(10, n))
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    subject_id = _subject_id_for(
+        cur,
+        rating_key=None,
+        mbid=mbid,
+        rating_type=rating_type,
+        rating_name=rating_name,
+        content_artist=content_artist,
+    )
+    if subject_id is None:
+        conn.close()
+        return []
+
+    cur.execute(
+        """
+        SELECT rating_emoji, COUNT(1) AS c
+        FROM ratings
+        WHERE subject_id = ?
+          AND rating_emoji IS NOT NULL
+          AND TRIM(rating_emoji) != ''
+        GROUP BY rating_emoji
+        ORDER BY c DESC, rating_emoji ASC
+        LIMIT ?
+        """,
+        (subject_id, n),
+    )
 
     rows = cur.fetchall()
     conn.close()
@@ -2989,18 +3566,32 @@ def search_songs(query: str, limit: int = 30):
         return []
     conn = get_db_connection()
     cur = conn.cursor()
-    pattern = _search_pattern(query)
-    cur.execute(
-        """
-        SELECT song_key, song_title, artist_name, artist_link, song_link
-        FROM song
-        WHERE song_title LIKE ? COLLATE NOCASE
-           OR artist_name LIKE ? COLLATE NOCASE
-        ORDER BY song_key DESC
-        LIMIT ?
-        """,
-        (pattern, pattern, int(limit)),
-    )
+    match = _fts_match(query)
+    if match:
+        cur.execute(
+            """
+            SELECT s.song_key, s.song_title, s.artist_name, s.artist_link, s.song_link
+            FROM songs_fts
+            JOIN song s ON s.song_key = songs_fts.rowid
+            WHERE songs_fts MATCH ?
+            ORDER BY bm25(songs_fts, 2.0, 1.0), s.song_key DESC
+            LIMIT ?
+            """,
+            (match, int(limit)),
+        )
+    else:
+        pattern = _search_pattern(query)
+        cur.execute(
+            """
+            SELECT song_key, song_title, artist_name, artist_link, song_link
+            FROM song
+            WHERE song_title LIKE ? COLLATE NOCASE
+               OR artist_name LIKE ? COLLATE NOCASE
+            ORDER BY song_key DESC
+            LIMIT ?
+            """,
+            (pattern, pattern, int(limit)),
+        )
     rows = cur.fetchall()
     conn.close()
     return rows
@@ -3091,29 +3682,63 @@ def get_user_by_username(username):
     return _row_to_user(row)
 
 
+def _search_tokens(query):
+    return [token for token in re.split(r"[\s\W_]+", query.strip()) if token]
+
+
 def _search_pattern(query):
-    tokens = [token for token in re.split(r"[\s\W_]+", query.strip()) if token]
+    tokens = _search_tokens(query)
     return "%" + "%".join(tokens) + "%" if tokens else ""
 
 
+def _fts_match(query, column: str | None = None) -> str | None:
+    """FTS5 MATCH expression for `query`, or None to fall back to LIKE.
+
+    Every token must appear as a substring (in any order); a token shorter
+    than a trigram cannot be looked up, so such queries use LIKE instead.
+    """
+    tokens = _search_tokens(query)
+    if not FTS5_AVAILABLE or not tokens:
+        return None
+    if any(len(token) < FTS_MIN_TOKEN_LENGTH for token in tokens):
+        return None
+    match = " ".join(f'"{token}"' for token in tokens)
+    return f"{column} : ({match})" if column else match
+
+
 def search_users_by_username(query, limit: int = 20, offset: int = 0):
     query = (query or "").strip()
     if not query:
         return []
     conn = get_db_connection()
     cur = conn.cursor()
-    pattern = _search_pattern(query)
-    cur.execute(
-        """
-        SELECT user_info_key, username, profile_pic
-        FROM user_info
-        WHERE username LIKE ? COLLATE NOCASE
-        ORDER BY username COLLATE NOCASE ASC
-        LIMIT ?
-        OFFSET ?
-        """,
-        (pattern, int(limit), int(offset)),
-    )
+    match = _fts_match(query)
+    if match:
+        cur.execute(
+            """
+            SELECT ui.user_info_key, ui.username, ui.profile_pic
+            FROM users_fts
+            JOIN user_info ui ON ui.user_info_key = users_fts.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY users_fts.rank, ui.username COLLATE NOCASE ASC
+            LIMIT ?
+            OFFSET ?
+            """,
+            (match, int(limit), int(offset)),
+        )
+    else:
+        pattern = _search_pattern(query)
+        cur.execute(
+            """
+            SELECT user_info_key, username, profile_pic
+            FROM user_info
+            WHERE username LIKE ? COLLATE NOCASE
+            ORDER BY username COLLATE NOCASE ASC
+            LIMIT ?
+            OFFSET ?
+            """,
+            (pattern, int(limit), int(offset)),
+        )
     rows = cur.fetchall()
     conn.close()
     return [
@@ -3127,18 +3752,35 @@ def search_ratings(query, limit: int = 20, offset: int = 0):
         return []
     conn = get_db_connection()
     cur = conn.cursor()
-    pattern = _search_pattern(query)
-    cur.execute(
-        """
-        SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        WHERE rating_name LIKE ? COLLATE NOCASE OR rating_type LIKE ? COLLATE NOCASE OR user LIKE ? COLLATE NOCASE
-        ORDER BY rating_key DESC
-        LIMIT ?
-        OFFSET ?
-        """,
-        (pattern, pattern, pattern, int(limit), int(offset)),
-    )
+    match = _fts_match(query)
+    if match:
+        cur.execute(
+            """
+            SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+            FROM ratings_fts
+            JOIN ratings r ON r.rating_key = ratings_fts.rowid
+            LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+            WHERE ratings_fts MATCH ?
+            ORDER BY bm25(ratings_fts, 4.0, 1.0, 2.0), r.rating_key DESC
+            LIMIT ?
+            OFFSET ?
+            """,
+            (match, int(limit), int(offset)),
+        )
+    else:
+        pattern = _search_pattern(query)
+        cur.execute(
+            """
+            SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+            FROM ratings r
+            LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+            WHERE r.rating_name LIKE ? COLLATE NOCASE OR r.rating_type LIKE ? COLLATE NOCASE OR COALESCE(ui.username, r.user) LIKE ? COLLATE NOCASE
+            ORDER BY r.rating_key DESC
+            LIMIT ?
+            OFFSET ?
+            """,
+            (pattern, pattern, pattern, int(limit), int(offset)),
+        )
     rows = cur.fetchall()
     conn.close()
     return rows
@@ -3151,20 +3793,35 @@ def search_playlists(query, limit: int = 20, offset: int = 0):
 
     conn = get_db_connection()
     cur = conn.cursor()
-    pattern = _search_pattern(query)
-    cur.execute(
-        """
-        SELECT playlist_key, created_by, playlist_title, playlist_description
-        FROM playlist_info
-        WHERE playlist_title LIKE ? COLLATE NOCASE
-           OR playlist_description LIKE ? COLLATE NOCASE
-           OR created_by LIKE ? COLLATE NOCASE
-        ORDER BY playlist_key DESC
-        LIMIT ?
-          OFFSET ?
-        """,
-        (pattern, pattern, pattern, int(limit), int(offset)),
-    )
+    match = _fts_match(query)
+    if match:
+        cur.execute(
+            """
+            SELECT p.playlist_key, p.created_by, p.playlist_title, p.playlist_description
+            FROM playlists_fts
+            JOIN playlist_info p ON p.playlist_key = playlists_fts.rowid
+            WHERE playlists_fts MATCH ?
+            ORDER BY bm25(playlists_fts, 4.0, 1.0, 2.0), p.playlist_key DESC
+            LIMIT ?
+            OFFSET ?
+            """,
+            (match, int(limit), int(offset)),
+        )
+    else:
+        pattern = _search_pattern(query)
+        cur.execute(
+            """
+            SELECT playlist_key, created_by, playlist_title, playlist_description
+            FROM playlist_info
+            WHERE playlist_title LIKE ? COLLATE NOCASE
+               OR playlist_description LIKE ? COLLATE NOCASE
+               OR created_by LIKE ? COLLATE NOCASE
+            ORDER BY playlist_key DESC
+            LIMIT ?
+              OFFSET ?
+            """,
+            (pattern, pattern, pattern, int(limit), int(offset)),
+        )
     rows = cur.fetchall()
     conn.close()
     return rows
@@ -3176,58 +3833,76 @@ def search_song_ratings(query, limit=20):
         return []
     conn = get_db_connection()
     cur = conn.cursor()
-    pattern = _search_pattern(query)
-    cur.execute(
-        """
-                SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        WHERE rating_type = 'Song'
-          AND rating_name LIKE ? COLLATE NOCASE
-        ORDER BY rating_key DESC
-        LIMIT ?
-        """,
-        (pattern, int(limit)),
-    )
+    match = _fts_match(query, column="rating_name")
+    if match:
+        cur.execute(
+            """
+            SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+            FROM ratings_fts
+            JOIN ratings r ON r.rating_key = ratings_fts.rowid
+            LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+            WHERE ratings_fts MATCH ?
+              AND r.rating_type = 'Song'
+            ORDER BY ratings_fts.rank, r.rating_key DESC
+            LIMIT ?
+            """,
+            (match, int(limit)),
+        )
+    else:
+        pattern = _search_pattern(query)
+        cur.execute(
+            """
+                    SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+            FROM ratings r
+            LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+            WHERE r.rating_type = 'Song'
+              AND r.rating_name LIKE ? COLLATE NOCASE
+            ORDER BY r.rating_key DESC
+            LIMIT ?
+            """,
+            (pattern, int(limit)),
+        )
     rows = cur.fetchall()
     conn.close()
     return rows
 
 
-def get_ratings_by_user(username):
-    if not username:
+def get_ratings_by_user(user_id):
+    if not user_id:
         return []
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        WHERE user = ? COLLATE NOCASE
-        ORDER BY rating_key DESC
+        SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        WHERE r.user_id = ?
+        ORDER BY r.rating_key DESC
         """,
-        (username,),
+        (int(user_id),),
     )
     rows = cur.fetchall()
     conn.close()
     return rows
 
 
-def get_ratings_by_user_paginated(username: str, limit: int = 60, offset: int = 0):
-    username = (username or "").strip()
-    if not username:
+def get_ratings_by_user_paginated(user_id: int, limit: int = 60, offset: int = 0):
+    if not user_id:
         return []
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT rating_key, rating_type, rating_name, lyrics_rating, beat_rating, flow_rating, melody_rating, cohesive_rating, user, image_url
-        FROM ratings
-        WHERE user = ? COLLATE NOCASE
-        ORDER BY rating_key DESC
+        SELECT r.rating_key, r.rating_type, r.rating_name, r.lyrics_rating, r.beat_rating, r.flow_rating, r.melody_rating, r.cohesive_rating, COALESCE(ui.username, r.user), r.image_url
+        FROM ratings r
+        LEFT JOIN user_info ui ON ui.user_info_key = r.user_id
+        WHERE r.user_id = ?
+        ORDER BY r.rating_key DESC
         LIMIT ?
         OFFSET ?
         """,
-        (username, int(limit), int(offset)),
+        (int(user_id), int(limit), int(offset)),
     )
     rows = cur.fetchall()
     conn.close()
@@ -3303,6 +3978,7 @@ def create_user(username, email, password_plain):
     conn.commit()
     user_id = cur.lastrowid
     conn.close()
+    _notify_change(user_ids=[user_id])
     return get_user_by_id(user_id)
 
 
@@ -3314,20 +3990,14 @@ def verify_password(stored_hash, password_plain):
 def update_profile_info(user_id, username, about):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT username FROM user_info WHERE user_info_key = ?", (user_id,))
-    row = cur.fetchone()
-    previous_username = row[0] if row else None
+    # Ratings reference the user by ratings.user_id, so a rename is one row.
     cur.execute(
         "UPDATE user_info SET username = ?, about = ?  WHERE user_info_key = ?",
         (username, about, user_id),
     )
-    if previous_username and previous_username != username:
-        cur.execute(
-            "UPDATE ratings SET user = ? WHERE user = ? COLLATE NOCASE",
-            (username, previous_username),
-        )
     conn.commit()
     conn.close()
+    _notify_change(user_ids=[user_id])
 
 
 # Update the user's profile picture
@@ -3342,6 +4012,22 @@ def update_profile_pic(user_id, profile_pic_path):
     conn.close()
 
 
+# Every stored profile picture and rating image URL, for `flask gc-uploads`.
+def get_referenced_image_urls() -> set[str]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT profile_pic FROM user_info WHERE profile_pic IS NOT NULL
+        UNION
+        SELECT image_url FROM ratings WHERE image_url IS NOT NULL
+        """
+    )
+    urls = {row[0] for row in cur.fetchall() if row[0]}
+    conn.close()
+    return urls
+
+
 # Get profile picture from database using the username
 def get_profile_pic_by_username(username):
     conn = get_db_connection()
@@ -3407,8 +4093,60 @@ def create_alert(
         """,
         (user_id, message, url, created_at),
     )
+    _log_event(cur, "alert", cur.lastrowid, user_id=user_id)
+    conn.commit()
+    conn.close()
+
+
+def create_alerts_bulk(
+    alerts: list[tuple[int, str, Optional[str]]],
+    created_at: Optional[str] = None,
+) -> int:
+    """Insert many (user_id, message, url) alerts in a single transaction."""
+    created_at = created_at or datetime.now(timezone.utc).isoformat()
+    rows = [
+        (int(user_id), message, url, created_at)
+        for user_id, message, url in alerts or []
+        if user_id and message
+    ]
+    if not rows:
+        return 0
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # The write lock is taken up front so the new alert_ids form one
+    # contiguous range that the event_log insert below can select.
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("SELECT COALESCE(MAX(alert_id), 0) FROM alerts")
+    last_alert_id = int(cur.fetchone()[0] or 0)
+    cur.executemany(
+        """
+        INSERT INTO alerts (user_id, message, url, created_at, is_read)
+        VALUES (?,?,?,?,0)
+        """,
+        rows,
+    )
+    cur.execute(
+        """
+        INSERT INTO event_log (kind, item_id, user_id, created_at)
+        SELECT 'alert', alert_id, user_id, created_at
+        FROM alerts
+        WHERE alert_id > ?
+        ORDER BY alert_id
+        """,
+        (last_alert_id,),
+    )
     conn.commit()
     conn.close()
+    return len(rows)
+
+
+def create_alerts_for_followers(
+    user_id: int, message: str, url: Optional[str] = None
+) -> int:
+    """Alert every current follower of user_id (except user_id itself)."""
+    follower_ids = [f for f in get_follower_ids(user_id) if f != int(user_id)]
+    return create_alerts_bulk([(f, message, url) for f in follower_ids])
 
 
 def get_alerts_for_user(
@@ -3416,35 +4154,57 @@ def get_alerts_for_user(
     limit: int = 10,
     include_read: bool = False,
     offset: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
 ):
     conn = get_db_connection()
     cur = conn.cursor()
-    if include_read:
-        cur.execute(
-            """
-            SELECT alert_id, message, url, created_at, is_read
-            FROM alerts
-            WHERE user_id = ?
-            ORDER BY alert_id DESC
-            LIMIT ?
-            OFFSET ?
-            """,
-            (int(user_id), int(limit), int(offset)),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT alert_id, message, url, created_at, is_read
-            FROM alerts
-            WHERE user_id = ? AND (is_read IS NULL OR is_read = 0)
-            ORDER BY alert_id DESC
-            LIMIT ?
-            OFFSET ?
-            """,
-            (int(user_id), int(limit), int(offset)),
-        )
-    rows = cur.fetchall()
+    alerts = _select_alerts(
+        cur,
+        user_id,
+        limit=limit,
+        include_read=include_read,
+        offset=offset,
+        start_after=start_after,
+        end_before=end_before,
+    )
     conn.close()
+    return alerts
+
+
+def _select_alerts(
+    cur,
+    user_id: int,
+    *,
+    limit: int,
+    include_read: bool,
+    offset: int = 0,
+    after_id: int = 0,
+    start_after: Optional[int] = None,
+    end_before: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    where_read = "" if include_read else " AND (is_read IS NULL OR is_read = 0) "
+    keyset_sql, keyset_params, order, reverse = _keyset_page(
+        "alert_id", start_after=start_after, end_before=end_before
+    )
+    if keyset_sql:
+        where_read += f" AND {keyset_sql} "
+    cur.execute(
+        f"""
+        SELECT alert_id, message, url, created_at, is_read
+        FROM alerts
+        WHERE user_id = ?
+          AND alert_id > ?
+          {where_read}
+        ORDER BY alert_id {order}
+        LIMIT ?
+        OFFSET ?
+        """,
+        (int(user_id), int(after_id), *keyset_params, int(limit), int(offset)),
+    )
+    rows = cur.fetchall()
+    if reverse:
+        rows.reverse()
     return [
         {
             "alert_id": row[0],
@@ -3473,6 +4233,106 @@ def get_unread_alert_count(user_id: int) -> int:
     return int(row[0] or 0) if row else 0
 
 
+def get_sidebar_sig_for_user(user_id: int) -> tuple[int, ...]:
+    """(count, max_id) pairs for every sidebar panel, in one statement.
+
+    Order: all alerts, unread alerts, bulletin feed, activity feed. The unread
+    and feed pairs match get_unread_alert_sig, get_bulletin_feed_sig_for_user
+    and get_activity_feed_sig_for_user; the all-alerts pair also catches
+    deleted read alerts, which the sidebar lists too.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    sig = _select_sidebar_sig(cur, user_id)
+    conn.close()
+    return sig
+
+
+def _select_sidebar_sig(cur, user_id: int) -> tuple[int, ...]:
+    cur.execute(
+        """
+        SELECT
+            a.c, a.max_id, u.c, u.max_id, b.c, b.max_id, f.c, f.max_id
+        FROM
+            (
+                SELECT COUNT(1) AS c, COALESCE(MAX(alert_id), 0) AS max_id
+                FROM alerts
+                WHERE user_id = :uid
+            ) a,
+            (
+                SELECT COUNT(1) AS c, COALESCE(MAX(alert_id), 0) AS max_id
+                FROM alerts
+                WHERE user_id = :uid AND (is_read IS NULL OR is_read = 0)
+            ) u,
+            (
+                SELECT COUNT(1) AS c, COALESCE(MAX(item_id), 0) AS max_id
+                FROM feed_timeline
+                WHERE user_id = :uid AND kind = 'bulletin'
+            ) b,
+            (
+                SELECT COUNT(1) AS c, COALESCE(MAX(item_id), 0) AS max_id
+                FROM feed_timeline
+                WHERE user_id = :uid AND kind = 'activity'
+            ) f
+        """,
+        {"uid": int(user_id)},
+    )
+    row = cur.fetchone()
+    return tuple(int(v or 0) for v in row)
+
+
+def get_sidebar_state_for_user(user_id: int, limit: int = 5) -> dict[str, Any]:
+    """Alerts, bulletin and activity panels for the sidebar on one connection.
+
+    The reads share one snapshot, so the returned "sig" (see
+    get_sidebar_sig_for_user) describes exactly the lists returned with it.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    sig = _select_sidebar_sig(cur, user_id)
+    state = {
+        "sig": sig,
+        "alerts": _select_alerts(cur, user_id, limit=limit, include_read=True),
+        "unread_alert_count": sig[2],
+        "bulletins": _select_bulletin_feed(cur, user_id, limit=limit),
+        "bulletin_count": sig[4],
+        "activities": _select_activity_feed(cur, user_id, limit=limit),
+        "activity_count": sig[6],
+    }
+    conn.close()
+    return state
+
+
+def get_sidebar_items_since(
+    user_id: int,
+    *,
+    alert_after: int = 0,
+    bulletin_after: int = 0,
+    activity_after: int = 0,
+    limit: int = 5,
+) -> dict[str, Any]:
+    """Sidebar items with ids above the given max_ids, plus the current sig."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    sig = _select_sidebar_sig(cur, user_id)
+    state = {
+        "sig": sig,
+        "alerts": _select_alerts(
+            cur, user_id, limit=limit, include_read=True, after_id=alert_after
+        ),
+        "bulletins": _select_bulletin_feed(
+            cur, user_id, limit=limit, after_id=bulletin_after
+        ),
+        "activities": _select_activity_feed(
+            cur, user_id, limit=limit, after_id=activity_after
+        ),
+    }
+    conn.close()
+    return state
+
+
 def mark_alert_read(alert_id: int, user_id: int):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -3663,6 +4523,11 @@ def follow_user(followed_user_id, follower_user_id):
             """,
             (followed_user_id, follower_user_id),
         )
+    fill_feed_timeline(
+        cur, user_id=int(follower_user_id), actor_user_id=int(followed_user_id)
+    )
+    for kind in ("activity", "bulletin"):
+        trim_feed_timeline(cur, kind, user_id=int(follower_user_id))
     conn.commit()
     conn.close()
 
@@ -3678,10 +4543,33 @@ def unfollow_user(followed_user_id, follower_user_id):
         """,
         (followed_user_id, follower_user_id),
     )
+    if int(followed_user_id) != int(follower_user_id):
+        cur.execute(
+            "DELETE FROM feed_timeline WHERE user_id = ? AND actor_user_id = ?",
+            (int(follower_user_id), int(followed_user_id)),
+        )
     conn.commit()
     conn.close()
 
 
+def get_follower_ids(user_id: int) -> list[int]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT followed_by_user_key
+        FROM follow_info
+        WHERE user_followed_key = ?
+          AND followed_by_user_key IS NOT NULL
+          AND (unfollowed IS NULL OR unfollowed = 0)
+        """,
+        (int(user_id),),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [int(r[0]) for r in rows]
+
+
 def get_followers(user_id: int, limit: int = 200, offset: int = 0):
     conn = get_db_connection()
     cur = conn.cursor()
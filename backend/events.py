@@ -0,0 +1,158 @@
+import json
+import queue
+import threading
+import time
+from typing import Any, Iterator
+
+from backend.database import get_events_for_users, get_latest_event_id
+from backend.settings import env_number
+
+# Live sidebar events over Server-Sent Events.
+#
+# Writers only touch SQLite: create_alert and the feed fan-out append a row to
+# event_log. Each web process runs one relay thread that tails event_log for
+# the users who currently hold a stream in that process and hands matching
+# events to their queues, so gunicorn workers never need to talk to each
+# other and a thread serving a stream just blocks on its queue.
+#
+# A stream holds a worker thread for as long as it is open, so streams are
+# capped per process (SSE_MAX_STREAMS) and closed after SSE_MAX_LIFETIME_SECONDS;
+# the browser reconnects on its own, or falls back to /api/sidebar/sig polling
+# when the server answers 503.
+#
+# Streams are off by default: under gunicorn's gthread workers every open tab
+# would pin one of a handful of request threads. Turn them on (SSE_MAX_STREAMS
+# > 0) only with threads to spare; otherwise pages poll /api/sidebar/sig.
+
+
+SSE_MAX_STREAMS = int(env_number("SSE_MAX_STREAMS", 0, 0, 10_000))
+SSE_MAX_LIFETIME_SECONDS = env_number("SSE_MAX_LIFETIME_SECONDS", 300.0, 5.0, 86400.0)
+SSE_KEEPALIVE_SECONDS = env_number("SSE_KEEPALIVE_SECONDS", 20.0, 1.0, 600.0)
+SSE_RELAY_INTERVAL_SECONDS = env_number("SSE_RELAY_INTERVAL_SECONDS", 1.0, 0.1, 60.0)
+SSE_RETRY_MS = 5000
+
+_QUEUE_MAX = 100
+
+
+class EventBroker:
+    """Per-process fan-out of relay events to open streams."""
+
+    def __init__(self, max_streams: int):
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[queue.Queue]] = {}
+        self._stream_count = 0
+        self._relay: threading.Thread | None = None
+        self._last_event_id = 0
+        # Set while the relay is tailing event_log for the current subscribers.
+        self._live = threading.Event()
+
+    def subscribe(self, user_id: int) -> queue.Queue | None:
+        with self._lock:
+            if self._stream_count >= self.max_streams:
+                return None
+            q: queue.Queue = queue.Queue(maxsize=_QUEUE_MAX)
+            self._subscribers.setdefault(int(user_id), set()).add(q)
+            self._stream_count += 1
+            self._ensure_relay()
+            return q
+
+    def unsubscribe(self, user_id: int, q: queue.Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(int(user_id))
+            if not queues or q not in queues:
+                return
+            queues.discard(q)
+            if not queues:
+                self._subscribers.pop(int(user_id), None)
+            self._stream_count -= 1
+
+    def publish(self, user_id: int, event: dict[str, Any]) -> None:
+        with self._lock:
+            queues = list(self._subscribers.get(int(user_id), ()))
+        for q in queues:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # A stalled client only needs to know "something changed".
+                pass
+
+    def wait_live(self, timeout: float) -> bool:
+        """Block until the relay covers every event after this point."""
+        return self._live.wait(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "streams": self._stream_count,
+                "users": len(self._subscribers),
+                "max_streams": self.max_streams,
+                "last_event_id": self._last_event_id,
+            }
+
+    def _ensure_relay(self) -> None:
+        # Caller holds self._lock.
+        if self._relay is not None and self._relay.is_alive():
+            return
+        self._relay = threading.Thread(
+            target=self._run_relay, name="sse-relay", daemon=True
+        )
+        self._relay.start()
+
+    def _run_relay(self) -> None:
+        idle = True
+        while True:
+            time.sleep(SSE_RELAY_INTERVAL_SECONDS)
+            with self._lock:
+                user_ids = list(self._subscribers)
+                if not user_ids:
+                    # Cleared under the lock, so a stream that subscribes
+                    # after this snapshot waits for the next baseline.
+                    self._live.clear()
+            if not user_ids:
+                idle = True
+                continue
+            try:
+                latest = get_latest_event_id()
+                if idle:
+                    # Nobody was listening; there is nothing to catch up on.
+                    # Streams opened before this point get "ready" only now
+                    # and check the sidebar signature for anything skipped.
+                    self._last_event_id = latest
+                    idle = False
+                    self._live.set()
+                    continue
+                if latest <= self._last_event_id:
+                    continue
+                rows = get_events_for_users(self._last_event_id, latest, user_ids)
+            except Exception:
+                continue
+            for event_id, user_id, kind, item_id in rows:
+                self.publish(
+                    user_id, {"id": event_id, "kind": kind, "item_id": item_id}
+                )
+            self._last_event_id = latest
+
+
+broker = EventBroker(SSE_MAX_STREAMS)
+
+
+def stream_events(user_id: int, q: queue.Queue) -> Iterator[str]:
+    """SSE body for one subscriber; always unsubscribes when the client leaves."""
+    deadline = time.monotonic() + SSE_MAX_LIFETIME_SECONDS
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        broker.wait_live(SSE_RELAY_INTERVAL_SECONDS * 2 + 1)
+        yield "event: ready\ndata: {}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = q.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(user_id, q)
@@ -0,0 +1,193 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.ratelimit import rate_limiter
+from backend.settings import env_number
+
+logger = logging.getLogger(__name__)
+
+# Outbound HTTP for the MusicBrainz, Cover Art Archive and Wikidata helpers
+# and the image proxy.
+#
+# One requests.Session per process keeps pooled keep-alive connections per
+# host (HTTP_POOL_MAXSIZE each), so repeat calls skip the TCP and TLS
+# handshakes. http_get() takes a rate-limit slot for the host before every
+# attempt, applies the host's timeout, and retries 429/503 answers and
+# connection errors with exponential backoff (honouring a numeric
+# Retry-After). Every attempt is timed into per-host stats and passed to the
+# hooks registered with add_request_hook().
+
+
+HTTP_POOL_MAXSIZE = int(env_number("HTTP_POOL_MAXSIZE", 8, 1, 100))
+HTTP_RETRIES = int(env_number("HTTP_RETRIES", 2, 0, 10))
+HTTP_BACKOFF_SECONDS = env_number("HTTP_BACKOFF_SECONDS", 0.5, 0.0, 30.0)
+HTTP_RETRY_AFTER_MAX_SECONDS = env_number(
+    "HTTP_RETRY_AFTER_MAX_SECONDS", 10.0, 0.0, 120.0
+)
+HTTP_CONNECT_TIMEOUT_SECONDS = env_number(
+    "HTTP_CONNECT_TIMEOUT_SECONDS", 5.0, 0.5, 60.0
+)
+HTTP_DEFAULT_TIMEOUT_SECONDS = env_number(
+    "HTTP_DEFAULT_TIMEOUT_SECONDS", 20.0, 1.0, 300.0
+)
+
+# Read timeouts per host; anything else gets HTTP_DEFAULT_TIMEOUT_SECONDS.
+HOST_TIMEOUTS: dict[str, float] = {
+    "musicbrainz.org": 12.0,
+    "coverartarchive.org": 8.0,
+    "www.wikidata.org": 10.0,
+}
+
+RETRY_STATUSES = frozenset({429, 503})
+
+
+class UpstreamRateLimited(requests.RequestException):
+    """No request slot for the host within the rate limiter's deadline."""
+
+
+_session_lock = threading.Lock()
+_session: requests.Session | None = None
+_session_pid: int | None = None
+
+_hooks: list[Callable[..., Any]] = []
+_stats_lock = threading.Lock()
+_stats: dict[str, dict[str, Any]] = {}
+
+
+def add_request_hook(fn: Callable[..., Any]) -> None:
+    """Call fn(host=, status=, elapsed=, attempt=, error=) after each attempt."""
+    if fn not in _hooks:
+        _hooks.append(fn)
+
+
+def get_session() -> requests.Session:
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=len(HOST_TIMEOUTS) + 4,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # Pooled sockets must not be shared with a forked parent.
+            _session, _session_pid = session, pid
+    return _session
+
+
+def http_get(
+    url: str,
+    *,
+    params: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+    timeout: float | None = None,
+    stream: bool = False,
+    retries: int | None = None,
+) -> requests.Response:
+    """GET through the shared session; raises requests.RequestException.
+
+    The last response is returned as-is when retries run out, so callers keep
+    checking status_code themselves.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    read_timeout = timeout or HOST_TIMEOUTS.get(host, HTTP_DEFAULT_TIMEOUT_SECONDS)
+    retries = HTTP_RETRIES if retries is None else max(0, int(retries))
+    session = get_session()
+
+    attempt = 0
+    while True:
+        if not rate_limiter.acquire(host):
+            raise UpstreamRateLimited(f"rate limit budget for {host} exhausted")
+        started = time.monotonic()
+        try:
+            resp = session.get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=(HTTP_CONNECT_TIMEOUT_SECONDS, read_timeout),
+                stream=stream,
+            )
+        except requests.ConnectionError as exc:
+            _record(host, None, time.monotonic() - started, attempt, type(exc).__name__)
+            if attempt >= retries:
+                raise
+            delay = _backoff(attempt)
+        except requests.RequestException as exc:
+            _record(host, None, time.monotonic() - started, attempt, type(exc).__name__)
+            raise
+        else:
+            _record(host, resp.status_code, time.monotonic() - started, attempt, None)
+            if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                return resp
+            delay = _retry_after(resp) or _backoff(attempt)
+            resp.close()
+        attempt += 1
+        time.sleep(delay)
+
+
+def get_http_stats() -> dict[str, dict[str, Any]]:
+    with _stats_lock:
+        out = {}
+        for host, s in _stats.items():
+            out[host] = dict(s, statuses=dict(s["statuses"]))
+            out[host]["latency_avg_ms"] = (
+                round(s["latency_total_ms"] / s["requests"], 1) if s["requests"] else 0
+            )
+        return out
+
+
+def _backoff(attempt: int) -> float:
+    base = HTTP_BACKOFF_SECONDS * (2**attempt)
+    return base + random.uniform(0, base / 2)
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    try:
+        seconds = float((resp.headers.get("Retry-After") or "").strip())
+    except ValueError:
+        return None
+    return max(0.0, min(HTTP_RETRY_AFTER_MAX_SECONDS, seconds))
+
+
+def _record(
+    host: str, status: int | None, elapsed: float, attempt: int, error: str | None
+) -> None:
+    elapsed_ms = elapsed * 1000.0
+    with _stats_lock:
+        s = _stats.setdefault(
+            host,
+            {
+                "requests": 0,
+                "retries": 0,
+                "errors": 0,
+                "latency_total_ms": 0.0,
+                "latency_max_ms": 0.0,
+                "statuses": {},
+            },
+        )
+        s["requests"] += 1
+        if attempt:
+            s["retries"] += 1
+        if error:
+            s["errors"] += 1
+        else:
+            s["statuses"][str(status)] = s["statuses"].get(str(status), 0) + 1
+        s["latency_total_ms"] = round(s["latency_total_ms"] + elapsed_ms, 1)
+        s["latency_max_ms"] = round(max(s["latency_max_ms"], elapsed_ms), 1)
+    for fn in _hooks:
+        try:
+            fn(host=host, status=status, elapsed=elapsed, attempt=attempt, error=error)
+        except Exception:
+            logger.exception("http request hook %r failed", fn)
@@ -0,0 +1,446 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from backend.background import background
+from backend.http_client import http_get
+from backend.settings import env_number
+
+logger = logging.getLogger(__name__)
+
+# On-disk cache for /image-proxy.
+#
+# Each upstream image is stored under <UPLOAD_FOLDER>/image-cache as
+# <aa>/<key> (the body) and <aa>/<key>.json (content type, validators and
+# timestamps), where key is the SHA-256 of the normalized URL. Files are
+# written to a temporary name and renamed into place, so every gunicorn
+# worker can read and write the same directory.
+#
+# A hit is served from disk. Once an entry is older than
+# IMAGE_CACHE_FRESH_SECONDS it is still served, and a conditional GET with
+# the stored ETag / Last-Modified is queued on the background worker: 304
+# only renews the entry, 200 replaces it, 404/410 drops it.
+#
+# A body's mtime is its last use (touched at most every
+# IMAGE_CACHE_TOUCH_SECONDS); when the directory grows past
+# IMAGE_CACHE_MAX_BYTES, the least recently used entries are deleted down to
+# 90% of it. Files added with store_derived() (the resized WebP variants
+# from image_variants) live in the same shards and count against the same
+# budget. The default is sized for a small disk that also holds the database
+# and the uploads; raise it where there is room.
+#
+# A miss is streamed: stream() hands back a generator that passes the
+# upstream body to the client chunk by chunk while writing it to a temporary
+# file, which is renamed into the cache once the body is complete. Memory per
+# request stays at one chunk. Images over IMAGE_CACHE_MAX_OBJECT_BYTES are
+# passed through but not kept; over IMAGE_PROXY_MAX_BYTES they are refused
+# (or cut off, if upstream did not announce a length).
+
+
+IMAGE_CACHE_MAX_BYTES = int(
+    env_number("IMAGE_CACHE_MAX_BYTES", 128 * 1024 * 1024, 1024 * 1024, 1 << 40)
+)
+IMAGE_CACHE_MAX_OBJECT_BYTES = int(
+    env_number("IMAGE_CACHE_MAX_OBJECT_BYTES", 10 * 1024 * 1024, 1024, 1 << 30)
+)
+IMAGE_CACHE_FRESH_SECONDS = env_number(
+    "IMAGE_CACHE_FRESH_SECONDS", 7 * 86400.0, 60.0, 365 * 86400.0
+)
+# Misses are streamed to the client in chunks of IMAGE_PROXY_CHUNK_BYTES;
+# bodies over IMAGE_PROXY_MAX_BYTES are refused or cut off.
+IMAGE_PROXY_CHUNK_BYTES = int(
+    env_number("IMAGE_PROXY_CHUNK_BYTES", 64 * 1024, 1024, 4 * 1024 * 1024)
+)
+IMAGE_PROXY_MAX_BYTES = int(
+    env_number("IMAGE_PROXY_MAX_BYTES", 25 * 1024 * 1024, 1024, 1 << 31)
+)
+IMAGE_CACHE_TOUCH_SECONDS = env_number(
+    "IMAGE_CACHE_TOUCH_SECONDS", 3600.0, 0.0, 86400.0
+)
+
+
+def _content_length(resp: requests.Response) -> int | None:
+    # With a Content-Encoding, the length is of the encoded body, not of the
+    # bytes iter_content() yields.
+    if resp.headers.get("Content-Encoding"):
+        return None
+    try:
+        return max(0, int(resp.headers.get("Content-Length") or ""))
+    except ValueError:
+        return None
+
+
+def _content_type(resp: requests.Response) -> str:
+    return (resp.headers.get("Content-Type") or "application/octet-stream").strip()
+
+
+def cache_key(url: str) -> str:
+    """SHA-256 of the URL with scheme and host lowercased and no fragment."""
+    parts = urlsplit((url or "").strip())
+    netloc = (parts.netloc or "").lower()
+    if parts.port in (80, 443):
+        netloc = netloc.rsplit(":", 1)[0]
+    normalized = urlunsplit(
+        ((parts.scheme or "").lower(), netloc, parts.path or "/", parts.query, "")
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.root: Path | None = None
+        self._lock = threading.Lock()
+        self._revalidating: set[str] = set()
+        self._total_bytes: int | None = None
+        self._evicting = False
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "stored": 0,
+            "uncacheable": 0,
+            "too_large": 0,
+            "not_modified": 0,
+            "refreshed": 0,
+            "dropped": 0,
+            "evicted": 0,
+            "errors": 0,
+        }
+
+    def configure(self, root: str | Path) -> None:
+        self.root = Path(root)
+        with self._lock:
+            self._total_bytes = None
+
+    def lookup(
+        self, url: str, *, headers: dict[str, str] | None = None
+    ) -> dict[str, Any] | None:
+        """The cached entry for url, or None on a miss.
+
+        A stale entry is returned as-is and revalidated in the background
+        with `headers` plus the stored validators.
+        """
+        if self.root is None:
+            return None
+        key = cache_key(url)
+        entry = self._read(key)
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        now = time.time()
+        if now - entry["mtime"] >= IMAGE_CACHE_TOUCH_SECONDS:
+            try:
+                os.utime(entry["path"], (now, now))
+            except OSError:
+                pass
+        if now - float(entry.get("checked_at") or 0) >= IMAGE_CACHE_FRESH_SECONDS:
+            self._count("stale")
+            with self._lock:
+                queue = key not in self._revalidating
+                if queue:
+                    self._revalidating.add(key)
+            if queue:
+                background.submit(
+                    self._revalidate, key, url, dict(headers or {}), entry
+                )
+        return entry
+
+    def stream(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> tuple[dict[str, Any] | None, int]:
+        """(entry, status) for a miss, with the body still upstream.
+
+        entry["chunks"] yields the body while it is written into the cache;
+        it is stored only if it arrives whole. entry is None when upstream
+        did not answer 200 or announces more than IMAGE_PROXY_MAX_BYTES.
+        Raises requests.RequestException.
+        """
+        resp = http_get(url, headers=headers, timeout=timeout, stream=True)
+        if resp.status_code != 200:
+            resp.close()
+            return None, resp.status_code
+        length = _content_length(resp)
+        if length is not None and length > IMAGE_PROXY_MAX_BYTES:
+            resp.close()
+            self._count("too_large")
+            return None, 502
+        return {
+            "content_type": _content_type(resp),
+            "cache_control": resp.headers.get("Cache-Control"),
+            "content_length": length,
+            "chunks": self._tee(cache_key(url), url, resp),
+        }, 200
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["bytes"] = self._total_bytes
+            stats["revalidating"] = len(self._revalidating)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def derived_path(self, key: str) -> Path | None:
+        """Path of a file stored with store_derived(), or None."""
+        if self.root is None:
+            return None
+        path = self._paths(key)[0]
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+        now = time.time()
+        if now - mtime >= IMAGE_CACHE_TOUCH_SECONDS:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        return path
+
+    def store_derived(self, key: str, data: bytes) -> Path | None:
+        """Keep `data` (e.g. a resized variant) under the cache's LRU budget."""
+        if self.root is None:
+            return None
+        path = self._paths(key)[0]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(path, data)
+        except OSError:
+            logger.exception("image cache write failed for derived %s", key)
+            self._count("errors")
+            return None
+        self._grow(len(data))
+        return path
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        folder = self.root / key[:2]
+        return folder / key, folder / f"{key}.json"
+
+    def _read(self, key: str) -> dict[str, Any] | None:
+        body_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            st = body_path.stat()
+        except (OSError, ValueError):
+            return None
+        # Body and metadata are replaced separately; a mismatch is a miss.
+        if st.st_size != meta.get("size"):
+            return None
+        meta["path"] = str(body_path)
+        meta["mtime"] = st.st_mtime
+        return meta
+
+    @staticmethod
+    def _meta(
+        url: str, resp: requests.Response, digest: str, size: int
+    ) -> dict[str, Any]:
+        now = time.time()
+        return {
+            "url": url,
+            "content_type": _content_type(resp),
+            "cache_control": resp.headers.get("Cache-Control"),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "digest": digest,
+            "size": size,
+            "stored_at": now,
+            "checked_at": now,
+        }
+
+    def _tee(self, key: str, url: str, resp: requests.Response) -> Iterator[bytes]:
+        """Yield resp's body in chunks, writing it to a temporary file.
+
+        The file replaces the cached body only when the whole body arrived.
+        Closing the generator early (the client went away) abandons both the
+        download and the file.
+        """
+        length = _content_length(resp)
+        out = tmp = None
+        if self.root is not None and (length or 0) <= IMAGE_CACHE_MAX_OBJECT_BYTES:
+            body_path = self._paths(key)[0]
+            tmp = body_path.with_name(
+                f"{body_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            try:
+                body_path.parent.mkdir(parents=True, exist_ok=True)
+                out = open(tmp, "wb")
+            except OSError:
+                logger.exception("image cache write failed for %s", url)
+                self._count("errors")
+        else:
+            self._count("uncacheable")
+
+        hasher = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            for chunk in resp.iter_content(IMAGE_PROXY_CHUNK_BYTES):
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > IMAGE_PROXY_MAX_BYTES:
+                    logger.warning("image proxy: %s is over the size limit", url)
+                    self._count("too_large")
+                    return
+                if out is not None and size > IMAGE_CACHE_MAX_OBJECT_BYTES:
+                    out.close()
+                    out = None
+                    self._count("uncacheable")
+                if out is not None:
+                    try:
+                        out.write(chunk)
+                        hasher.update(chunk)
+                    except OSError:
+                        logger.exception("image cache write failed for %s", url)
+                        self._count("errors")
+                        out.close()
+                        out = None
+                yield chunk
+            complete = length is None or size == length
+        except requests.RequestException:
+            logger.warning("image proxy: upstream body for %s broke off", url)
+            self._count("errors")
+        finally:
+            resp.close()
+            if out is not None:
+                out.close()
+                if complete:
+                    self._commit(
+                        key, tmp, self._meta(url, resp, hasher.hexdigest(), size)
+                    )
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+
+    def _commit(self, key: str, tmp: Path, meta: dict[str, Any]) -> None:
+        body_path, meta_path = self._paths(key)
+        try:
+            previous = body_path.stat().st_size if body_path.exists() else 0
+            os.replace(tmp, body_path)
+            self._write(meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError:
+            logger.exception("image cache write failed for %s", meta["url"])
+            self._count("errors")
+            return
+        self._count("stored")
+        self._grow(meta["size"] - previous)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _update_meta(self, key: str, meta: dict[str, Any]) -> None:
+        meta = {k: v for k, v in meta.items() if k not in ("path", "mtime")}
+        self._write(self._paths(key)[1], json.dumps(meta).encode("utf-8"))
+
+    def _drop(self, key: str) -> None:
+        body_path, meta_path = self._paths(key)
+        size = 0
+        try:
+            size = body_path.stat().st_size
+        except OSError:
+            pass
+        meta_path.unlink(missing_ok=True)
+        body_path.unlink(missing_ok=True)
+        self._grow(-size)
+
+    def _revalidate(
+        self, key: str, url: str, headers: dict[str, str], entry: dict[str, Any]
+    ) -> None:
+        try:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            try:
+                resp = http_get(url, headers=headers, stream=True)
+            except requests.RequestException:
+                self._count("errors")
+                return
+            if resp.status_code == 304:
+                entry["checked_at"] = time.time()
+                self._update_meta(key, entry)
+                self._count("not_modified")
+            elif resp.status_code == 200:
+                for _ in self._tee(key, url, resp):
+                    pass
+                fresh = self._read(key)
+                if fresh is None or fresh["stored_at"] == entry["stored_at"]:
+                    # Not stored (too large, or cut off): don't keep the old one.
+                    self._drop(key)
+                self._count("refreshed")
+            elif resp.status_code in (404, 410):
+                self._drop(key)
+                self._count("dropped")
+            resp.close()
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def _grow(self, delta: int) -> None:
+        with self._lock:
+            if self._total_bytes is None:
+                evict = not self._evicting
+            else:
+                self._total_bytes = max(0, self._total_bytes + delta)
+                evict = self._total_bytes > self.max_bytes and not self._evicting
+            if evict:
+                self._evicting = True
+        if evict:
+            background.submit(self._evict)
+
+    def _evict(self) -> None:
+        # The directory is shared, so this rescans it rather than trusting
+        # this process's running total.
+        try:
+            bodies = []
+            now = time.time()
+            for path in self.root.glob("*/*"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                if path.suffix == ".tmp" and now - st.st_mtime > 3600:
+                    path.unlink(missing_ok=True)
+                if not path.suffix:
+                    bodies.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in bodies)
+            target = int(self.max_bytes * 0.9)
+            evicted = 0
+            if total > self.max_bytes:
+                for _, size, path in sorted(bodies):
+                    if total <= target:
+                        break
+                    path.with_name(f"{path.name}.json").unlink(missing_ok=True)
+                    path.unlink(missing_ok=True)
+                    total -= size
+                    evicted += 1
+            with self._lock:
+                self._total_bytes = total
+                self._stats["evicted"] += evicted
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+image_cache = ImageCache(IMAGE_CACHE_MAX_BYTES)
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import logging
+import threading
+from pathlib import Path
+
+from flask import Response, request, send_file
+
+from backend.image_cache import image_cache
+from backend.settings import env_number
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = ImageOps = features = None
+
+logger = logging.getLogger(__name__)
+
+# Resized WebP copies of uploads and proxied artwork, for `?w=` on
+# /uploads/... and /image-proxy.
+#
+# A requested width is rounded up to one of VARIANT_WIDTHS, so each source
+# has at most len(VARIANT_WIDTHS) variants. Variants are keyed by the source's
+# identity (upload path, mtime and size, or the proxied body's digest), the
+# width and the encoder settings, and are kept in the image cache directory
+# so they share its LRU size budget. At most IMAGE_VARIANT_CONCURRENCY
+# resizes run at once per process, and concurrent requests for the same
+# variant wait for one resize.
+#
+# Variants are WebP only and need Pillow with WebP support; clients that do
+# not send image/webp in Accept, animated images, and any image Pillow
+# cannot decode get the original.
+
+
+VARIANT_WIDTHS = (160, 320, 640, 1200)
+IMAGE_VARIANT_QUALITY = int(env_number("IMAGE_VARIANT_QUALITY", 80, 30, 100))
+IMAGE_VARIANT_CONCURRENCY = int(env_number("IMAGE_VARIANT_CONCURRENCY", 2, 1, 32))
+IMAGE_VARIANT_MAX_AGE_SECONDS = int(
+    env_number("IMAGE_VARIANT_MAX_AGE_SECONDS", 86400, 0, 365 * 86400)
+)
+
+VARIANTS_AVAILABLE = features is not None and bool(features.check("webp"))
+
+_slots = threading.BoundedSemaphore(IMAGE_VARIANT_CONCURRENCY)
+_locks_guard = threading.Lock()
+_locks: dict[str, threading.Lock] = {}
+
+
+def variant_width(raw: str | None, accept: str | None) -> int | None:
+    """The variant width to serve for ?w=raw, or None for the original."""
+    if not VARIANTS_AVAILABLE or "image/webp" not in (accept or ""):
+        return None
+    try:
+        wanted = int((raw or "").strip())
+    except (TypeError, ValueError):
+        return None
+    if wanted <= 0:
+        return None
+    for width in VARIANT_WIDTHS:
+        if width >= wanted:
+            return width
+    return VARIANT_WIDTHS[-1]
+
+
+def vary_on_width(out: Response) -> Response:
+    """Add Vary: Accept when the request asked for a width.
+
+    Whether ?w= gets the variant or the original depends on Accept, so every
+    answer to such a request must say so, including the original.
+    """
+    if request.args.get("w") is not None:
+        out.vary.add("Accept")
+    return out
+
+
+def variant_response(source: Path, source_id: str, width: int) -> Response | None:
+    """send_file() of the WebP variant, or None to fall back to the source."""
+    path = _variant_path(source, source_id, width)
+    if path is None:
+        return None
+    out = send_file(
+        path,
+        mimetype="image/webp",
+        conditional=True,
+        etag=path.name,
+        max_age=IMAGE_VARIANT_MAX_AGE_SECONDS,
+    )
+    out.vary.add("Accept")
+    return out
+
+
+def _variant_path(source: Path, source_id: str, width: int) -> Path | None:
+    key = hashlib.sha256(
+        f"{source_id}|{width}|webp|{IMAGE_VARIANT_QUALITY}".encode("utf-8")
+    ).hexdigest()
+    path = image_cache.derived_path(key)
+    if path is not None:
+        return path
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            path = image_cache.derived_path(key)
+            if path is not None:
+                return path
+            with _slots:
+                data = _render(source, width)
+            if data is None:
+                return None
+            return image_cache.store_derived(key, data)
+    finally:
+        with _locks_guard:
+            _locks.pop(key, None)
+
+
+def _render(source: Path, width: int) -> bytes | None:
+    try:
+        with Image.open(source) as img:
+            if getattr(img, "is_animated", False):
+                return None
+            # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than
+            # decoding in full and shrinking.
+            img.draft("RGB", (width, width * 4))
+            img = ImageOps.exif_transpose(img)
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.Resampling.LANCZOS)
+            if img.mode not in ("RGB", "RGBA"):
+                alpha = "A" in img.getbands() or "transparency" in img.info
+                img = img.convert("RGBA" if alpha else "RGB")
+            buf = io.BytesIO()
+            img.save(buf, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+            return buf.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("could not make a %spx variant of %s", width, source)
+        return None
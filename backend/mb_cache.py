@@ -0,0 +1,127 @@
+import threading
+from typing import Any, Callable
+from urllib.parse import urlencode
+
+from backend.database import (
+    get_cached_mb_response,
+    purge_expired_mb_responses,
+    set_cached_mb_response,
+)
+from backend.settings import env_number
+
+# MusicBrainz search responses, cached in SQLite (mb_response_cache).
+#
+# Entries are keyed by endpoint plus the request parameters (query, limit,
+# offset), so every gunicorn worker shares them and they survive restarts.
+# A response with results lives for MB_CACHE_TTL_SECONDS; an empty result or
+# a 4xx answer is cached as a negative entry for MB_CACHE_NEGATIVE_TTL_SECONDS.
+# 5xx, 429 and network errors are never cached.
+#
+# Within a process, concurrent misses on the same key are coalesced: the first
+# caller fetches (through the MusicBrainz throttle) and the others wait for
+# its result instead of queueing their own upstream call.
+
+
+MB_CACHE_TTL_SECONDS = env_number("MB_CACHE_TTL_SECONDS", 86400.0, 0.0, 90 * 86400.0)
+MB_CACHE_NEGATIVE_TTL_SECONDS = env_number(
+    "MB_CACHE_NEGATIVE_TTL_SECONDS", 3600.0, 0.0, 7 * 86400.0
+)
+# How long a coalesced caller waits for the leader before giving up.
+MB_CACHE_WAIT_SECONDS = env_number("MB_CACHE_WAIT_SECONDS", 30.0, 1.0, 300.0)
+# Expired rows are purged once every this many cache writes.
+MB_CACHE_PURGE_EVERY = int(env_number("MB_CACHE_PURGE_EVERY", 500, 1, 1_000_000))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: tuple[int, Any] | None = None
+        self.error: BaseException | None = None
+
+
+_lock = threading.Lock()
+_flights: dict[str, _Flight] = {}
+_writes = 0
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "negative": 0, "errors": 0}
+
+
+def mb_cache_key(endpoint: str, params: dict[str, Any]) -> str:
+    return f"{endpoint}?{urlencode(sorted(params.items()))}"
+
+
+def cached_mb_get(
+    endpoint: str,
+    params: dict[str, Any],
+    fetch: Callable[[], tuple[int, Any]],
+) -> tuple[int, Any]:
+    """(status, decoded JSON or None) for one MusicBrainz GET.
+
+    fetch() performs the upstream call and returns the same pair; its
+    exceptions propagate to every caller waiting on it.
+    """
+    key = mb_cache_key(endpoint, params)
+    cached = get_cached_mb_response(key)
+    if cached is not None:
+        _count("hits")
+        return cached
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _stats["misses"] += 1
+        else:
+            _stats["coalesced"] += 1
+
+    if not leader:
+        if not flight.done.wait(MB_CACHE_WAIT_SECONDS):
+            raise TimeoutError(f"MusicBrainz request for {key} is still running")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = get_cached_mb_response(key) or _fetch_and_store(key, fetch)
+        return flight.result
+    except BaseException as exc:
+        flight.error = exc
+        _count("errors")
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def get_mb_cache_stats() -> dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats["in_flight"] = len(_flights)
+    return stats
+
+
+def _fetch_and_store(key: str, fetch: Callable[[], tuple[int, Any]]) -> tuple[int, Any]:
+    global _writes
+    status, data = fetch()
+    if status >= 500 or status == 429:
+        return status, data
+    if status >= 400:
+        data = None
+    negative = data is None or not int((data or {}).get("count") or 0)
+    ttl = MB_CACHE_NEGATIVE_TTL_SECONDS if negative else MB_CACHE_TTL_SECONDS
+    if negative:
+        _count("negative")
+    if ttl > 0:
+        set_cached_mb_response(key, status, data, ttl)
+        with _lock:
+            _writes += 1
+            purge = _writes % MB_CACHE_PURGE_EVERY == 0
+        if purge:
+            purge_expired_mb_responses()
+    return status, data
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
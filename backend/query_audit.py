@@ -0,0 +1,151 @@
+import re
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+import backend._db_setup as db_setup
+from backend.database import flush_activity
+
+# Query plan audit (`flask audit-query-plans`).
+#
+# Crawls the GET pages as one user against a scratch copy of the database,
+# records every statement the app runs, and asks SQLite for the plan of each.
+# A table read with a plain "SCAN <table>" (no index) is reported unless the
+# statement cannot use one by design: no WHERE clause at all (counts, newest-
+# first listings walking the primary key) or a '%substring%' LIKE search.
+
+_SKIP_ENDPOINTS = {
+    "static",
+    "uploaded_file",
+    "uploaded_file_old",
+    "main.logout",
+    "main.alert_go",
+    "main.sidebar_stream_api",
+    "main.image_proxy",
+    "main.musicbrainz_search_api",
+}
+
+_WRITE_OR_READ = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def _exempt(sql: str) -> bool:
+    upper = sql.upper()
+    return " WHERE " not in f" {' '.join(upper.split())} " or "LIKE '%" in upper
+
+
+def _sample_values(cur: sqlite3.Cursor, user_id: int | None) -> dict[str, Any]:
+    if user_id is None:
+        cur.execute("SELECT MIN(user_info_key) FROM user_info")
+        user_id = (cur.fetchone() or [None])[0]
+    cur.execute(
+        "SELECT username FROM user_info WHERE user_info_key = ?", (user_id or 0,)
+    )
+    row = cur.fetchone()
+    cur.execute(
+        """
+        SELECT rating_key, rating_type, rating_name, content_info_artist, mbid
+        FROM ratings
+        ORDER BY rating_key DESC
+        LIMIT 1
+        """
+    )
+    rating = cur.fetchone() or (0, "", "", "", "")
+    cur.execute("SELECT MAX(bulletin_key) FROM bulletin")
+    bulletin_key = (cur.fetchone() or [0])[0] or 0
+    cur.execute("SELECT MAX(playlist_key) FROM playlist_info")
+    playlist_key = (cur.fetchone() or [0])[0] or 0
+    return {
+        "user_id": user_id,
+        "username": row[0] if row else "",
+        "rating_key": rating[0],
+        "subject": {
+            "kind": (rating[1] or "").strip().lower(),
+            "name": rating[2] or "",
+            "artist": rating[3] or "",
+            "mbid": rating[4] or "",
+        },
+        "bulletin_key": bulletin_key,
+        "playlist_key": playlist_key,
+    }
+
+
+def _crawl_urls(app, sample: dict[str, Any]) -> list[str]:
+    urls = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint in _SKIP_ENDPOINTS or "GET" not in rule.methods:
+            continue
+        try:
+            values = {arg: sample[arg] for arg in rule.arguments}
+        except KeyError:
+            continue
+        urls.append(rule.build(values, append_unknown=False)[1])
+    subject = sample["subject"]
+    subject_qs = urlencode({k: v for k, v in subject.items() if v})
+    urls += [
+        "/search?q=a",
+        "/search?q=a&tab=ratings",
+        f"/search?{urlencode({'q': sample['username'] or 'the'})}",
+        "/charts?kind=album",
+        "/charts?kind=artist",
+        f"/api/charts/subjects?kind={subject['kind'] or 'song'}&q=a",
+        f"/api/charts/subject-activity?{subject_qs}",
+        f"/api/charts/subject-summary?{subject_qs}",
+        f"/also-rated?{subject_qs}",
+        "/activity?category=music",
+        "/alerts?show=all",
+    ]
+    return urls
+
+
+def audit_query_plans(app, user_id: int | None = None) -> dict[str, Any]:
+    """Run the crawl and return {"urls", "statements", "findings"}.
+
+    findings is a list of {"tables", "sql"} for statements that full-scan a
+    table and are not exempt. The live database is never written to.
+    """
+    source = db_setup.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = Path(tmp) / "audit.sqlite3"
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(scratch)
+        src.backup(dst)
+        src.close()
+
+        db_setup.close_idle_connections()
+        db_setup.DB_PATH = scratch
+        try:
+            sample = _sample_values(dst.cursor(), user_id)
+            urls = _crawl_urls(app, sample)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess["_user_id"] = str(sample["user_id"])
+            with db_setup.trace_statements() as statements:
+                for url in urls:
+                    client.get(url)
+                flush_activity()
+        finally:
+            db_setup.DB_PATH = source
+            db_setup.close_idle_connections()
+
+        seen = set()
+        findings = []
+        cur = dst.cursor()
+        for sql in statements:
+            if not _WRITE_OR_READ.match(sql):
+                continue
+            shape = _LITERAL.sub("?", " ".join(sql.split()))
+            if shape in seen:
+                continue
+            seen.add(shape)
+            try:
+                tables = db_setup.explain_full_scans(cur, sql)
+            except sqlite3.Error:
+                continue
+            if tables and not _exempt(sql):
+                findings.append({"tables": tables, "sql": shape})
+        dst.close()
+
+    return {"urls": urls, "statements": len(seen), "findings": findings}
@@ -0,0 +1,105 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from backend.database import reserve_rate_limit_token
+from backend.settings import env_number
+
+logger = logging.getLogger(__name__)
+
+# Outbound rate limits per upstream host, shared by every worker process.
+#
+# Each host has a token bucket in SQLite (rate_limit_buckets): `rate` tokens
+# per second up to `burst`. acquire() reserves the next slot in one short
+# write transaction and then sleeps until that slot is due, holding no lock,
+# so callers in all processes queue fairly behind one budget. A caller that
+# would have to wait longer than its deadline gets False straight away and
+# nothing is reserved. Hosts without a budget are not limited.
+#
+# Budgets come from the *_MIN_INTERVAL_SECONDS settings (one request per
+# interval) and *_BURST. Wait times are recorded per host for /api/metrics.
+
+
+RATE_LIMIT_MAX_WAIT_SECONDS = env_number(
+    "RATE_LIMIT_MAX_WAIT_SECONDS", 10.0, 0.0, 120.0
+)
+
+
+def _budget(prefix: str) -> dict[str, float]:
+    interval = env_number(f"{prefix}_MIN_INTERVAL_SECONDS", 1.0, 0.2, 10.0)
+    return {"rate": 1.0 / interval, "burst": env_number(f"{prefix}_BURST", 1, 1, 100)}
+
+
+RATE_LIMIT_BUDGETS: dict[str, dict[str, float]] = {
+    "musicbrainz.org": _budget("MUSICBRAINZ"),
+    "coverartarchive.org": _budget("COVERART"),
+    "www.wikidata.org": _budget("WIKIDATA"),
+}
+
+
+class RateLimiter:
+    def __init__(self, budgets: dict[str, dict[str, float]]):
+        self.budgets = budgets
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, Any]] = {}
+
+    def acquire(self, host: str, timeout: float | None = None) -> bool:
+        """Wait for a request slot on `host`; False if none is free in time.
+
+        timeout defaults to RATE_LIMIT_MAX_WAIT_SECONDS.
+        """
+        host = (host or "").strip().lower()
+        budget = self.budgets.get(host)
+        if budget is None:
+            return True
+        max_wait = RATE_LIMIT_MAX_WAIT_SECONDS if timeout is None else timeout
+        try:
+            wait = reserve_rate_limit_token(
+                host, budget["rate"], budget["burst"], max(0.0, max_wait)
+            )
+        except sqlite3.Error:
+            logger.exception("rate limit bucket %s unavailable", host)
+            self._record(host, "errors")
+            return False
+        if wait is None:
+            self._record(host, "rejected")
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        self._record(host, "acquired", wait)
+        return True
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for host, s in self._stats.items():
+                out[host] = dict(s)
+                acquired = s["acquired"]
+                out[host]["wait_avg_seconds"] = (
+                    round(s["wait_total_seconds"] / acquired, 3) if acquired else 0.0
+                )
+            return out
+
+    def _record(self, host: str, outcome: str, wait: float = 0.0) -> None:
+        with self._lock:
+            s = self._stats.setdefault(
+                host,
+                {
+                    "acquired": 0,
+                    "rejected": 0,
+                    "errors": 0,
+                    "waited": 0,
+                    "wait_total_seconds": 0.0,
+                    "wait_max_seconds": 0.0,
+                },
+            )
+            s[outcome] += 1
+            if wait > 0:
+                s["waited"] += 1
+                s["wait_total_seconds"] = round(s["wait_total_seconds"] + wait, 3)
+                s["wait_max_seconds"] = round(max(s["wait_max_seconds"], wait), 3)
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_BUDGETS)
@@ -8,20 +8,20 @@ from flask import (
     session,
     jsonify,
     Response,
+    send_file,
 )
 from datetime import datetime, timezone, timedelta
 from urllib.parse import urlsplit, urlunsplit
 from urllib.parse import urlencode, quote
+import base64
+import hmac
 import os
-import time
 import re
 import requests
-import threading
-from werkzeug.utils import secure_filename
 from pathlib import Path
 from flask_login import login_user, logout_user, login_required, current_user
 import random
-import uuid
+from typing import Any
 
 from backend.database import (
     get_ratings,
@@ -41,6 +41,7 @@ from backend.database import (
     get_ratings_by_user_paginated,
     verify_password,
     get_rating_owner,
+    get_rating_owner_id,
     update_profile_pic,
     update_profile_info,
     get_profile_pic_by_username,
@@ -54,11 +55,13 @@ from backend.database import (
     unfollow_user,
     is_following,
     get_followers,
+    create_alerts_for_followers,
     get_following,
     count_followers,
     count_following,
     add_bulletin_post,
     add_activity,
+    get_activity_writer_stats,
     get_activity_feed_for_user,
     toggle_rating_like,
     is_rating_liked_by_user,
@@ -121,6 +124,30 @@ from backend.database import (
     get_cached_subject_image,
     set_cached_subject_image,
     get_rating_extras_by_key,
+    get_artwork_status,
+)
+from backend.artwork import artwork_queue
+from backend.autocomplete import KINDS as AUTOCOMPLETE_KINDS, autocomplete_index
+from backend.background import background
+from backend.mb_cache import cached_mb_get, get_mb_cache_stats
+from backend.http_client import UpstreamRateLimited, get_http_stats, http_get
+from backend.image_cache import image_cache
+from backend.image_variants import (
+    VARIANT_WIDTHS,
+    VARIANTS_AVAILABLE,
+    variant_response,
+    variant_width,
+    vary_on_width,
+)
+from backend.uploads import store_upload
+from backend.ratelimit import rate_limiter
+from backend.events import broker as event_broker, stream_events
+from backend.sidebar import (
+    get_sidebar_cache_stats,
+    get_sidebar_sig,
+    get_sidebar_updates,
+    sidebar_etag,
+    sidebar_sig_payload,
 )
 
 # Initialize routes with Blueprint
@@ -162,9 +189,32 @@ def _proxied_image_url(url: str | None) -> str | None:
     return "/image-proxy?" + urlencode({"url": raw})
 
 
+def _sized_image_url(url: str | None, width: int) -> str | None:
+    raw = (url or "").strip()
+    if not raw or not VARIANTS_AVAILABLE:
+        return _proxied_image_url(raw)
+    if _is_proxyable_image_url(raw):
+        return "/image-proxy?" + urlencode({"url": raw, "w": width})
+    prefix = (current_app.config.get("UPLOAD_URL_PREFIX") or "/uploads") + "/"
+    if raw.startswith((prefix, "/static/uploads/")) and "?" not in raw:
+        return f"{raw}?w={width}"
+    return raw
+
+
+def _image_srcset(url: str | None) -> str:
+    raw = (url or "").strip()
+    if not raw or _sized_image_url(raw, VARIANT_WIDTHS[0]) == _proxied_image_url(raw):
+        return ""
+    return ", ".join(f"{_sized_image_url(raw, w)} {w}w" for w in VARIANT_WIDTHS)
+
+
 @app.app_context_processor
 def inject_image_proxy_helpers():
-    return {"proxied_image_url": _proxied_image_url}
+    return {
+        "proxied_image_url": _proxied_image_url,
+        "sized_image_url": _sized_image_url,
+        "image_srcset": _image_srcset,
+    }
 
 
 # Browse page (list all ratings)
@@ -178,35 +228,27 @@ def browse():
     raw_order = (request.args.get("order") or "recent").strip().lower()
     active_order = raw_order if raw_order in {"recent", "oldest"} else "recent"
 
-    page, per_page, offset = _parse_pagination()
-    limit = per_page + 1
+    page, per_page, offset, start_after, end_before = _parse_keyset_pagination()
+    query_kwargs = {
+        "limit": per_page + 1,
+        "offset": offset,
+        "order": active_order,
+        "start_after": start_after,
+        "end_before": end_before,
+    }
 
     if active_type == "songs":
-        raw_ratings = get_ratings_by_type(
-            "Song",
-            limit=limit,
-            offset=offset,
-            order=active_order,
-        )
+        raw_ratings = get_ratings_by_type("Song", **query_kwargs)
     elif active_type == "albums":
-        raw_ratings = get_ratings_by_type(
-            "Album",
-            limit=limit,
-            offset=offset,
-            order=active_order,
-        )
+        raw_ratings = get_ratings_by_type("Album", **query_kwargs)
     elif active_type == "artists":
-        raw_ratings = get_ratings_by_type(
-            "Artist",
-            limit=limit,
-            offset=offset,
-            order=active_order,
-        )
+        raw_ratings = get_ratings_by_type("Artist", **query_kwargs)
     else:
-        raw_ratings = get_ratings(limit=limit, offset=offset, order=active_order)
+        raw_ratings = get_ratings(**query_kwargs)
 
-    has_next = len(raw_ratings) > per_page
-    ratings = raw_ratings[:per_page]
+    ratings, has_prev, has_next = _keyset_slice(
+        raw_ratings, per_page, page=page, end_before=end_before
+    )
 
     owner_pics = _get_owner_pics_for_ratings(ratings)
     reactions_map = _build_subject_rating_emojis_map(ratings)
@@ -225,6 +267,8 @@ def browse():
             per_page=per_page,
             has_next=has_next,
             item_count=len(ratings),
+            keys=[r[0] for r in ratings],
+            has_prev=has_prev,
         ),
     )
 
@@ -244,6 +288,7 @@ def search():
     if active_tab not in allowed_tabs:
         active_tab = "all"
 
+    # Results are ranked by relevance, not by a key, so search pages by offset.
     page, per_page, offset = _parse_pagination()
     limit = per_page + 1
 
@@ -420,15 +465,18 @@ def alert_go(alert_id: int):
 @app.route("/alerts")
 @login_required
 def alerts_page():
-    page, per_page, offset = _parse_pagination()
+    page, per_page, offset, start_after, end_before = _parse_keyset_pagination()
     raw_alerts = get_alerts_for_user(
         current_user.id,
         limit=per_page + 1,
         include_read=True,
         offset=offset,
+        start_after=start_after,
+        end_before=end_before,
+    )
+    alerts, has_prev, has_next = _keyset_slice(
+        raw_alerts, per_page, page=page, end_before=end_before
     )
-    has_next = len(raw_alerts) > per_page
-    alerts = raw_alerts[:per_page]
 
     for a in alerts:
         a["time_ago"] = _format_time_ago(a.get("created_at") or "")
@@ -443,6 +491,8 @@ def alerts_page():
             per_page=per_page,
             has_next=has_next,
             item_count=len(alerts),
+            keys=[a["alert_id"] for a in alerts],
+            has_prev=has_prev,
         ),
     )
 
@@ -477,6 +527,93 @@ def delete_alert(alert_id: int):
     return redirect(dest)
 
 
+@app.route("/api/sidebar/sig", methods=["GET"])
+@login_required
+def sidebar_sig_api():
+    sig = get_sidebar_sig(current_user.id)
+    resp = jsonify({"ok": True, **sidebar_sig_payload(sig)})
+    resp.set_etag(sidebar_etag(sig))
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
+
+@app.route("/api/sidebar/since", methods=["GET"])
+@login_required
+def sidebar_since_api():
+    def _after(key: str) -> int:
+        try:
+            return max(0, int(request.args.get(key) or 0))
+        except (TypeError, ValueError):
+            return 0
+
+    updates = get_sidebar_updates(
+        current_user.id,
+        alert_after=_after("alert_after"),
+        bulletin_after=_after("bulletin_after"),
+        activity_after=_after("activity_after"),
+    )
+    next_path = _safe_internal_url(request.args.get("next") or "", "/")
+    updates["html"] = {
+        "alerts": render_template("_sidebar_alert_items.html", next_path=next_path),
+        "bulletins": render_template(
+            "_sidebar_bulletin_items.html", next_path=next_path
+        ),
+        "activities": render_template("_sidebar_activity_items.html"),
+    }
+    resp = jsonify({"ok": True, **updates})
+    resp.headers["Cache-Control"] = "private, no-store"
+    return resp
+
+
+@app.route("/api/sidebar/stream", methods=["GET"])
+@login_required
+def sidebar_stream_api():
+    user_id = int(current_user.id)
+    q = event_broker.subscribe(user_id)
+    if q is None:
+        resp = jsonify({"ok": False, "error": "Too many live connections."})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "60"
+        return resp
+
+    resp = Response(stream_events(user_id, q), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    # Covers clients that disconnect before the body generator ever starts.
+    resp.call_on_close(lambda: event_broker.unsubscribe(user_id, q))
+    return resp
+
+
+@app.route("/api/sidebar/cache-stats", methods=["GET"])
+@login_required
+def sidebar_cache_stats_api():
+    return jsonify({"ok": True, "stats": get_sidebar_cache_stats()})
+
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_api():
+    # Operational counters for whoever runs the site, not for users: only
+    # served when METRICS_TOKEN is set, to requests bearing that token.
+    token = current_app.config.get("METRICS_TOKEN") or ""
+    auth = request.headers.get("Authorization") or ""
+    if not token or not hmac.compare_digest(auth, f"Bearer {token}"):
+        return ("", 404)
+    return jsonify(
+        {
+            "ok": True,
+            "sidebar_cache": get_sidebar_cache_stats(),
+            "streams": event_broker.stats(),
+            "activity_writer": get_activity_writer_stats(),
+            "autocomplete": autocomplete_index.stats(),
+            "musicbrainz": get_mb_cache_stats(),
+            "rate_limits": rate_limiter.stats(),
+            "http": get_http_stats(),
+            "artwork": artwork_queue.stats(),
+            "image_cache": image_cache.stats(),
+        }
+    )
+
+
 @app.route("/playlists")
 def playlists():
     if not current_user.is_authenticated:
@@ -773,10 +910,35 @@ def charts_subjects_api():
         limit = 10
     limit = max(1, min(50, limit))
 
-    items = search_rated_subjects(kind=kind, q=q, artist=artist, limit=limit)
+    items = autocomplete_index.lookup(kind, q, artist=artist, limit=limit)
+    if items is None:
+        items = search_rated_subjects(kind=kind, q=q, artist=artist, limit=limit)
     return jsonify({"ok": True, "kind": kind, "items": items})
 
 
+@app.route("/api/autocomplete", methods=["GET"])
+def autocomplete_api():
+    raw_kind = (request.args.get("kind") or "all").strip().lower()
+    kinds = AUTOCOMPLETE_KINDS if raw_kind == "all" else [raw_kind]
+    if raw_kind != "all" and raw_kind not in AUTOCOMPLETE_KINDS:
+        return jsonify({"ok": False, "error": "Unknown kind."}), 400
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = int((request.args.get("limit") or "10").strip())
+    except ValueError:
+        limit = 10
+    limit = max(1, min(50, limit))
+
+    items = []
+    for kind in kinds:
+        found = autocomplete_index.lookup(kind, q, limit=limit)
+        if found is None:
+            return jsonify({"ok": False, "error": "Autocomplete is warming up."}), 503
+        items.extend(found)
+    items.sort(key=lambda item: -item["rating_count"])
+    return jsonify({"ok": True, "q": q, "items": items[:limit]})
+
+
 @app.route("/api/charts/top", methods=["GET"])
 def charts_top_api():
     raw_kind = (request.args.get("kind") or "song").strip().lower()
@@ -955,7 +1117,7 @@ def activity():
     if active_tab not in allowed_tabs:
         active_tab = "all"
 
-    page, per_page, offset = _parse_pagination()
+    page, per_page, offset, start_after, end_before = _parse_keyset_pagination()
     limit = per_page + 1
 
     raw_items = get_activity_feed_for_user(
@@ -963,10 +1125,13 @@ def activity():
         limit=limit,
         category=None if active_tab == "all" else active_tab,
         offset=offset,
+        start_after=start_after,
+        end_before=end_before,
     )
 
-    has_next = len(raw_items) > per_page
-    raw_items = raw_items[:per_page]
+    raw_items, has_prev, has_next = _keyset_slice(
+        raw_items, per_page, page=page, end_before=end_before
+    )
 
     def _format_activity(item: dict) -> dict:
         actor = item.get("actor_username") or ""
@@ -1112,6 +1277,8 @@ def activity():
             per_page=per_page,
             has_next=has_next,
             item_count=len(items),
+            keys=[i["activity_id"] for i in raw_items],
+            has_prev=has_prev,
         ),
     )
 
@@ -1231,14 +1398,17 @@ def logout():
 @login_required
 def bulletin():
     if request.method == "GET":
-        page, per_page, offset = _parse_pagination()
+        page, per_page, offset, start_after, end_before = _parse_keyset_pagination()
         raw_items = get_bulletin_feed_for_user(
             current_user.id,
             limit=per_page + 1,
             offset=offset,
+            start_after=start_after,
+            end_before=end_before,
+        )
+        items, has_prev, has_next = _keyset_slice(
+            raw_items, per_page, page=page, end_before=end_before
         )
-        has_next = len(raw_items) > per_page
-        items = raw_items[:per_page]
 
         for p in items:
             p["time_ago"] = _format_time_ago(p.get("created_at") or "")
@@ -1253,6 +1423,8 @@ def bulletin():
                 per_page=per_page,
                 has_next=has_next,
                 item_count=len(items),
+                keys=[p["bulletin_key"] for p in items],
+                has_prev=has_prev,
             ),
         )
 
@@ -1291,22 +1463,12 @@ def bulletin():
         post_type=post_type,
     )
 
-    try:
-        followers = get_followers(int(current_user.id), limit=2000, offset=0) or []
-    except Exception:
-        followers = []
-    for f in followers:
-        try:
-            follower_id = int((f or {}).get("user_id"))
-        except (TypeError, ValueError):
-            continue
-        if follower_id == int(current_user.id):
-            continue
-        create_alert(
-            follower_id,
-            f"@{current_user.username} posted to the bulletin",
-            url=f"/bulletin/{int(bulletin_key)}" if bulletin_key else "/bulletin",
-        )
+    background.submit(
+        create_alerts_for_followers,
+        int(current_user.id),
+        f"@{current_user.username} posted to the bulletin",
+        url=f"/bulletin/{int(bulletin_key)}" if bulletin_key else "/bulletin",
+    )
     add_activity(
         current_user.id,
         current_user.username,
@@ -1449,6 +1611,16 @@ def rating_detail(rating_key):
     )
 
 
+@app.route("/rating/<int:rating_key>/artwork", methods=["GET"])
+def rating_artwork_status(rating_key: int):
+    status = get_artwork_status(rating_key)
+    if status is None:
+        return jsonify({"ok": False, "error": "Rating not found"}), 404
+    if status["status"] == "pending":
+        artwork_queue.start()
+    return jsonify({"ok": True, "rating_key": rating_key, **status})
+
+
 @app.route("/rating/<int:rating_key>/also-rated")
 def rating_also_rated(rating_key: int):
     rating = get_rating_by_key(rating_key)
@@ -1911,11 +2083,10 @@ def add_rating_comment_route(rating_key: int):
         created_at=created_at,
     )
 
-    owner_username = get_rating_owner(rating_key)
-    owner_user = get_user_by_username(owner_username) if owner_username else None
-    if owner_user and owner_user.id != current_user.id:
+    owner_id = get_rating_owner_id(rating_key)
+    if owner_id and owner_id != int(current_user.id):
         create_alert(
-            owner_user.id,
+            owner_id,
             f"{current_user.username} commented on your rating",
             f"/rating/{rating_key}#comments",
             created_at,
@@ -2098,32 +2269,7 @@ def add():
                 flash("Unsupported image file type.", "error")
                 return redirect("/add")
 
-            upload_root = Path(current_app.config.get("UPLOAD_FOLDER"))
-            ratings_folder = upload_root / "ratings"
-            ratings_folder.mkdir(parents=True, exist_ok=True)
-
-            ext = uploaded_image.filename.rsplit(".", 1)[1].lower()
-            unique = uuid.uuid4().hex
-            base = secure_filename(rating_name) or "rating"
-            filename = secure_filename(
-                f"rating_{current_user.id}_{unique}_{base}.{ext}"
-            )
-            save_path = ratings_folder / filename
-            uploaded_image.save(str(save_path))
-
-            url_prefix = (
-                current_app.config.get("UPLOAD_URL_PREFIX") or "/uploads"
-            ).rstrip("/")
-            rating_image_url = f"{url_prefix}/ratings/{filename}"
-
-        if not rating_image_url and mbid:
-            rt = (rating_type or "").strip().lower()
-            if rt == "album":
-                rating_image_url = _cover_art_url_for_release_group(mbid) or None
-            elif rt == "song":
-                rating_image_url = _cover_art_url_for_recording(mbid) or None
-            elif rt == "artist":
-                rating_image_url = _artist_image_url(mbid) or None
+            rating_image_url = _save_upload(uploaded_image)
 
         if rating_type:
             rating_key = add_rating(
@@ -2147,7 +2293,10 @@ def add():
                 content_artist or None,
                 extra_link or None,
                 extra_info or None,
+                user_id=int(current_user.id),
             )
+            if rating_key and not rating_image_url and mbid:
+                artwork_queue.enqueue(rating_key, rating_type, mbid)
             category = _category_from_rating_type(rating_type)
             add_activity(
                 current_user.id,
@@ -2266,7 +2415,7 @@ def _render_profile(profile_user):
     if profile_user.profile_pic and not _pic_exists(profile_user.profile_pic):
         profile_user.profile_pic = None
     comments = _build_profile_comments(profile_user.id)
-    profile_ratings = get_ratings_by_user(profile_user.username)
+    profile_ratings = get_ratings_by_user(profile_user.id)
     profile_percent_map = _build_percent_map(profile_ratings)
     favorite_ratings = get_liked_ratings_for_user(profile_user.id, limit=60)
     favorite_percent_map = _build_percent_map(favorite_ratings)
@@ -2383,7 +2532,7 @@ def user_ratings_page(username: str):
 
     page, per_page, offset = _parse_pagination()
     raw_ratings = get_ratings_by_user_paginated(
-        profile_user.username, limit=per_page + 1, offset=offset
+        profile_user.id, limit=per_page + 1, offset=offset
     )
     has_next = len(raw_ratings) > per_page
     ratings = raw_ratings[:per_page]
@@ -2531,17 +2680,7 @@ def upload_profile_pic():
         flash("Unsupported file type.", "profile")
         return redirect("/profile-edit")
 
-    upload_folder = Path(current_app.config.get("UPLOAD_FOLDER"))
-    upload_folder.mkdir(parents=True, exist_ok=True)
-
-    ext = file.filename.rsplit(".", 1)[1].lower()
-    filename = secure_filename(f"user_{current_user.id}.{ext}")
-    save_path = upload_folder / filename
-    file.save(str(save_path))
-
-    url_prefix = (current_app.config.get("UPLOAD_URL_PREFIX") or "/uploads").rstrip("/")
-    rel_path = f"{url_prefix}/{filename}"
-    update_profile_pic(current_user.id, rel_path)
+    update_profile_pic(current_user.id, _save_upload(file))
     add_activity(
         current_user.id,
         current_user.username,
@@ -2678,8 +2817,8 @@ def edit_profile_comment(comment_id):
 @app.route("/edit/<int:rating_key>", methods=["GET", "POST"])
 @login_required
 def edit(rating_key):
-    owner = get_rating_owner(rating_key)
-    if not owner or owner != current_user.username:
+    owner_id = get_rating_owner_id(rating_key)
+    if not owner_id or owner_id != int(current_user.id):
         flash("You can only edit your own ratings.", "error")
         return redirect("/browse")
     rating = get_rating_by_key(rating_key)
@@ -2737,31 +2876,7 @@ def edit(rating_key):
                 flash("Unsupported image file type.", "error")
                 return redirect(f"/edit/{rating_key}")
 
-            upload_root = Path(current_app.config.get("UPLOAD_FOLDER"))
-            ratings_folder = upload_root / "ratings"
-            ratings_folder.mkdir(parents=True, exist_ok=True)
-
-            ext = uploaded_image.filename.rsplit(".", 1)[1].lower()
-            unique = uuid.uuid4().hex
-            base = secure_filename(rating_name) or "rating"
-            filename = secure_filename(
-                f"rating_{current_user.id}_{unique}_{base}.{ext}"
-            )
-            save_path = ratings_folder / filename
-            uploaded_image.save(str(save_path))
-            url_prefix = (
-                current_app.config.get("UPLOAD_URL_PREFIX") or "/uploads"
-            ).rstrip("/")
-            rating_image_url = f"{url_prefix}/ratings/{filename}"
-
-        if not rating_image_url and mbid:
-            rt = (rating_type or "").strip().lower()
-            if rt == "album":
-                rating_image_url = _cover_art_url_for_release_group(mbid) or None
-            elif rt == "song":
-                rating_image_url = _cover_art_url_for_recording(mbid) or None
-            elif rt == "artist":
-                rating_image_url = _artist_image_url(mbid) or None
+            rating_image_url = _save_upload(uploaded_image)
 
         def _to_int(v):
             try:
@@ -2817,6 +2932,18 @@ def edit(rating_key):
                 extra_link,
                 extra_info,
             )
+            if any(
+                [
+                    rating_type != current_rating_type,
+                    (mbid or None) != (current_mbid or None),
+                    (rating_image_url or None) != (current_image_url or None),
+                ]
+            ):
+                # Anything queued for the old values is stale now.
+                if rating_image_url or not artwork_queue.enqueue(
+                    rating_key, rating_type, mbid or ""
+                ):
+                    artwork_queue.cancel(rating_key)
             category = _category_from_rating_type(rating_type)
             add_activity(
                 current_user.id,
@@ -2842,8 +2969,8 @@ def edit(rating_key):
 @app.route("/delete/<int:rating_key>", methods=["POST"])
 @login_required
 def delete(rating_key):
-    owner = get_rating_owner(rating_key)
-    if not owner or owner != current_user.username:
+    owner_id = get_rating_owner_id(rating_key)
+    if not owner_id or owner_id != int(current_user.id):
         flash("You can only delete your own ratings.", "error")
         return redirect("/browse")
     rating = get_rating_by_key(rating_key)
@@ -2883,15 +3010,6 @@ def _category_from_rating_type(rating_type: str) -> str:
 # MusicBrainz
 ###############################################
 
-_MB_LAST_CALL_AT: float = 0.0
-_MB_THROTTLE_LOCK = threading.Lock()
-
-_CAA_LAST_CALL_AT: float = 0.0
-_CAA_THROTTLE_LOCK = threading.Lock()
-
-_WIKIDATA_LAST_CALL_AT: float = 0.0
-_WIKIDATA_THROTTLE_LOCK = threading.Lock()
-
 
 def _musicbrainz_user_agent() -> str:
     return (
@@ -2900,42 +3018,6 @@ def _musicbrainz_user_agent() -> str:
     ).strip()
 
 
-def _mb_throttle() -> None:
-    # MusicBrainz rate limits
-    global _MB_LAST_CALL_AT
-    with _MB_THROTTLE_LOCK:
-        try:
-            min_interval = float(
-                os.environ.get("MUSICBRAINZ_MIN_INTERVAL_SECONDS") or "1.0"
-            )
-        except ValueError:
-            min_interval = 1.0
-        min_interval = max(0.2, min(10.0, min_interval))
-        now = time.time()
-        wait = (_MB_LAST_CALL_AT + min_interval) - now
-        if wait > 0:
-            time.sleep(min(wait, min_interval + 0.25))
-        _MB_LAST_CALL_AT = time.time()
-
-
-def _caa_throttle() -> None:
-    # Throttle for Cover Art Archive requests.
-    global _CAA_LAST_CALL_AT
-    with _CAA_THROTTLE_LOCK:
-        try:
-            min_interval = float(
-                os.environ.get("COVERART_MIN_INTERVAL_SECONDS") or "1.0"
-            )
-        except ValueError:
-            min_interval = 1.0
-        min_interval = max(0.2, min(10.0, min_interval))
-        now = time.time()
-        wait = (_CAA_LAST_CALL_AT + min_interval) - now
-        if wait > 0:
-            time.sleep(min(wait, min_interval + 0.25))
-        _CAA_LAST_CALL_AT = time.time()
-
-
 @app.route("/image-proxy")
 def image_proxy():
     raw_url = (request.args.get("url") or "").strip()
@@ -2953,74 +3035,90 @@ def image_proxy():
         )
     )
 
-    host = (parsed.netloc or "").split(":", 1)[0].strip().lower()
     headers = {
         "User-Agent": _musicbrainz_user_agent(),
         "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
     }
 
-    try:
-        if host == "coverartarchive.org":
-            _caa_throttle()
-        resp = requests.get(safe_url, headers=headers, timeout=20)
-    except requests.RequestException:
-        return ("", 502)
+    width = variant_width(request.args.get("w"), request.headers.get("Accept"))
+    entry = image_cache.lookup(safe_url, headers=headers)
+    if entry is None:
+        try:
+            entry, status = image_cache.stream(safe_url, headers=headers, timeout=20)
+        except UpstreamRateLimited:
+            return ("", 503)
+        except requests.RequestException:
+            return ("", 502)
+        if entry is None:
+            return ("", status)
+        if width is None:
+            out = Response(
+                entry["chunks"],
+                status=200,
+                content_type=entry["content_type"],
+                direct_passthrough=True,
+            )
+            if entry["content_length"] is not None:
+                out.content_length = entry["content_length"]
+            out.headers["Cache-Control"] = (
+                entry.get("cache_control") or "public, max-age=86400"
+            )
+            return vary_on_width(out)
+        # A variant is made from the whole original, so let the tee store it.
+        for _ in entry["chunks"]:
+            pass
+        entry = image_cache.lookup(safe_url, headers=headers)
+        if entry is None:
+            return vary_on_width(
+                redirect("/image-proxy?" + urlencode({"url": raw_url}))
+            )
 
-    if resp.status_code != 200:
-        return ("", resp.status_code)
+    if width is not None:
+        out = variant_response(Path(entry["path"]), f"proxy:{entry['digest']}", width)
+        if out is not None:
+            return out
+    out = send_file(
+        entry["path"],
+        mimetype=entry["content_type"],
+        conditional=True,
+        etag=entry["digest"],
+        last_modified=entry["stored_at"],
+    )
+    out.headers["Cache-Control"] = entry.get("cache_control") or "public, max-age=86400"
+    return vary_on_width(out)
 
-    content_type = (resp.headers.get("Content-Type") or "application/octet-stream").strip()
-    out = Response(resp.content, status=200, content_type=content_type)
-    cache_control = resp.headers.get("Cache-Control")
-    if cache_control:
-        out.headers["Cache-Control"] = cache_control
-    else:
-        out.headers["Cache-Control"] = "public, max-age=86400"
-    etag = resp.headers.get("ETag")
-    if etag:
-        out.headers["ETag"] = etag
-    last_modified = resp.headers.get("Last-Modified")
-    if last_modified:
-        out.headers["Last-Modified"] = last_modified
-    return out
 
+class ArtworkUnavailable(Exception):
+    """Upstream failed in a way worth retrying (network error, 429 or 5xx)."""
 
-def _wikidata_throttle() -> None:
-    # Throttle for Wikidata requests.
-    global _WIKIDATA_LAST_CALL_AT
-    with _WIKIDATA_THROTTLE_LOCK:
-        try:
-            min_interval = float(
-                os.environ.get("WIKIDATA_MIN_INTERVAL_SECONDS") or "1.0"
-            )
-        except ValueError:
-            min_interval = 1.0
-        min_interval = max(0.2, min(10.0, min_interval))
-        now = time.time()
-        wait = (_WIKIDATA_LAST_CALL_AT + min_interval) - now
-        if wait > 0:
-            time.sleep(min(wait, min_interval + 0.25))
-        _WIKIDATA_LAST_CALL_AT = time.time()
 
+def _fetch_json(
+    url: str, *, params: dict[str, Any] | None = None, strict: bool = False
+) -> dict[str, Any] | None:
+    """Decoded JSON body of a 200 answer, else None.
 
-def _cover_art_url_for_release_group(release_group_mbid: str) -> str | None:
-    mbid = (release_group_mbid or "").strip()
-    if not mbid:
-        return None
-    url = f"https://coverartarchive.org/release-group/{mbid}"
+    With strict, transient failures raise ArtworkUnavailable instead of
+    looking like "no artwork".
+    """
     headers = {"Accept": "application/json", "User-Agent": _musicbrainz_user_agent()}
     try:
-        _caa_throttle()
-        resp = requests.get(url, headers=headers, timeout=8)
-    except requests.RequestException:
+        resp = http_get(url, params=params, headers=headers)
+    except requests.RequestException as exc:
+        if strict:
+            raise ArtworkUnavailable(f"{type(exc).__name__}: {exc}") from exc
         return None
     if resp.status_code != 200:
+        if strict and (resp.status_code == 429 or resp.status_code >= 500):
+            raise ArtworkUnavailable(f"{url} answered {resp.status_code}")
         return None
     try:
-        data = resp.json()
+        return resp.json()
     except ValueError:
         return None
-    images = data.get("images") or []
+
+
+def _front_cover_url(data: dict[str, Any] | None) -> str | None:
+    images = (data or {}).get("images") or []
     if not images:
         return None
     preferred = None
@@ -3041,66 +3139,36 @@ def _cover_art_url_for_release_group(release_group_mbid: str) -> str | None:
     )
 
 
-def _cover_art_url_for_release(release_mbid: str) -> str | None:
+def _cover_art_url_for_release_group(
+    release_group_mbid: str, *, strict: bool = False
+) -> str | None:
+    mbid = (release_group_mbid or "").strip()
+    if not mbid:
+        return None
+    url = f"https://coverartarchive.org/release-group/{mbid}"
+    return _front_cover_url(_fetch_json(url, strict=strict))
+
+
+def _cover_art_url_for_release(
+    release_mbid: str, *, strict: bool = False
+) -> str | None:
     mbid = (release_mbid or "").strip()
     if not mbid:
         return None
     url = f"https://coverartarchive.org/release/{mbid}"
-    headers = {"Accept": "application/json", "User-Agent": _musicbrainz_user_agent()}
-    try:
-        _caa_throttle()
-        resp = requests.get(url, headers=headers, timeout=8)
-    except requests.RequestException:
-        return None
-    if resp.status_code != 200:
-        return None
-    try:
-        data = resp.json()
-    except ValueError:
-        return None
-    images = data.get("images") or []
-    if not images:
-        return None
-    preferred = None
-    for img in images:
-        if img.get("front"):
-            preferred = img
-            break
-    preferred = preferred or images[0]
-    thumbs = preferred.get("thumbnails") or {}
-    return (
-        thumbs.get("1200")
-        or thumbs.get("500")
-        or thumbs.get("250")
-        or thumbs.get("large")
-        or thumbs.get("small")
-        or preferred.get("image")
-        or None
-    )
+    return _front_cover_url(_fetch_json(url, strict=strict))
 
 
-def _cover_art_url_for_recording(recording_mbid: str) -> str | None:
+def _cover_art_url_for_recording(
+    recording_mbid: str, *, strict: bool = False
+) -> str | None:
     mbid = (recording_mbid or "").strip()
     if not mbid:
         return None
 
     url = f"https://musicbrainz.org/ws/2/recording/{mbid}"
-    headers = {"User-Agent": _musicbrainz_user_agent(), "Accept": "application/json"}
-    try:
-        _mb_throttle()
-        resp = requests.get(
-            url, params={"fmt": "json", "inc": "releases"}, headers=headers, timeout=12
-        )
-    except requests.RequestException:
-        return None
-    if resp.status_code != 200:
-        return None
-    try:
-        data = resp.json()
-    except ValueError:
-        return None
-
-    releases = data.get("releases") or []
+    data = _fetch_json(url, params={"fmt": "json", "inc": "releases"}, strict=strict)
+    releases = (data or {}).get("releases") or []
     if not releases:
         return None
 
@@ -3109,27 +3177,10 @@ def _cover_art_url_for_recording(recording_mbid: str) -> str | None:
         if not rid:
             return None
         url = f"https://musicbrainz.org/ws/2/release/{rid}"
-        headers = {
-            "User-Agent": _musicbrainz_user_agent(),
-            "Accept": "application/json",
-        }
-        try:
-            _mb_throttle()
-            resp = requests.get(
-                url,
-                params={"fmt": "json", "inc": "release-groups"},
-                headers=headers,
-                timeout=12,
-            )
-        except requests.RequestException:
-            return None
-        if resp.status_code != 200:
-            return None
-        try:
-            data = resp.json()
-        except ValueError:
-            return None
-        rg = data.get("release-group") or {}
+        data = _fetch_json(
+            url, params={"fmt": "json", "inc": "release-groups"}, strict=strict
+        )
+        rg = (data or {}).get("release-group") or {}
         rgid = (rg.get("id") or "").strip()
         return rgid or None
 
@@ -3137,39 +3188,26 @@ def _cover_art_url_for_recording(recording_mbid: str) -> str | None:
         release_id = (rel.get("id") or "").strip()
         if not release_id:
             continue
-        cover = _cover_art_url_for_release(release_id)
+        cover = _cover_art_url_for_release(release_id, strict=strict)
         if cover:
             return cover
         rgid = _release_group_id_for_release(release_id)
         if rgid:
-            cover = _cover_art_url_for_release_group(rgid)
+            cover = _cover_art_url_for_release_group(rgid, strict=strict)
             if cover:
                 return cover
 
     return None
 
 
-def _wikidata_qid_from_artist(mbid: str) -> str | None:
+def _wikidata_qid_from_artist(mbid: str, *, strict: bool = False) -> str | None:
     mbid = (mbid or "").strip()
     if not mbid:
         return None
     url = f"https://musicbrainz.org/ws/2/artist/{mbid}"
-    headers = {"User-Agent": _musicbrainz_user_agent(), "Accept": "application/json"}
-    try:
-        _mb_throttle()
-        resp = requests.get(
-            url, params={"fmt": "json", "inc": "url-rels"}, headers=headers, timeout=12
-        )
-    except requests.RequestException:
-        return None
-    if resp.status_code != 200:
-        return None
-    try:
-        data = resp.json()
-    except ValueError:
-        return None
+    data = _fetch_json(url, params={"fmt": "json", "inc": "url-rels"}, strict=strict)
 
-    rels = data.get("relations") or []
+    rels = (data or {}).get("relations") or []
     for rel in rels:
         u = (rel.get("url") or {}).get("resource") or ""
         u = u.strip()
@@ -3180,26 +3218,15 @@ def _wikidata_qid_from_artist(mbid: str) -> str | None:
     return None
 
 
-def _artist_image_url(artist_mbid: str) -> str | None:
-    qid = _wikidata_qid_from_artist(artist_mbid)
+def _artist_image_url(artist_mbid: str, *, strict: bool = False) -> str | None:
+    qid = _wikidata_qid_from_artist(artist_mbid, strict=strict)
     if not qid:
         return None
 
     url = f"https://www.wikidata.org/wiki/Special:EntityData/{qid}.json"
-    headers = {"Accept": "application/json", "User-Agent": _musicbrainz_user_agent()}
-    try:
-        _wikidata_throttle()
-        resp = requests.get(url, headers=headers, timeout=10)
-    except requests.RequestException:
-        return None
-    if resp.status_code != 200:
-        return None
-    try:
-        data = resp.json()
-    except ValueError:
-        return None
+    data = _fetch_json(url, strict=strict)
 
-    entity = (data.get("entities") or {}).get(qid) or {}
+    entity = ((data or {}).get("entities") or {}).get(qid) or {}
     claims = entity.get("claims") or {}
     p18 = claims.get("P18") or []
     if not p18:
@@ -3221,6 +3248,21 @@ def _artist_image_url(artist_mbid: str) -> str | None:
     return f"https://commons.wikimedia.org/wiki/Special:FilePath/{safe}?width={width}"
 
 
+def _resolve_rating_artwork(rating_type: str, mbid: str) -> str | None:
+    """Artwork URL for an MBID by rating type; resolver for the artwork queue."""
+    rt = (rating_type or "").strip().lower()
+    if rt == "album":
+        return _cover_art_url_for_release_group(mbid, strict=True)
+    if rt == "song":
+        return _cover_art_url_for_recording(mbid, strict=True)
+    if rt == "artist":
+        return _artist_image_url(mbid, strict=True)
+    return None
+
+
+artwork_queue.set_resolver(_resolve_rating_artwork)
+
+
 def _cached_artist_image_url(
     *, artist_name: str, artist_mbid: str | None
 ) -> str | None:
@@ -3382,11 +3424,17 @@ def _mb_search(
             "limit": int(limit),
             "offset": int(offset),
         }
-        _mb_throttle()
-        resp = requests.get(url, params=params, headers=headers, timeout=12)
-        if resp.status_code >= 400:
+
+        def _fetch(params=params):
+            resp = http_get(url, params=params, headers=headers)
+            if resp.status_code >= 400:
+                return resp.status_code, None
+            return resp.status_code, resp.json()
+
+        status, result = cached_mb_get(endpoint, params, _fetch)
+        if status >= 400 or result is None:
             continue
-        data = resp.json()
+        data = result
         raw_items = data.get(key) or []
         total_count = int(data.get("count") or 0)
         if raw_items:
@@ -3486,7 +3534,7 @@ def musicbrainz_search_api():
     try:
         items, count = _mb_search(kind, q, limit=limit, offset=0, artist=artist)
         return jsonify({"ok": True, "kind": kind, "count": count, "items": items})
-    except requests.RequestException:
+    except (requests.RequestException, TimeoutError):
         return jsonify({"ok": False, "error": "Something went wrong. Try again."}), 502
     except ValueError:
         return jsonify({"ok": False, "error": "Something went wrong. Try again."}), 502
@@ -3717,6 +3765,17 @@ def _allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# Stores an uploaded image in the content-addressed store; returns its URL.
+def _save_upload(file) -> str:
+    rel_path = store_upload(
+        file.stream,
+        file.filename.rsplit(".", 1)[1],
+        current_app.config.get("UPLOAD_FOLDER"),
+    )
+    url_prefix = (current_app.config.get("UPLOAD_URL_PREFIX") or "/uploads").rstrip("/")
+    return f"{url_prefix}/{rel_path}"
+
+
 #  checks if an image file exists
 def _pic_exists(rel_path: str) -> bool:
     if not rel_path:
@@ -3881,6 +3940,50 @@ def _parse_pagination(
     return page, per_page, offset
 
 
+def _encode_cursor(key: int) -> str:
+    return base64.urlsafe_b64encode(f"k{int(key)}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(raw: str | None) -> int | None:
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    try:
+        text = base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)).decode()
+        return int(text[1:]) if text.startswith("k") else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _parse_keyset_pagination(**kwargs) -> tuple[int, int, int, int | None, int | None]:
+    """_parse_pagination() plus the ?after= / ?before= cursors.
+
+    Returns (page, per_page, offset, start_after, end_before). A valid cursor
+    replaces the offset; plain ?page=N links keep working without one.
+    """
+    page, per_page, offset = _parse_pagination(**kwargs)
+    end_before = _decode_cursor(request.args.get("before"))
+    start_after = (
+        None if end_before is not None else _decode_cursor(request.args.get("after"))
+    )
+    if start_after is not None or end_before is not None:
+        offset = 0
+    return page, per_page, offset, start_after, end_before
+
+
+def _keyset_slice(
+    raw_items: list, per_page: int, *, page: int, end_before: int | None
+) -> tuple[list, bool, bool]:
+    """Trim a per_page + 1 fetch to one page: (items, has_prev, has_next).
+
+    A backwards page is read nearest-first, so its extra row is the first one.
+    """
+    if end_before is not None:
+        has_prev = len(raw_items) > per_page
+        return raw_items[-per_page:], has_prev, True
+    return raw_items[:per_page], page > 1, len(raw_items) > per_page
+
+
 def _pagination_context(
     *,
     page: int,
@@ -3889,22 +3992,49 @@ def _pagination_context(
     item_count: int,
     min_items_to_show: int = 5,
     options: list[int] | None = None,
+    keys: list[int] | None = None,
+    has_prev: bool | None = None,
 ):
+    """Pager state for _pagination.html.
+
+    With keys (the page's primary keys in listing order) prev/next link to
+    ?before= / ?after= cursors; without them they fall back to ?page=N.
+    """
     args = request.args.to_dict(flat=True)
+    for name in ("after", "before"):
+        args.pop(name, None)
 
     if options is None:
         options = [5, 10, 20, 30, 50, 100]
+    if has_prev is None:
+        has_prev = page > 1
+    elif not has_prev:
+        page = 1
 
-    def _url_for_page(target_page: int) -> str:
+    def _url_for_page(target_page: int, cursor: dict[str, str] | None = None) -> str:
         next_args = dict(args)
         next_args["page"] = str(target_page)
         next_args["per_page"] = str(per_page)
+        if cursor and target_page > 1:
+            next_args.update(cursor)
         qs = urlencode(next_args)
         return f"{request.path}?{qs}" if qs else request.path
 
     other_args = [(k, v) for k, v in args.items() if k not in {"page", "per_page"}]
-    prev_url = _url_for_page(page - 1) if page > 1 else None
-    next_url = _url_for_page(page + 1) if has_next else None
+    if keys:
+        prev_url = (
+            _url_for_page(page - 1, {"before": _encode_cursor(keys[0])})
+            if has_prev
+            else None
+        )
+        next_url = (
+            _url_for_page(page + 1, {"after": _encode_cursor(keys[-1])})
+            if has_next
+            else None
+        )
+    else:
+        prev_url = _url_for_page(page - 1) if has_prev else None
+        next_url = _url_for_page(page + 1) if has_next else None
 
     show = bool(prev_url or next_url or (item_count > min_items_to_show))
 
@@ -0,0 +1,27 @@
+import os
+
+# Parsing for the tuning knobs read from the environment at import time.
+#
+# A missing, empty or malformed value falls back to the default, and numbers
+# are clamped to [lo, hi], so a bad setting never stops the app from booting.
+
+
+def env_number(key: str, default: float, lo: float, hi: float) -> float:
+    try:
+        value = float((os.environ.get(key) or str(default)).strip())
+    except ValueError:
+        value = default
+    return max(lo, min(hi, value))
+
+
+def env_int(key: str, default: int, lo: int, hi: int) -> int:
+    try:
+        value = int((os.environ.get(key) or str(default)).strip())
+    except ValueError:
+        value = default
+    return max(lo, min(hi, value))
+
+
+def env_choice(key: str, default: str, allowed: set[str]) -> str:
+    value = (os.environ.get(key) or default).strip().upper()
+    return value if value in allowed else default
@@ -0,0 +1,324 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from flask import g
+from flask_login import current_user
+
+from backend.database import (
+    get_sidebar_items_since,
+    get_sidebar_sig_for_user,
+    get_sidebar_state_for_user,
+)
+from backend.settings import env_number
+
+# Sidebar panels (alerts, bulletin, activity) rendered by base.html.
+#
+# Every render_template call runs the context processors, including partial
+# and JSON-fragment renders, so the state is loaded once per request and kept
+# on flask.g.
+#
+# Across requests, each user's panel lists are cached in-process together with
+# the sidebar signature they were read under. A request first runs the cheap
+# signature query; the list queries only run again when it changes or the
+# entry is older than SIDEBAR_CACHE_TTL_SECONDS. Time-ago labels are derived
+# per request, so cached entries never show stale relative times.
+
+SIDEBAR_ITEM_LIMIT = 5
+
+
+SIDEBAR_CACHE_TTL_SECONDS = env_number("SIDEBAR_CACHE_TTL_SECONDS", 30.0, 0.0, 3600.0)
+SIDEBAR_CACHE_MAX_ENTRIES = int(
+    env_number("SIDEBAR_CACHE_MAX_ENTRIES", 2048, 0, 1_000_000)
+)
+# How often base.html asks /api/sidebar/sig whether anything changed; 0 disables.
+SIDEBAR_POLL_SECONDS = env_number("SIDEBAR_POLL_SECONDS", 15.0, 0.0, 3600.0)
+
+_EMPTY_STATE: dict[str, Any] = {
+    "sidebar_sig": "",
+    "alerts": [],
+    "unread_alert_count": 0,
+    "bulletins": [],
+    "bulletin_count": 0,
+    "activities": [],
+    "activity_count": 0,
+}
+
+_cache_lock = threading.Lock()
+# user_id -> (sig, raw state, loaded_at monotonic)
+_cache: dict[int, tuple[tuple[int, ...], dict[str, Any], float]] = {}
+_cache_stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+
+def get_sidebar_state() -> dict[str, Any]:
+    if not current_user.is_authenticated:
+        return dict(_EMPTY_STATE)
+
+    state = g.get("_sidebar_state")
+    if state is None:
+        state = load_sidebar_state(current_user.id)
+        g._sidebar_state = state
+    return state
+
+
+def load_sidebar_state(user_id: int) -> dict[str, Any]:
+    return _present(_cached_raw_state(int(user_id)))
+
+
+def sidebar_etag(sig: tuple[int, ...]) -> str:
+    return ".".join(str(int(v)) for v in sig)
+
+
+def sidebar_sig_payload(sig: tuple[int, ...]) -> dict[str, Any]:
+    return {
+        "sig": sidebar_etag(sig),
+        "alerts": {"count": sig[0], "max_id": sig[1], "unread_count": sig[2]},
+        "bulletin": {"count": sig[4], "max_id": sig[5]},
+        "activity": {"count": sig[6], "max_id": sig[7]},
+    }
+
+
+def get_sidebar_sig(user_id: int) -> tuple[int, ...]:
+    return get_sidebar_sig_for_user(int(user_id))
+
+
+def get_sidebar_updates(
+    user_id: int,
+    *,
+    alert_after: int = 0,
+    bulletin_after: int = 0,
+    activity_after: int = 0,
+) -> dict[str, Any]:
+    raw = get_sidebar_items_since(
+        int(user_id),
+        alert_after=alert_after,
+        bulletin_after=bulletin_after,
+        activity_after=activity_after,
+        limit=SIDEBAR_ITEM_LIMIT,
+    )
+    return {
+        **sidebar_sig_payload(raw["sig"]),
+        "new": {
+            "alerts": _with_time_ago(raw["alerts"]),
+            "bulletins": _with_time_ago(raw["bulletins"]),
+            "activities": [_format_activity(i) for i in raw["activities"]],
+        },
+    }
+
+
+def get_sidebar_cache_stats() -> dict[str, Any]:
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["entries"] = len(_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["ttl_seconds"] = SIDEBAR_CACHE_TTL_SECONDS
+    stats["max_entries"] = SIDEBAR_CACHE_MAX_ENTRIES
+    return stats
+
+
+def _cached_raw_state(user_id: int) -> dict[str, Any]:
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+
+    if entry is not None:
+        sig, raw, loaded_at = entry
+        if now - loaded_at <= SIDEBAR_CACHE_TTL_SECONDS:
+            if get_sidebar_sig_for_user(user_id) == sig:
+                with _cache_lock:
+                    _cache_stats["hits"] += 1
+                return raw
+        else:
+            with _cache_lock:
+                _cache_stats["stale"] += 1
+
+    raw = get_sidebar_state_for_user(user_id, limit=SIDEBAR_ITEM_LIMIT)
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+        if SIDEBAR_CACHE_MAX_ENTRIES:
+            _cache.pop(user_id, None)
+            while len(_cache) >= SIDEBAR_CACHE_MAX_ENTRIES:
+                _cache.pop(next(iter(_cache)))
+                _cache_stats["evictions"] += 1
+            _cache[user_id] = (raw["sig"], raw, now)
+    return raw
+
+
+def _present(raw: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "sidebar_sig": sidebar_etag(raw["sig"]),
+        "alerts": _with_time_ago(raw["alerts"]),
+        "unread_alert_count": raw["unread_alert_count"],
+        "bulletins": _with_time_ago(raw["bulletins"]),
+        "bulletin_count": raw["bulletin_count"],
+        "activities": [_format_activity(i) for i in raw["activities"]],
+        "activity_count": raw["activity_count"],
+    }
+
+
+def _with_time_ago(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    # Cached dicts are shared between requests; hand out copies.
+    return [
+        dict(item, time_ago=_format_time_ago(item.get("created_at") or ""))
+        for item in items
+    ]
+
+
+def _format_time_ago(iso_timestamp: str) -> str:
+    if not iso_timestamp:
+        return "just now"
+    try:
+        parsed = datetime.fromisoformat(iso_timestamp)
+    except ValueError:
+        return "just now"
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    delta = now - parsed
+    seconds = max(0, int(delta.total_seconds()))
+    if seconds < 60:
+        return "just now"
+    minutes = seconds // 60
+    if minutes < 60:
+        return f"{minutes} min"
+    hours = minutes // 60
+    if hours < 24:
+        unit = "hr" if hours == 1 else "hrs"
+        return f"{hours} {unit}"
+    days = hours // 24
+    if days < 7:
+        unit = "day" if days == 1 else "days"
+        return f"{days} {unit}"
+    weeks = days // 7
+    if weeks < 5:
+        unit = "wk" if weeks == 1 else "wks"
+        return f"{weeks} {unit}"
+    months = days // 30
+    if months < 12:
+        unit = "mo" if months == 1 else "mos"
+        return f"{months} {unit}"
+    years = days // 365
+    unit = "yr" if years == 1 else "yrs"
+    return f"{years} {unit}"
+
+
+def _format_activity(item: dict) -> dict:
+    actor = item.get("actor_username") or ""
+    action = item.get("action") or ""
+    entity_label = item.get("entity_label") or ""
+    url = item.get("url") or ""
+    metadata = item.get("metadata") or {}
+
+    if action == "follow":
+        text = f"@{actor} followed {entity_label or 'a user'}"
+    elif action == "unfollow":
+        text = f"@{actor} unfollowed {entity_label or 'a user'}"
+    elif action == "rating_create":
+        text = (
+            f"@{actor} created a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} created a rating"
+        )
+    elif action == "rating_edit":
+        text = (
+            f"@{actor} edited a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} edited a rating"
+        )
+    elif action == "rating_delete":
+        text = (
+            f"@{actor} deleted a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} deleted a rating"
+        )
+    elif action == "rating_view":
+        text = (
+            f"@{actor} viewed a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} viewed a rating"
+        )
+    elif action == "rating_like":
+        text = (
+            f"@{actor} liked a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} liked a rating"
+        )
+    elif action == "rating_unlike":
+        text = (
+            f"@{actor} unliked a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} unliked a rating"
+        )
+    elif action == "rating_reaction":
+        text = (
+            f"@{actor} reacted to a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} reacted to a rating"
+        )
+    elif action == "rating_category_upvote":
+        detail = (metadata.get("detail") or "").strip() or "a category"
+        text = (
+            f"@{actor} upvoted {detail} on a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} upvoted {detail} on a rating"
+        )
+    elif action == "rating_category_downvote":
+        detail = (metadata.get("detail") or "").strip() or "a category"
+        text = (
+            f"@{actor} downvoted {detail} on a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} downvoted {detail} on a rating"
+        )
+    elif action == "rating_category_unvote":
+        detail = (metadata.get("detail") or "").strip() or "a category"
+        text = (
+            f"@{actor} removed their vote on {detail} for a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} removed their vote on {detail} for a rating"
+        )
+    elif action == "rating_comment_add":
+        text = (
+            f"@{actor} commented on a rating: {entity_label}"
+            if entity_label
+            else f"@{actor} commented on a rating"
+        )
+    elif action == "rating_comment_edit":
+        text = (
+            f"@{actor} edited a rating comment: {entity_label}"
+            if entity_label
+            else f"@{actor} edited a rating comment"
+        )
+    elif action == "rating_comment_delete":
+        text = (
+            f"@{actor} deleted a rating comment: {entity_label}"
+            if entity_label
+            else f"@{actor} deleted a rating comment"
+        )
+    elif action == "playlist_favorite":
+        text = (
+            f"@{actor} favorited a playlist: {entity_label}"
+            if entity_label
+            else f"@{actor} favorited a playlist"
+        )
+    elif action == "playlist_unfavorite":
+        text = (
+            f"@{actor} unfavorited a playlist: {entity_label}"
+            if entity_label
+            else f"@{actor} unfavorited a playlist"
+        )
+    elif action == "bulletin_post":
+        text = f"@{actor} posted to the bulletin"
+    elif action == "profile_comment_add":
+        text = f"@{actor} commented on {entity_label or 'a profile'}"
+    elif action == "profile_comment_edit":
+        text = f"@{actor} edited a comment on {entity_label or 'a profile'}"
+    elif action == "profile_comment_delete":
+        text = f"@{actor} deleted a comment on {entity_label or 'a profile'}"
+    elif action == "profile_update":
+        text = f"@{actor} updated their profile"
+    else:
+        text = f"@{actor}: {action} {entity_label}".strip()
+
+    return {"text": text, "url": url, "action": action}
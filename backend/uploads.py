@@ -0,0 +1,115 @@
+import hashlib
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, BinaryIO
+
+# Content-addressed store for user uploads (profile pictures and rating
+# images).
+#
+# An upload is hashed while it is copied to a temporary file, then renamed
+# to store/<aa>/<bb>/<sha256>.<ext> under UPLOAD_FOLDER. Identical files
+# uploaded by anyone share one copy. Because a store URL names its content,
+# it never changes and is served with an immutable one-year Cache-Control and
+# the hash as a strong ETag.
+#
+# Nothing is deleted when a row stops pointing at a file. `flask gc-uploads`
+# removes store files, and the older rating_*/user_* uploads, that no
+# user_info.profile_pic or ratings.image_url references. Files younger than
+# the grace period are kept, because an upload is written before the row
+# that points at it.
+
+STORE_DIR = "store"
+IMMUTABLE_MAX_AGE_SECONDS = 31536000
+
+_CHUNK_BYTES = 64 * 1024
+_EXTENSIONS = {"jpeg": "jpg"}
+_STORE_NAME = re.compile(r"^store/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$")
+_LEGACY_NAME = re.compile(r"^(?:ratings/rating_[^/]+|user_[^/]+)$")
+
+
+def store_upload(stream: BinaryIO, ext: str, upload_root: str | Path) -> str:
+    """Save stream under its content hash; returns the path below upload_root."""
+    ext = (ext or "").strip().lower().lstrip(".")
+    ext = _EXTENSIONS.get(ext, ext)
+    tmp_dir = Path(upload_root) / STORE_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f"{os.getpid()}-{time.monotonic_ns()}.part"
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = stream.read(_CHUNK_BYTES)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+        digest = hasher.hexdigest()
+        rel_path = f"{STORE_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+        final = Path(upload_root) / rel_path
+        try:
+            # Same content already stored; renew it for the GC grace period.
+            os.utime(final)
+        except FileNotFoundError:
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, final)
+        return rel_path
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def store_digest(filename: str) -> str | None:
+    """The content hash of a store path (relative to UPLOAD_FOLDER), else None."""
+    match = _STORE_NAME.match(filename or "")
+    return match.group(1) if match else None
+
+
+def upload_path_from_url(url: str | None, url_prefix: str) -> str | None:
+    """The path below UPLOAD_FOLDER that an upload URL points at, else None."""
+    raw = (url or "").strip().split("?", 1)[0]
+    for prefix in (url_prefix.rstrip("/") + "/", "/static/uploads/"):
+        if raw.startswith(prefix):
+            return raw[len(prefix) :] or None
+    return None
+
+
+def collect_garbage(
+    upload_root: str | Path,
+    referenced: set[str],
+    *,
+    grace_seconds: float = 86400.0,
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    """Delete unreferenced uploads; `referenced` holds paths below upload_root."""
+    root = Path(upload_root)
+    cutoff = time.time() - grace_seconds
+    report = {"scanned": 0, "kept": 0, "deleted": 0, "bytes": 0}
+    candidates = [p for p in (root / STORE_DIR).glob("*/*/*") if p.is_file()]
+    candidates += [p for p in root.glob("user_*") if p.is_file()]
+    candidates += [p for p in (root / "ratings").glob("rating_*") if p.is_file()]
+    for path in candidates:
+        rel = path.relative_to(root).as_posix()
+        if not (store_digest(rel) or _LEGACY_NAME.match(rel)):
+            continue
+        report["scanned"] += 1
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if rel in referenced or st.st_mtime > cutoff:
+            report["kept"] += 1
+            continue
+        if not dry_run:
+            path.unlink(missing_ok=True)
+        report["deleted"] += 1
+        report["bytes"] += st.st_size
+    if not dry_run:
+        # Left behind by uploads that died mid-copy.
+        for path in (root / STORE_DIR / "tmp").glob("*.part"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                continue
+    return report